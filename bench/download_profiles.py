@@ -0,0 +1,160 @@
+"""Perfis de download do yt-dlp contra um servidor local.
+
+Sobe um aiohttp em 127.0.0.1 com:
+- um HLS de muitos segmentos pequenos, cada requisição com latência fixa
+  (o caso de sites de live/VOD segmentado);
+- um arquivo progressivo grande cuja conexão fica lenta depois de alguns MB
+  (o throttle por conexão de sites como o YouTube).
+Baixa cada um com o yt-dlp de verdade, sem ajuste (como antes) e com o perfil
+que download_profiles escolhe, e mostra a vazão. Por fim, três downloads
+simultâneos (dois usuários) sob um limite de banda total, para ver a divisão.
+
+    python -m bench.download_profiles [--segments 120] [--latency-ms 40] [--size-mb 40]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import shutil
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+from bot.services import bandwidth, download_profiles, ytdlp_service
+from bot.services.executor import ThreadBackend
+
+MB = 1024 * 1024
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _app(args) -> web.Application:
+    segment = b"\x47" * (args.segment_kb * 1024)
+    blob = b"\0" * (args.size_mb * MB)
+    fast = args.throttle_after_mb * MB
+    slow_bps = args.throttled_mbps * MB
+
+    async def playlist(_request: web.Request) -> web.Response:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(args.segments):
+            lines += ["#EXTINF:2.0,", f"seg{i}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return web.Response(text="\n".join(lines) + "\n", content_type="application/vnd.apple.mpegurl")
+
+    async def seg(_request: web.Request) -> web.Response:
+        await asyncio.sleep(args.latency_ms / 1000)
+        return web.Response(body=segment, content_type="video/mp2t")
+
+    async def big(request: web.Request) -> web.StreamResponse:
+        # Range: bytes=a-b; cada conexão tem os primeiros MB rápidos e o resto lento
+        start, end = 0, len(blob) - 1
+        rng = request.headers.get("Range", "")
+        if rng.startswith("bytes="):
+            a, _, b = rng[6:].partition("-")
+            start, end = int(a or 0), min(end, int(b) if b else end)
+        resp = web.StreamResponse(status=206 if rng else 200, headers={
+            "Content-Type": "video/mp4",
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(end - start + 1),
+            "Content-Range": f"bytes {start}-{end}/{len(blob)}",
+        })
+        await resp.prepare(request)
+        sent, step = 0, 256 * 1024
+        pos = start
+        try:
+            while pos <= end:
+                n = min(step, end - pos + 1)
+                await resp.write(blob[pos:pos + n])
+                pos += n
+                sent += n
+                if sent > fast:
+                    await asyncio.sleep(n / slow_bps)
+            await resp.write_eof()
+        except ConnectionError:
+            # O yt-dlp fecha a conexão ao sondar o tamanho
+            pass
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/hls/index.m3u8", playlist)
+    app.router.add_get("/hls/{name}", seg)
+    app.router.add_get("/big.mp4", big)
+    return app
+
+def _download(url: str, tuning: dict, rate_limit=lambda: None, progress=lambda d: None) -> float:
+    out = Path(tempfile.mkdtemp(prefix="ytbot-prof-"))
+    try:
+        t0 = time.perf_counter()
+        path = ytdlp_service._download_sync(
+            url, "best", out, None, None, tuning, lambda: False, progress, rate_limit,
+        )
+        size = path.stat().st_size
+        return size / MB / (time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+def _shaped(url: str, tuning: dict, _cancel_check, progress_cb, rate_limit) -> float:
+    # Assinatura de run_job: fn(*args, cancel_check, progress_cb, rate_limit)
+    return _download(url, tuning, rate_limit, progress_cb)
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--segments", type=int, default=120)
+    ap.add_argument("--segment-kb", type=int, default=128)
+    ap.add_argument("--latency-ms", type=int, default=40)
+    ap.add_argument("--size-mb", type=int, default=40)
+    ap.add_argument("--throttle-after-mb", type=int, default=10)
+    ap.add_argument("--throttled-mbps", type=float, default=2.0, help="MB/s depois do throttle")
+    ap.add_argument("--bandwidth-mbs", type=float, default=6.0, help="limite total no teste de divisão (MB/s)")
+    args = ap.parse_args()
+
+    runner = web.AppRunner(_app(args), access_log=None)
+    await runner.setup()
+    port = _free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    base = f"http://127.0.0.1:{port}"
+    hls, big = f"{base}/hls/index.m3u8", f"{base}/big.mp4"
+
+    download_profiles.configure(fragments=8, chunk_mb=args.throttle_after_mb, large_mb=100)
+    cases = (
+        ("HLS", hls, download_profiles.choose_profile("m3u8_native", None)),
+        ("HTTP grande", big, download_profiles.choose_profile("https", 1000)),
+    )
+    print(f"{'caso':<12} {'perfil':<18} {'sem ajuste':>12} {'com perfil':>12}")
+    for label, url, profile in cases:
+        base_rate = await asyncio.to_thread(_download, url, {})
+        tuned = await asyncio.to_thread(_download, url, profile.opts())
+        print(f"{label:<12} {profile.name:<18} {base_rate:>9.1f}MB/s {tuned:>9.1f}MB/s  ({tuned / base_rate:.1f}x)")
+
+    # Divisão de banda: usuário 1 com dois jobs, usuário 2 com um. Esperado
+    # max-min: metade para cada usuário, e a do usuário 1 em dois
+    budget = bandwidth.BandwidthBudget(args.bandwidth_mbs * MB, 0)
+    executor = ThreadBackend(3)
+    profile = download_profiles.choose_profile("https", 1).opts()
+    profile["http_chunk_size"] = ytdlp_service.SHAPED_CHUNK_BYTES
+    rates: dict[str, float] = {}
+
+    async def job(job_id: str, user_id: int) -> None:
+        budget.register(job_id, user_id)
+        try:
+            rates[job_id] = await executor.run_job(
+                _shaped, (big, profile), lambda: False,
+                lambda d: budget.observe(job_id, d.get("speed")), lambda: budget.share(job_id),
+            )
+        finally:
+            budget.release(job_id)
+
+    jobs = (("u1-a", 1), ("u1-b", 1), ("u2", 2))
+    await asyncio.gather(*(job(j, u) for j, u in jobs))
+    print(f"\nlimite {args.bandwidth_mbs:.1f}MB/s, 2 usuários (u1 com 2 jobs):")
+    for job_id, _ in jobs:
+        print(f"  {job_id:<5} {rates[job_id]:>5.2f}MB/s (média, sobra de quem termina antes é redistribuída)")
+    executor.shutdown()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
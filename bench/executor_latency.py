@@ -0,0 +1,82 @@
+"""Latência do event loop com jobs pesados em cada YTDLP_EXECUTOR.
+
+Simula o que o yt-dlp faz num download: Python puro segurando o GIL e
+chamando o hook de progresso com frequência. Enquanto os jobs rodam, um
+ticker mede quanto cada sleep(10ms) do loop atrasa. Os dois modos entregam
+o progresso com o mesmo limite (executor.throttle_progress), então a coluna
+"progresso" deve ser parecida e a diferença de atraso é do backend.
+
+    python -m bench.executor_latency [--jobs 4] [--seconds 3]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import statistics
+import time
+
+from bot.services.executor import create_executor
+
+TICK = 0.01
+
+def _busy_job(seconds: float, cancel_check, progress_cb, _rate_limit) -> int:
+    # CPU puro, com hook de progresso como o do yt-dlp (~a cada 1 ms)
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        for _ in range(2000):
+            n = (n * 31 + 7) % 1_000_003
+        if cancel_check():
+            break
+        progress_cb({"status": "downloading", "_percent_str": f"{n % 100}%"})
+    return n
+
+async def _measure(kind: str, jobs: int, seconds: float) -> dict:
+    ex = create_executor(kind, jobs)
+    # Sobe os processos antes de medir (no bot isso acontece no startup)
+    await asyncio.gather(*(ex.run(time.sleep, 0.2) for _ in range(jobs)))
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append((time.perf_counter() - t0 - TICK) * 1000)
+
+    updates = 0
+
+    def on_progress(_d: dict) -> None:
+        nonlocal updates
+        updates += 1
+
+    t = asyncio.create_task(ticker())
+    await asyncio.gather(*(
+        ex.run_job(_busy_job, (seconds,), lambda: False, on_progress) for _ in range(jobs)
+    ))
+    stop.set()
+    await t
+    ex.shutdown()
+
+    lags.sort()
+    return {
+        "p50": statistics.median(lags),
+        "p99": lags[int(len(lags) * 0.99) - 1],
+        "max": lags[-1],
+        "updates": updates,
+    }
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    args = ap.parse_args()
+
+    print(f"{args.jobs} jobs x {args.seconds}s — atraso do loop em ms")
+    print(f"{'modo':<8} {'p50':>8} {'p99':>8} {'max':>8} {'progresso':>10}")
+    for kind in ("thread", "process"):
+        r = await _measure(kind, args.jobs, args.seconds)
+        print(f"{kind:<8} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['max']:>8.2f} {r['updates']:>10}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
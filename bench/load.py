@@ -0,0 +1,327 @@
+"""Teste de carga do bot inteiro, offline.
+
+Sobe o bot real (bot.main: Dispatcher, on_text, cb_dl, worker_loop, fila,
+disco, progresso) apontando BOT_API_URL para uma Bot API falsa local, e
+troca a extração/download do yt-dlp por um fake com latência, vazão e
+tamanho configuráveis. Cada usuário simulado manda um link e clica na
+primeira opção do teclado.
+
+    python -m bench.load --users 20 --global-concurrency 4 --size-mb 8
+
+Relatório: jobs/s, p50/p99 do tempo até o primeiro byte do upload chegar ao
+"Telegram" (TTFB) e da latência ponta a ponta (mensagem -> arquivo
+recebido), atraso do event loop, pico de RSS e chamadas por método da API.
+A Bot API falsa roda em outra thread (com seu próprio loop) para não somar
+o custo dela ao atraso medido; o RSS é do processo inteiro.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import signal
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+TOKEN = "123456:LOADTEST"
+UPLOAD_METHODS = {"sendvideo", "sendaudio", "senddocument"}
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+# ---- Bot API falsa ----
+
+class FakeTelegram:
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.port = 0
+        self.updates: list[dict] = []
+        self.next_update = itertools.count(1)
+        self.next_message = itertools.count(1000)
+        self.new_update: asyncio.Event | None = None
+        self.calls: Counter[str] = Counter()
+        # chat_id -> momentos (perf_counter) de cada etapa
+        self.sent_at: dict[int, float] = {}
+        self.first_byte_at: dict[int, float] = {}
+        self.done_at: dict[int, float] = {}
+        self.expected = 0
+        self.all_done = threading.Event()
+        self._ready = threading.Event()
+
+    # -- thread do servidor --
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="fake-telegram", daemon=True).start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._serve())
+        self.loop.run_forever()
+
+    async def _serve(self) -> None:
+        self.new_update = asyncio.Event()
+        app = web.Application(client_max_size=2 * 1024 ** 3)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+    def push_update(self, update: dict) -> None:
+        # Chamado de qualquer thread
+        def add():
+            update["update_id"] = next(self.next_update)
+            self.updates.append(update)
+            self.new_update.set()
+
+        self.loop.call_soon_threadsafe(add)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int, message_id: int | None = None, **extra) -> dict:
+        return {
+            "message_id": message_id or next(self.next_message),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+            **extra,
+        }
+
+    def _maybe_click(self, chat_id: int, message: dict, markup: str | None) -> None:
+        # Usuário simulado: clica no primeiro formato oferecido
+        if not markup:
+            return
+        rows = json.loads(markup).get("inline_keyboard") or []
+        for row in rows:
+            for button in row:
+                data = button.get("callback_data") or ""
+                if data.startswith("dl|"):
+                    self.push_update({"callback_query": {
+                        "id": str(next(self.next_update)),
+                        "from": {"id": chat_id, "is_bot": False, "first_name": f"u{chat_id}"},
+                        "chat_instance": str(chat_id),
+                        "message": message,
+                        "data": data,
+                    }})
+                    return
+
+    async def handle(self, request: web.Request) -> web.Response:
+        t = time.perf_counter()
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        form = await request.post()
+
+        if method == "getupdates":
+            offset = int(form.get("offset") or 0)
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), timeout=float(form.get("timeout") or 0) or 0.5)
+                except asyncio.TimeoutError:
+                    pass
+            return self._ok(self.updates[:100])
+        if method == "getme":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "bot", "username": "loadtest_bot"})
+
+        chat_id = int(form.get("chat_id") or 0)
+        if method == "sendmessage":
+            msg = self._message(chat_id, text=form.get("text"))
+            self._maybe_click(chat_id, msg, form.get("reply_markup"))
+            return self._ok(msg)
+        if method == "editmessagetext":
+            msg = self._message(chat_id, int(form.get("message_id") or 0), text=form.get("text"))
+            self._maybe_click(chat_id, msg, form.get("reply_markup"))
+            return self._ok(msg)
+        if method in UPLOAD_METHODS:
+            # O handler roda ao chegarem os headers: t é o primeiro byte do upload
+            self.first_byte_at.setdefault(chat_id, t)
+            self.done_at[chat_id] = time.perf_counter()
+            if len(self.done_at) >= self.expected:
+                self.all_done.set()
+            media = {"file_id": f"F{chat_id}-{t}", "file_unique_id": f"U{chat_id}-{t}"}
+            if method == "sendvideo":
+                return self._ok(self._message(chat_id, video=media | {"width": 640, "height": 360, "duration": 60}))
+            if method == "sendaudio":
+                return self._ok(self._message(chat_id, audio=media | {"duration": 60}))
+            return self._ok(self._message(chat_id, document=media))
+        # answerCallbackQuery, deleteWebhook, ...
+        return self._ok(True)
+
+# ---- yt-dlp falso ----
+
+class FakeYtdlp:
+    # Substitui as funções síncronas do ytdlp_service: o resto (executor,
+    # hooks de progresso, cancelamento) é o código real
+    def __init__(self, extract_seconds: float, throughput_mbps: float, size_mb: float):
+        self.extract_seconds = extract_seconds
+        self.bytes_per_second = throughput_mbps * 1024 * 1024 / 8
+        self.size = int(size_mb * 1024 * 1024)
+
+    def install(self) -> None:
+        from bot.services import ytdlp_service
+        ytdlp_service._extract_info_sync = self.extract_info
+        ytdlp_service._download_sync = self.download
+
+    def extract_info(self, url: str, proxy, cookies_file, playlist_end=None) -> dict:
+        time.sleep(self.extract_seconds)
+        vid = url.rstrip("/").rsplit("/", 1)[-1]
+        return {
+            "id": vid,
+            "title": f"Vídeo {vid}",
+            "extractor_key": "Fake",
+            "duration": 60,
+            "formats": [{
+                "format_id": "18", "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a",
+                "height": 360, "filesize": self.size, "protocol": "https",
+            }],
+        }
+
+    def download(
+        self, url, format_id, out_dir: Path, proxy, cookies_file, tuning, cancel_check, progress_cb, rate_limit,
+    ) -> Path:
+        from bot.services.ytdlp_service import DownloadCancelled
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{url.rstrip('/').rsplit('/', 1)[-1]}.mp4"
+        chunk = 256 * 1024
+        block = b"\0" * chunk
+        written = 0
+        t0 = time.monotonic()
+        with open(path, "wb") as fh:
+            while written < self.size:
+                n = min(chunk, self.size - written)
+                fh.write(block[:n])
+                written += n
+                if cancel_check():
+                    raise DownloadCancelled("cancelled")
+                progress_cb({
+                    "status": "downloading",
+                    "filename": str(path),
+                    "downloaded_bytes": written,
+                    "total_bytes": self.size,
+                    "speed": written / max(1e-6, time.monotonic() - t0),
+                    "_percent_str": f"{100 * written / self.size:.1f}%",
+                    "_speed_str": f"{written / max(1e-6, time.monotonic() - t0) / 1024 / 1024:.1f}MiB/s",
+                    "_eta_str": "",
+                })
+                # Limite de banda do job (USER_BANDWIDTH_MBPS etc.), como o ratelimit do yt-dlp
+                rate = rate_limit()
+                time.sleep(n / min(self.bytes_per_second, rate or self.bytes_per_second))
+        progress_cb({"status": "finished", "filename": str(path)})
+        return path
+
+# ---- execução ----
+
+async def run(args) -> None:
+    tg = FakeTelegram()
+    tg.expected = args.users
+    tg.start()
+
+    data_dir = tempfile.mkdtemp(prefix="ytbot-load-")
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "BOT_API_URL": f"http://127.0.0.1:{tg.port}",
+        "DATA_DIR": data_dir,
+        "ALLOWLIST": "",
+        "MAX_UPLOAD_MB": "49",
+        "JOB_STORE": "memory",
+        "INFO_CACHE_PERSIST": "0",
+        "METRICS_PORT": "0",
+        "YTDLP_EXECUTOR": "thread",
+        "YTDLP_POOL_SIZE": str(args.global_concurrency + 2),
+        "GLOBAL_CONCURRENCY": str(args.global_concurrency),
+        "PER_USER_CONCURRENCY": "1",
+        "PROGRESS_INTERVAL_SECONDS": str(args.progress_interval),
+        "TEMP_TTL_SECONDS": str(args.temp_ttl),
+        "PIPELINE_UPLOAD": "1" if args.pipeline else "0",
+        "DISK_MIN_FREE_MB": "0",
+    })
+    FakeYtdlp(args.extract_ms / 1000, args.throughput_mbps, args.size_mb).install()
+
+    from bot import main as bot_main
+
+    lags: list[float] = []
+
+    async def ticker():
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - t0 - 0.01) * 1000)
+
+    bot_task = asyncio.create_task(bot_main.main())
+    lag_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.5)
+
+    start = time.perf_counter()
+    for i in range(args.users):
+        chat_id = 10_000 + i
+        tg.sent_at[chat_id] = time.perf_counter()
+        tg.push_update({"message": {
+            "message_id": i + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"u{chat_id}"},
+            "text": f"https://example.com/v/{i}",
+        }})
+        if args.arrival_rate:
+            await asyncio.sleep(1 / args.arrival_rate)
+
+    finished = await asyncio.to_thread(tg.all_done.wait, args.timeout)
+    wall = time.perf_counter() - start
+    # Deixa as últimas respostas/edições chegarem e para o bot pelo mesmo
+    # caminho de produção (SIGTERM -> stop_polling -> finally do main)
+    await asyncio.sleep(1)
+    lag_task.cancel()
+    signal.raise_signal(signal.SIGTERM)
+    await asyncio.gather(bot_task, lag_task, return_exceptions=True)
+
+    done = [c for c in tg.sent_at if c in tg.done_at]
+    ttfb = [(tg.first_byte_at[c] - tg.sent_at[c]) * 1000 for c in done]
+    e2e = [(tg.done_at[c] - tg.sent_at[c]) * 1000 for c in done]
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"jobs: {len(done)}/{args.users}{'' if finished else ' (timeout)'} em {wall:.1f}s"
+          f" -> {len(done) / wall:.2f} jobs/s")
+    print(f"TTFB ms:        p50 {_pct(ttfb, 0.5):8.0f}  p99 {_pct(ttfb, 0.99):8.0f}")
+    print(f"ponta a ponta:  p50 {_pct(e2e, 0.5):8.0f}  p99 {_pct(e2e, 0.99):8.0f}")
+    print(f"lag do loop ms: p50 {statistics.median(lags) if lags else 0:8.2f}"
+          f"  p99 {_pct(lags, 0.99):8.2f}  max {max(lags, default=0):8.2f}")
+    print(f"pico de RSS:    {rss_mb:.0f} MB")
+    print("chamadas à API: " + ", ".join(f"{m}={n}" for m, n in tg.calls.most_common()))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--arrival-rate", type=float, default=0, help="usuários/s (0 = todos de uma vez)")
+    ap.add_argument("--global-concurrency", type=int, default=2)
+    ap.add_argument("--progress-interval", type=float, default=2.0)
+    ap.add_argument("--temp-ttl", type=int, default=300)
+    ap.add_argument("--pipeline", action="store_true")
+    ap.add_argument("--extract-ms", type=float, default=300)
+    ap.add_argument("--throughput-mbps", type=float, default=80)
+    ap.add_argument("--size-mb", type=float, default=8)
+    ap.add_argument("--timeout", type=float, default=600)
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Pool de proxies contra proxies falsos locais.
+
+Sobe quatro proxies HTTP de mentira em 127.0.0.1 (rápido, lento, instável
+com 50% de 502, e um morto sem ninguém escutando) e roda extrações pelo
+ytdlp_service com o yt-dlp trocado por um GET pelo proxy escolhido. Compara
+com um rodízio simples (sem sondas, notas nem nova tentativa).
+
+    python -m bench.proxy_pool [--jobs 200] [--parallel 8]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import socket
+import statistics
+import time
+import urllib.request
+from collections import Counter
+
+from aiohttp import web
+
+from bot.services import proxy_pool, ytdlp_service
+
+TARGET = "http://fixture.invalid/watch"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _start_proxy(delay: float, fail_rate: float) -> str:
+    # Responde direto qualquer requisição (é o que o cliente vê de um proxy)
+    async def handle(_request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return web.Response(status=502)
+        return web.Response(status=200, text="ok")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = _free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return f"http://127.0.0.1:{port}"
+
+def _fetch(url: str, proxy: str | None) -> None:
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({"http": proxy} if proxy else {}))
+    with opener.open(url, timeout=5) as resp:
+        resp.read()
+
+def _fake_extract(url: str, proxy: str | None, cookies_file, playlist_end) -> dict:
+    _fetch(url, proxy)
+    return {"id": "x", "title": "x", "extractor_key": "Generic"}
+
+async def _run(label: str, jobs: int, parallel: int, extract) -> None:
+    sem = asyncio.Semaphore(parallel)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await extract()
+                latencies.append((time.perf_counter() - t0) * 1000)
+            except Exception:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(jobs)))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] if latencies else 0
+    print(
+        f"{label:<10} ok {len(latencies):>4}/{jobs}  falhas {errors:>3}  "
+        f"p50 {statistics.median(latencies) if latencies else 0:>6.0f}ms  p99 {p99:>6.0f}ms  {jobs / wall:>6.1f} jobs/s"
+    )
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=200)
+    ap.add_argument("--parallel", type=int, default=8)
+    args = ap.parse_args()
+
+    proxies = {
+        "rápido": await _start_proxy(0.02, 0.0),
+        "lento": await _start_proxy(0.3, 0.0),
+        "instável": await _start_proxy(0.02, 0.5),
+        "morto": f"http://127.0.0.1:{_free_port()}",
+    }
+    names = {url: name for name, url in proxies.items()}
+    ytdlp_service.configure("thread", args.parallel + 2)
+    ytdlp_service._extract_info_sync = _fake_extract
+
+    # Rodízio simples: um proxy por vez, sem nota nem nova tentativa
+    rr = iter(list(proxies.values()) * args.jobs)
+    used_rr: Counter = Counter()
+
+    async def naive() -> None:
+        proxy = next(rr)
+        used_rr[names[proxy]] += 1
+        await asyncio.to_thread(_fetch, TARGET, proxy)
+
+    await _run("rodízio", args.jobs, args.parallel, naive)
+
+    pool = proxy_pool.configure(list(proxies.values()), probe_url=TARGET, probe_interval=1)
+    probes = asyncio.create_task(pool.run_health_checks())
+    await asyncio.sleep(0.5)
+    used: Counter = Counter()
+    pick = pool.pick
+
+    def counting_pick(exclude=()):
+        proxy = pick(exclude)
+        used[names.get(proxy, "direto")] += 1
+        return proxy
+
+    pool.pick = counting_pick
+    await _run("pool", args.jobs, args.parallel, lambda: ytdlp_service.extract_info(TARGET, None))
+    probes.cancel()
+    ytdlp_service.shutdown()
+
+    print("\ntentativas por proxy (rodízio | pool):")
+    for name in proxies:
+        print(f"  {name:<10} {used_rr[name]:>5} | {used[name]:>5}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""Ordem da fila: FIFO vs menor-primeiro com envelhecimento.
+
+Roda o QueueService de verdade com workers falsos (cada job "baixa" por um
+tempo proporcional ao tamanho) e chegadas aleatórias: a maioria dos pedidos
+é pequena (áudio, clipes) e alguns são vídeos perto do limite. FIFO é o
+mesmo QueueService com envelhecimento enorme (a ordem vira a de chegada).
+Também confere a previsão de início (positions) contra a espera real.
+
+    python -m bench.queue_sjf [--jobs 300] [--workers 4] [--load 0.95]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from bot.services.queue_service import DownloadJob, QueueService
+from bot.services.site_limiter import SiteLimiter
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def _run(label: str, args, aging: float, sizes: list[float], gaps: list[float]) -> None:
+    queue = QueueService(
+        args.workers, 1, limiter=SiteLimiter(start=1000, cap=1000), aging_mb_per_minute=aging, unknown_mb=50,
+    )
+    submitted: dict[str, float] = {}
+    predicted: dict[str, float] = {}
+    waits: dict[str, tuple[float, float]] = {}
+
+    async def worker() -> None:
+        while True:
+            job = await queue.get()
+            waits[job.job_id] = (job.filesize_mb, time.monotonic() - submitted[job.job_id])
+            await asyncio.sleep(job.filesize_mb * args.seconds_per_mb)
+            queue.set_state(job, "done")
+            await queue.task_done(job)
+
+    workers = [asyncio.create_task(worker()) for _ in range(args.workers)]
+    for i, (size, gap) in enumerate(zip(sizes, gaps)):
+        await asyncio.sleep(gap)
+        job = DownloadJob(
+            user_id=i, chat_id=i, message_id=i, url=f"https://example.com/{i}", format_id="18",
+            request_id=str(i), filesize_mb=size,
+        )
+        submitted[job.job_id] = time.monotonic()
+        await queue.put(job)
+        for j, _pos, eta in queue.positions():
+            if j.job_id == job.job_id and eta is not None:
+                predicted[job.job_id] = eta
+    while len(waits) < len(sizes):
+        await asyncio.sleep(0.05)
+    for w in workers:
+        w.cancel()
+
+    # Tudo em segundos "reais" (1 MB = real_seconds_per_mb)
+    scale = args.real_seconds_per_mb / args.seconds_per_mb
+    all_w = [w * scale for _, w in waits.values()]
+    small = [w * scale for s, w in waits.values() if s <= args.small_mb]
+    big = [w * scale for s, w in waits.values() if s > args.small_mb]
+    errors = [abs(predicted[k] - waits[k][1]) * scale for k in predicted]
+    print(
+        f"{label:<5} espera média {statistics.mean(all_w):>5.0f}s  p95 {_pct(all_w, 0.95):>5.0f}s | "
+        f"pequenos {statistics.mean(small):>5.0f}s | grandes {statistics.mean(big):>5.0f}s "
+        f"(máx {max(big):>5.0f}s) | erro mediano da previsão {statistics.median(errors) if errors else 0:>4.0f}s"
+    )
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=300)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--small-share", type=float, default=0.8, help="fração de jobs pequenos")
+    ap.add_argument("--small-mb", type=float, default=8)
+    ap.add_argument("--big-mb", type=float, default=45)
+    ap.add_argument("--real-seconds-per-mb", type=float, default=0.5, help="download + upload de 1 MB no bot")
+    ap.add_argument("--seconds-per-mb", type=float, default=0.005, help="o mesmo na simulação (acelerada)")
+    ap.add_argument("--load", type=float, default=0.95, help="utilização média dos workers")
+    ap.add_argument("--aging", type=float, default=10, help="QUEUE_AGING_MB_PER_MINUTE")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [
+        rng.uniform(1, args.small_mb) if rng.random() < args.small_share else rng.uniform(args.small_mb, args.big_mb)
+        for _ in range(args.jobs)
+    ]
+    mean_service = statistics.mean(sizes) * args.seconds_per_mb
+    gaps = [rng.expovariate(args.load * args.workers / mean_service) for _ in sizes]
+    # O envelhecimento é por minuto real: acelera junto com a simulação
+    scale = args.real_seconds_per_mb / args.seconds_per_mb
+    await _run("FIFO", args, 1e12, sizes, gaps)
+    await _run("SJF", args, args.aging * scale, sizes, gaps)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,5 @@
 import os
+import socket
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -14,6 +15,15 @@ def _csv_ints(value: str) -> set[int]:
             out.add(int(part))
     return out
 
+def _csv_limits(value: str) -> dict[str, int]:
+    # "youtube=3,vimeo=2" -> {"youtube": 3, "vimeo": 2}
+    out = {}
+    for part in value.split(","):
+        name, _, limit = part.partition("=")
+        if name.strip() and limit.strip():
+            out[name.strip().lower()] = int(limit)
+    return out
+
 @dataclass(frozen=True)
 class Settings:
     bot_token: str
@@ -23,24 +33,138 @@ class Settings:
     temp_ttl_seconds: int
     global_concurrency: int
     per_user_concurrency: int
+    site_start_concurrency: int
+    site_max_concurrency: int
+    site_limits: dict[str, int]
     force_document: bool
     http_proxy: str | None
+    proxy_list: str
+    proxy_file: str | None
+    proxy_probe_url: str
+    proxy_probe_interval_seconds: float
     ytdlp_cookies_file: str | None
+    ytdlp_executor: str
+    fragment_concurrency: int
+    http_chunk_mb: int
+    large_file_mb: float
+    download_bandwidth_mbps: float
+    user_bandwidth_mbps: float
+    ytdlp_pool_size: int
+    info_cache_ttl_seconds: int
+    info_cache_max_mb: int
+    info_cache_persist: bool
+    pending_ttl_seconds: int
+    pending_max_entries: int
+    pending_max_mb: int
+    batch_max_items: int
+    job_store: str
+    bot_role: str
+    redis_url: str | None
+    worker_id: str
+    lease_seconds: float
+    webhook_url: str | None
+    webhook_path: str
+    webhook_host: str
+    webhook_port: int
+    webhook_secret: str | None
+    pipeline_upload: bool
+    bot_api_url: str | None
+    bot_api_local: bool
+    bot_api_pool_size: int
+    bot_api_timeout_seconds: float
+    bot_api_keepalive_seconds: float
+    upload_timeout_seconds: float
+    upload_concurrency: int
+    split_large_files: bool
+    transcode_oversize: bool
+    transcode_concurrency: int
+    metrics_host: str
+    metrics_port: int
+    loop_lag_threshold_ms: float
+    io_threads: int
+    disk_quota_mb: int
+    disk_min_free_mb: int
+    disk_wait_seconds: int
+    sweep_interval_seconds: int
+    orphan_max_age_seconds: int
+    progress_interval_seconds: float
+    progress_edits_per_second: float
+    queue_aging_mb_per_minute: float
+    queue_status_interval_seconds: float
 
 def load_settings() -> Settings:
     token = os.getenv("BOT_TOKEN", "").strip()
     if not token:
         raise RuntimeError("BOT_TOKEN não definido no .env")
 
+    # Com Bot API server próprio o limite de upload sobe para 2 GB
+    bot_api_url = os.getenv("BOT_API_URL", "").strip() or None
+    default_max_mb = "1999" if bot_api_url else "49"
+
     return Settings(
         bot_token=token,
         data_dir=os.getenv("DATA_DIR", "/data").strip(),
         allowlist=_csv_ints(os.getenv("ALLOWLIST", "").strip()),
-        max_upload_mb=int(os.getenv("MAX_UPLOAD_MB", "49")),
+        max_upload_mb=int(os.getenv("MAX_UPLOAD_MB", "").strip() or default_max_mb),
         temp_ttl_seconds=int(os.getenv("TEMP_TTL_SECONDS", "300")),
         global_concurrency=int(os.getenv("GLOBAL_CONCURRENCY", "2")),
         per_user_concurrency=int(os.getenv("PER_USER_CONCURRENCY", "1")),
+        site_start_concurrency=int(os.getenv("SITE_START_CONCURRENCY", "2")),
+        site_max_concurrency=int(os.getenv("SITE_MAX_CONCURRENCY", "0")),
+        site_limits=_csv_limits(os.getenv("SITE_LIMITS", "").strip()),
         force_document=os.getenv("FORCE_DOCUMENT", "0").strip() == "1",
         http_proxy=os.getenv("HTTP_PROXY", "").strip() or None,
+        proxy_list=os.getenv("PROXY_LIST", "").strip(),
+        proxy_file=os.getenv("PROXY_FILE", "").strip() or None,
+        proxy_probe_url=os.getenv("PROXY_PROBE_URL", "https://www.gstatic.com/generate_204").strip(),
+        proxy_probe_interval_seconds=float(os.getenv("PROXY_PROBE_INTERVAL_SECONDS", "60")),
         ytdlp_cookies_file=os.getenv("YTDLP_COOKIES_FILE", "").strip() or None,
+        ytdlp_executor=os.getenv("YTDLP_EXECUTOR", "thread").strip().lower(),
+        fragment_concurrency=int(os.getenv("FRAGMENT_CONCURRENCY", "8")),
+        http_chunk_mb=int(os.getenv("HTTP_CHUNK_MB", "10")),
+        large_file_mb=float(os.getenv("LARGE_FILE_MB", "100")),
+        download_bandwidth_mbps=float(os.getenv("DOWNLOAD_BANDWIDTH_MBPS", "0")),
+        user_bandwidth_mbps=float(os.getenv("USER_BANDWIDTH_MBPS", "0")),
+        ytdlp_pool_size=int(os.getenv("YTDLP_POOL_SIZE", "4")),
+        info_cache_ttl_seconds=int(os.getenv("INFO_CACHE_TTL_SECONDS", "1800")),
+        info_cache_max_mb=int(os.getenv("INFO_CACHE_MAX_MB", "64")),
+        info_cache_persist=os.getenv("INFO_CACHE_PERSIST", "1").strip() == "1",
+        pending_ttl_seconds=int(os.getenv("PENDING_TTL_SECONDS", "600")),
+        pending_max_entries=int(os.getenv("PENDING_MAX_ENTRIES", "5000")),
+        pending_max_mb=int(os.getenv("PENDING_MAX_MB", "16")),
+        batch_max_items=int(os.getenv("BATCH_MAX_ITEMS", "50")),
+        job_store=os.getenv("JOB_STORE", "sqlite").strip().lower(),
+        bot_role=os.getenv("BOT_ROLE", "all").strip().lower(),
+        redis_url=os.getenv("REDIS_URL", "").strip() or None,
+        worker_id=os.getenv("WORKER_ID", "").strip() or f"{socket.gethostname()}-{os.getpid()}",
+        lease_seconds=float(os.getenv("LEASE_SECONDS", "60")),
+        webhook_url=os.getenv("WEBHOOK_URL", "").strip().rstrip("/") or None,
+        webhook_path=os.getenv("WEBHOOK_PATH", "/webhook").strip(),
+        webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0").strip(),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip() or None,
+        pipeline_upload=os.getenv("PIPELINE_UPLOAD", "0").strip() == "1",
+        bot_api_url=bot_api_url,
+        bot_api_local=bool(bot_api_url) and os.getenv("BOT_API_LOCAL", "0").strip() == "1",
+        bot_api_pool_size=int(os.getenv("BOT_API_POOL_SIZE", "100")),
+        bot_api_timeout_seconds=float(os.getenv("BOT_API_TIMEOUT_SECONDS", "60")),
+        bot_api_keepalive_seconds=float(os.getenv("BOT_API_KEEPALIVE_SECONDS", "30")),
+        upload_timeout_seconds=float(os.getenv("UPLOAD_TIMEOUT_SECONDS", "1800")),
+        upload_concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "3")),
+        split_large_files=os.getenv("SPLIT_LARGE_FILES", "1").strip() == "1",
+        transcode_oversize=os.getenv("TRANSCODE_OVERSIZE", "1").strip() == "1",
+        transcode_concurrency=int(os.getenv("TRANSCODE_CONCURRENCY", "0")),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1").strip(),
+        metrics_port=int(os.getenv("METRICS_PORT", "0")),
+        loop_lag_threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")),
+        io_threads=int(os.getenv("IO_THREADS", "4")),
+        disk_quota_mb=int(os.getenv("DISK_QUOTA_MB", "0")),
+        disk_min_free_mb=int(os.getenv("DISK_MIN_FREE_MB", "500")),
+        disk_wait_seconds=int(os.getenv("DISK_WAIT_SECONDS", "600")),
+        sweep_interval_seconds=int(os.getenv("SWEEP_INTERVAL_SECONDS", "60")),
+        orphan_max_age_seconds=int(os.getenv("ORPHAN_MAX_AGE_SECONDS", "3600")),
+        progress_interval_seconds=float(os.getenv("PROGRESS_INTERVAL_SECONDS", "2")),
+        progress_edits_per_second=float(os.getenv("PROGRESS_EDITS_PER_SECOND", "10")),
+        queue_aging_mb_per_minute=float(os.getenv("QUEUE_AGING_MB_PER_MINUTE", "10")),
+        queue_status_interval_seconds=float(os.getenv("QUEUE_STATUS_INTERVAL_SECONDS", "10")),
     )
@@ -1,212 +1,699 @@
 from __future__ import annotations
 import asyncio
+import logging
 import time
-import uuid
+from pathlib import Path
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
 from bot.states import DownloadFlow
-from bot.keyboards import formats_keyboard
-from bot.services.queue_service import QueueService, DownloadJob
+from bot.keyboards import batch_keyboard, formats_keyboard
+from bot.services.queue_service import QueueService, DownloadJob, dedup_key
 from bot.services.storage_service import StorageService
-from bot.services.cleanup_service import CleanupService
-from bot.services.telegram_uploader import send_file
-from bot.services import ytdlp_service
+from bot.services.disk_service import DiskService
+from bot.services.file_cache import CachedFile, FileIdCache, cache_key
+from bot.services.info_cache import InfoCache
+from bot.services.job_store import JobStore
+from bot.services.batch_service import Batch
+from bot.services.pending_store import PendingBatch, PendingStore
+from bot.services.progress_service import ProgressService, ProgressTracker
+from bot.services.pipeline import DownloadTail, GrowingFileInput, final_name
+from bot.services.split_service import MB, split_media
+from bot.services.telegram_uploader import send_file, send_cached, send_parts
+from bot.services import bandwidth, io_executor, metrics, site_limiter, transcode_service, ytdlp_service
 
 router = Router()
 
-# Memória (simples) para requests pendentes:
-# request_id -> {"url": str, "info": dict, "options": list[FormatOption], "expires_at": float}
-PENDING: dict[str, dict] = {}
-CANCEL_FLAGS: dict[int, bool] = {}
+# job_ids cancelados pelo usuário; cada job sai daqui quando é finalizado
+CANCELLED: set[str] = set()
+# batch_id -> lote em andamento; sai daqui quando o último item termina
+BATCHES: dict[str, Batch] = {}
+# Com fila compartilhada, de quanto em quanto tempo o front-end lê no store o
+# resultado dos itens de lote
+BATCH_SYNC_INTERVAL = 2.0
+# job_id -> posição/previsão na fila mostrada na mensagem do job; sai quando
+# o job começa (ou deixa a fila)
+QUEUE_TRACKERS: dict[str, ProgressTracker] = {}
+
+async def _send_from_cache(bot, chat_id: int, file_cache: FileIdCache, key, caption: str | None) -> CachedFile | None:
+    # Tenta reenviar por file_id; se o Telegram rejeitar, remove do cache.
+    cached = await file_cache.get(key)
+    if cached is None:
+        return None
+    try:
+        await send_cached(bot, chat_id, cached, caption)
+    except TelegramBadRequest as e:
+        logging.info("file_id rejeitado pelo Telegram (%s), removendo do cache: %s", e, key)
+        await file_cache.evict(key)
+        return None
+    return cached
+
+def _selection(format_id: str, sent: CachedFile, cached: bool = False) -> dict:
+    selected = {"format_id": format_id, "telegram_file_id": sent.file_id, "filename": sent.filename}
+    if sent.parts:
+        selected["parts"] = list(sent.parts)
+    if cached:
+        selected["cached"] = True
+    return selected
 
-def _cleanup_pending():
-    now = time.time()
-    dead = [rid for rid, v in PENDING.items() if v["expires_at"] < now]
-    for rid in dead:
-        PENDING.pop(rid, None)
+@router.message(F.text == "/cancel")
+async def cmd_cancel(m: Message, queue: QueueService):
+    # Marca os jobs do usuário; cada worker interrompe o seu e agenda a
+    # limpeza só do diretório daquele job (nada é apagado enquanto escreve).
+    # Com fila compartilhada o pedido chega aos outros processos pelo store.
+    jobs = await queue.cancel_user(m.from_user.id)
+    if not jobs:
+        await m.answer("Nenhum download em andamento.")
+        return
+    CANCELLED.update(j.job_id for j in jobs)
+    await m.answer("Cancelamento solicitado.")
 
 @router.message(F.text)
-async def on_text(m: Message, state: FSMContext, storage: StorageService, settings):
-    _cleanup_pending()
-
+async def on_text(m: Message, state: FSMContext, pending: PendingStore, info_cache: InfoCache, settings):
     if settings.allowlist and m.from_user.id not in settings.allowlist:
         await m.answer("Acesso não autorizado.")
         return
 
-    url = (m.text or "").strip()
-    if not (url.startswith("http://") or url.startswith("https://")):
+    urls = list(dict.fromkeys(
+        w for w in (m.text or "").split() if w.startswith("http://") or w.startswith("https://")
+    ))
+    if not urls:
         await m.answer("Envie uma URL válida começando com http:// ou https://")
         return
 
     await state.set_state(DownloadFlow.waiting_choice)
+    if len(urls) > 1:
+        # Vários links numa mensagem: um lote, sem extrair nada agora
+        entries = [{"url": u} for u in urls[:settings.batch_max_items]]
+        await _offer_batch(m, pending, None, entries)
+        return
+
+    url = urls[0]
     msg = await m.answer("Analisando link...")
 
     try:
-        info = await ytdlp_service.extract_info(url, settings.http_proxy, settings.ytdlp_cookies_file)
+        info = await info_cache.get(url)
     except Exception as e:
         await msg.edit_text(f"Falha ao analisar: {type(e).__name__}: {e}")
         await state.set_state(DownloadFlow.waiting_link)
         return
 
+    entries = ytdlp_service.playlist_entries(info)
+    if entries is not None:
+        if not entries:
+            await msg.edit_text("A playlist está vazia.")
+            await state.set_state(DownloadFlow.waiting_link)
+            return
+        await _offer_batch(msg, pending, info.get("title"), entries[:settings.batch_max_items], edit=True)
+        return
+
     options = ytdlp_service.build_options(info, settings.max_upload_mb)
     if not options:
         await msg.edit_text("Não encontrei formatos disponíveis para esse link.")
         await state.set_state(DownloadFlow.waiting_link)
         return
 
-    request_id = uuid.uuid4().hex
-    PENDING[request_id] = {
-        "url": url,
-        "info": info,
-        "options": options,
-        "expires_at": time.time() + 600,  # 10 min
-    }
+    req = pending.add(url, info, options)
 
     kb_items = [{"label": o.label, "format_id": o.format_id} for o in options]
-    title = info.get("title") or "Sem título"
-    await msg.edit_text(f"Título: {title}\nEscolha um formato:", reply_markup=formats_keyboard(request_id, kb_items))
+    title = req.title or "Sem título"
+    await msg.edit_text(f"Título: {title}\nEscolha um formato:", reply_markup=formats_keyboard(req.request_id, kb_items))
+
+async def _offer_batch(msg: Message, pending: PendingStore, title: str | None, entries: list[dict], edit: bool = False):
+    batch = pending.add_batch(title, entries)
+    text = f"{'Playlist: ' + title if title else 'Lote'} ({len(entries)} itens)\nEscolha o formato para todos:"
+    kb = batch_keyboard(batch.request_id, ytdlp_service.POLICIES)
+    if edit:
+        await msg.edit_text(text, reply_markup=kb)
+    else:
+        await msg.answer(text, reply_markup=kb)
+
+@router.callback_query(F.data.startswith("batch|"))
+async def cb_batch(
+    cq: CallbackQuery,
+    state: FSMContext,
+    queue: QueueService,
+    pending: PendingStore,
+    progress: ProgressService,
+    settings,
+):
+    parts = cq.data.split("|", 2)
+    if len(parts) != 3:
+        await cq.answer("Callback inválido.", show_alert=True)
+        return
 
-@router.callback_query(F.data.startswith("dl|"))
-async def cb_dl(cq: CallbackQuery, state: FSMContext, queue: QueueService, settings):
-    _cleanup_pending()
+    _, request_id, policy = parts
+    req = pending.get(request_id)
+    if not isinstance(req, PendingBatch):
+        await cq.answer("Essa seleção expirou. Envie o link de novo.", show_alert=True)
+        await state.set_state(DownloadFlow.waiting_link)
+        return
+
+    pending.discard(request_id)
+    await state.set_state(DownloadFlow.waiting_link)
+    if policy not in ytdlp_service.POLICIES:
+        await cq.message.edit_text("Cancelado.")
+        await cq.answer()
+        return
 
+    # Um job por item com o mesmo seletor; o yt-dlp escolhe o formato de cada
+    # um na hora do download e a fila respeita o limite por usuário
+    format_id = ytdlp_service.policy_format(policy, settings.max_upload_mb)
+    batch = Batch(
+        request_id, cq.message.chat.id, cq.message.message_id, req.title, len(req.entries), progress,
+    )
+    BATCHES[request_id] = batch
+    for e in req.entries:
+        info = {"id": e.get("id"), "extractor_key": e.get("ie_key")}
+        job = DownloadJob(
+            user_id=cq.from_user.id,
+            chat_id=cq.message.chat.id,
+            message_id=cq.message.message_id,
+            url=e["url"],
+            format_id=format_id,
+            request_id=request_id,
+            dedup_key=dedup_key(cache_key(info, format_id), e["url"], format_id),
+            title=e.get("title"),
+            video_id=e.get("id"),
+            extractor=e.get("ie_key"),
+            duration=e.get("duration"),
+            batch_id=request_id,
+        )
+        batch.add_item(job.job_id, job.title)
+        await queue.put(job)
+    await cq.answer(f"{len(req.entries)} itens na fila.")
+
+@router.callback_query(F.data.startswith("dl|"))
+async def cb_dl(
+    cq: CallbackQuery,
+    state: FSMContext,
+    queue: QueueService,
+    pending: PendingStore,
+    storage: StorageService,
+    file_cache: FileIdCache,
+    disk: DiskService,
+    settings,
+):
     parts = cq.data.split("|", 2)
     if len(parts) != 3:
         await cq.answer("Callback inválido.", show_alert=True)
         return
 
-    _, request_id, format_id = parts
+    _, request_id, choice = parts
 
-    if request_id not in PENDING:
+    req = pending.get(request_id)
+    if req is None or isinstance(req, PendingBatch):
         await cq.answer("Essa seleção expirou. Envie o link de novo.", show_alert=True)
         await state.set_state(DownloadFlow.waiting_link)
         return
 
-    if format_id == "__cancel__":
+    if choice == "__cancel__":
+        pending.discard(request_id)
         await cq.message.edit_text("Cancelado.")
         await state.set_state(DownloadFlow.waiting_link)
         await cq.answer()
         return
 
+    if not choice.isdigit() or int(choice) >= len(req.options):
+        await cq.answer("Opção inválida.", show_alert=True)
+        return
+    option = req.options[int(choice)]
+    format_id = option.format_id
+
+    info = req.info()
+    key = cache_key(info, format_id)
+    sent = await _send_from_cache(cq.bot, cq.message.chat.id, file_cache, key, req.title or None)
+    if sent is not None:
+        storage.save_link_record(cq.from_user.id, info, req.url, _selection(format_id, sent, cached=True))
+        await cq.answer("Já estava em cache.")
+        await cq.message.edit_text("Enviado (cache).")
+        await state.set_state(DownloadFlow.waiting_link)
+        return
+
+    if option.filesize_mb is not None and not disk.can_ever_fit(_expected_bytes(option.filesize_mb, settings)):
+        await cq.answer("Arquivo grande demais para o espaço temporário do bot.", show_alert=True)
+        return
+
     job = DownloadJob(
         user_id=cq.from_user.id,
         chat_id=cq.message.chat.id,
         message_id=cq.message.message_id,
-        url=PENDING[request_id]["url"],
+        url=req.url,
         format_id=format_id,
         request_id=request_id,
+        dedup_key=dedup_key(key, req.url, format_id),
+        title=req.title,
+        video_id=req.video_id,
+        extractor=req.extractor,
+        uploader=req.uploader,
+        duration=req.duration,
+        # Pipeline só quando o tamanho é conhecido e cabe num upload único
+        streamable=bool(
+            option.streamable
+            and option.filesize_mb is not None and option.filesize_mb <= settings.max_upload_mb
+        ),
+        filesize_mb=option.filesize_mb,
+        protocol=option.protocol,
     )
-    await queue.put(job)
-    await cq.answer("Entrou na fila.")
-    await cq.message.edit_text("Na fila. Vou começar assim que possível...")
-
-async def worker_loop(bot, queue: QueueService, storage: StorageService, cleanup: CleanupService, settings):
+    if await queue.put(job):
+        await cq.answer("Entrou na fila.")
+        await cq.message.edit_text("Na fila. Vou começar assim que possível...")
+    else:
+        await cq.answer("Esse arquivo já está sendo baixado, você recebe junto.")
+        await cq.message.edit_text("Na fila (download compartilhado com outro pedido)...")
+
+async def worker_loop(
+    bot,
+    queue: QueueService,
+    storage: StorageService,
+    disk: DiskService,
+    file_cache: FileIdCache,
+    progress: ProgressService,
+    settings,
+):
     while True:
         job = await queue.get()
+        requeued = False
         try:
-            async with queue.global_sem:
-                async with queue.user_sem(job.user_id):
-                    CANCEL_FLAGS[job.user_id] = False
-
-                    pending = PENDING.get(job.request_id)
-                    if not pending:
-                        await bot.send_message(job.chat_id, "Pedido expirou. Envie o link novamente.")
-                        continue
-
-                    info = pending["info"]
-                    temp_dir = storage.temp_dir(job.user_id)
-
-                    last_edit = 0.0
-                    progress_text = {"txt": "Iniciando download..."}
-
-                    def cancel_check() -> bool:
-                        return bool(CANCEL_FLAGS.get(job.user_id))
-
-                    def progress_cb(d: dict):
-                        nonlocal last_edit
-                        now = time.time()
-                        if now - last_edit < 1.2:
-                            return
-                        last_edit = now
-
-                        if d.get("status") == "downloading":
-                            p = d.get("_percent_str", "").strip()
-                            s = d.get("_speed_str", "").strip()
-                            eta = d.get("_eta_str", "").strip()
-                            progress_text["txt"] = f"Baixando... {p} | {s} | ETA {eta}".strip()
-                        elif d.get("status") == "finished":
-                            progress_text["txt"] = "Finalizando (pós-processamento)..."
-
-                    await bot.edit_message_text(
-                        chat_id=job.chat_id, message_id=job.message_id,
-                        text="Baixando... (0%)"
-                    )
-
-                    async def progress_pusher():
-                        while True:
-                            await asyncio.sleep(1.3)
-                            try:
-                                await bot.edit_message_text(
-                                    chat_id=job.chat_id,
-                                    message_id=job.message_id,
-                                    text=progress_text["txt"],
-                                )
-                            except Exception:
-                                pass
-                            if progress_text["txt"].startswith("UPLOAD:"):
-                                return
-
-                    pusher_task = asyncio.create_task(progress_pusher())
-
-                    try:
-                        file_path = await ytdlp_service.download(
-                            job.url,
-                            job.format_id,
-                            temp_dir,
-                            settings.http_proxy,
-                            settings.ytdlp_cookies_file,
-                            cancel_check,
-                            progress_cb,
-                        )
-                    except ytdlp_service.DownloadCancelled:
-                        await bot.edit_message_text(job.chat_id, job.message_id, "Cancelado.")
-                        continue
-                    except Exception as e:
-                        await bot.edit_message_text(job.chat_id, job.message_id, f"Falha no download: {type(e).__name__}: {e}")
+            requeued = await _process_job(bot, job, queue, storage, disk, file_cache, progress, settings)
+        except Exception:
+            logging.exception("Falha inesperada no job %s", job.request_id)
+            await _finish(bot, queue, [job], "failed", "Falha no download. Tente novamente.")
+        finally:
+            await disk.release(job.job_id)
+            if not requeued:
+                # Sucesso, falha ou cancelamento: o diretório do job entra na varredura do TTL
+                disk.mark_done(storage.job_dir(job.user_id, job.job_id))
+                # Quem ainda estiver anexado (falha inesperada) não pode ficar esperando
+                leftover = queue.detach(job)
+                await _finish(bot, queue, leftover, "failed", "Falha no download. Tente novamente.")
+            await queue.task_done(job)
+
+def _eta_txt(seconds: float) -> str:
+    # Arredondado para cima em minutos: o texto muda pouco e cada mudança é
+    # uma edição
+    minutes = -(-int(seconds) // 60)
+    if minutes <= 1:
+        return "menos de 1 min"
+    if minutes < 60:
+        return f"~{minutes} min"
+    return f"~{minutes // 60}h{minutes % 60:02d}"
+
+def _queue_text(position: int, eta: float | None) -> str:
+    if eta is None:
+        return f"Na fila (posição {position}). Vou começar assim que possível..."
+    return f"Na fila (posição {position}). Início previsto em {_eta_txt(eta)}..."
+
+async def _update_queue_status(queue: QueueService, progress: ProgressService) -> None:
+    queued = set()
+    for job, position, eta in queue.positions():
+        # Lotes têm a mensagem agregada; job que voltou por throttle mantém o aviso
+        if job.batch_id or job.job_id in queue.retries:
+            continue
+        queued.add(job.job_id)
+        text = _queue_text(position, eta)
+        tracker = QUEUE_TRACKERS.get(job.job_id)
+        if tracker is None:
+            QUEUE_TRACKERS[job.job_id] = progress.track(
+                lambda j=job: [] if j.job_id in CANCELLED else [j], text
+            )
+        else:
+            tracker.update(text)
+    for job_id in [k for k in QUEUE_TRACKERS if k not in queued]:
+        tracker = QUEUE_TRACKERS.pop(job_id, None)
+        if tracker is not None:
+            await tracker.close()
+
+async def queue_status_loop(queue: QueueService, progress: ProgressService, interval: float) -> None:
+    # Só atualiza os textos; o flusher do ProgressService decide quando editar
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _update_queue_status(queue, progress)
+        except Exception:
+            logging.exception("Falha ao atualizar posições da fila")
+
+def _expected_bytes(filesize_mb: float | None, settings) -> int:
+    # Sem tamanho conhecido, reserva o limite de upload. Folga de 10% para
+    # merge/remux; acima do limite o split (ou a compressão) grava ao lado do original.
+    mb = filesize_mb if filesize_mb is not None else settings.max_upload_mb
+    oversize = settings.split_large_files or settings.transcode_oversize
+    factor = 2.1 if oversize and mb > settings.max_upload_mb else 1.1
+    return int(mb * factor * MB)
+
+async def _notify(bot, jobs: list[DownloadJob], text: str) -> None:
+    # Itens de lote não têm mensagem própria (a do lote é do Batch)
+    for j in jobs:
+        if j.batch_id:
+            continue
+        try:
+            await bot.edit_message_text(chat_id=j.chat_id, message_id=j.message_id, text=text)
+        except Exception:
+            pass
+
+async def _finish(bot, queue: QueueService, jobs: list[DownloadJob], state: str, text: str) -> None:
+    completed = []
+    for j in jobs:
+        # Itens de lote gravam o texto: o front-end pode estar em outro processo
+        queue.set_state(j, state, text if j.batch_id else None)
+        metrics.JOBS.inc(result=state)
+        CANCELLED.discard(j.job_id)
+        batch = BATCHES.get(j.batch_id) if j.batch_id else None
+        if batch is not None and batch.record(j.job_id, j.title, state, text):
+            completed.append(batch)
+    await _notify(bot, jobs, text)
+    await _close_batches(bot, completed)
+
+async def _close_batches(bot, batches: list[Batch]) -> None:
+    for batch in batches:
+        if BATCHES.pop(batch.batch_id, None) is not None:
+            await batch.close(bot)
+
+async def batch_sync_loop(bot, store: JobStore, interval: float = BATCH_SYNC_INTERVAL) -> None:
+    # Front-end com fila compartilhada: os itens dos lotes rodam nos workers;
+    # o resultado de cada um chega pelo store
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            ids = [job_id for batch in BATCHES.values() for job_id in batch.pending]
+            if not ids:
+                continue
+            results = await store.results(ids)
+            completed = []
+            for batch in list(BATCHES.values()):
+                for job_id, title in list(batch.pending.items()):
+                    if job_id not in results:
                         continue
+                    state, detail = results[job_id]
+                    if batch.record(job_id, title, state, detail or "sem detalhes"):
+                        completed.append(batch)
+            await _close_batches(bot, completed)
+        except Exception:
+            logging.exception("Falha ao sincronizar lotes com a fila compartilhada")
+
+def restore_batches(jobs: list[DownloadJob], progress: ProgressService) -> None:
+    # Depois de um restart só os itens não finalizados voltam: o lote recomeça
+    # a contar a partir deles, na mesma mensagem
+    for j in jobs:
+        if not j.batch_id:
+            continue
+        batch = BATCHES.get(j.batch_id)
+        if batch is None:
+            batch = BATCHES[j.batch_id] = Batch(j.batch_id, j.chat_id, j.message_id, None, 0, progress)
+        batch.total += 1
+        batch.add_item(j.job_id, j.title)
+        batch.tracker.update(batch.render())
+
+async def _deliver_followers(
+    bot,
+    queue: QueueService,
+    followers: list[DownloadJob],
+    uploaded: CachedFile,
+    storage: StorageService,
+    info: dict,
+    caption: str | None,
+) -> None:
+    # Um download, N entregas: os demais pedidos recebem o mesmo file_id
+    for f in followers:
+        if f.job_id in CANCELLED:
+            await _finish(bot, queue, [f], "cancelled", "Cancelado.")
+            continue
+        try:
+            await send_cached(bot, f.chat_id, uploaded, caption)
+        except Exception as e:
+            logging.warning("Falha ao entregar job anexado %s: %s", f.request_id, e)
+            await _finish(bot, queue, [f], "failed", f"Falha no envio: {type(e).__name__}: {e}")
+            continue
+        storage.save_link_record(f.user_id, info, f.url, _selection(f.format_id, uploaded))
+        await _finish(bot, queue, [f], "done", "Enviado.")
+
+async def _upload(
+    bot,
+    chat_id: int,
+    file_path: Path,
+    caption: str | None,
+    settings,
+    progress: ProgressTracker,
+    extractor: str,
+) -> CachedFile:
+    size = (await io_executor.run(file_path.stat)).st_size
+    if settings.split_large_files and size > settings.max_upload_mb * MB:
+        # Acima do limite: divide com ffmpeg e sobe as partes
+        progress.update("Dividindo arquivo grande em partes...")
+        parts = await split_media(file_path, settings.max_upload_mb, file_path.parent / "parts")
+        progress.update(f"Enviando {len(parts)} partes para o Telegram...")
+        return await send_parts(
+            bot, chat_id, parts, caption, settings.force_document,
+            concurrency=settings.upload_concurrency, extractor=extractor,
+        )
+    return await send_file(bot, chat_id, file_path, caption, settings.force_document, extractor=extractor)
+
+async def _download_streaming(
+    bot,
+    job: DownloadJob,
+    work_dir: Path,
+    caption: str | None,
+    settings,
+    cancel_check,
+    progress_cb,
+    rate_fn,
+) -> tuple:
+    # Baixa e, assim que o yt-dlp começa a escrever, sobe o arquivo em paralelo.
+    # Retorna (arquivo, CachedFile) ou (arquivo, None) se o upload em pipeline
+    # não rolou: nesse caso o chamador faz o upload normal do arquivo pronto.
+    tail = DownloadTail(asyncio.get_running_loop())
+
+    def cb(d: dict):
+        tail.on_progress(d)
+        progress_cb(d)
+
+    dl_task = asyncio.create_task(ytdlp_service.download(
+        job.url,
+        job.format_id,
+        work_dir,
+        settings.ytdlp_cookies_file,
+        cancel_check,
+        cb,
+        job.extractor,
+        job.protocol,
+        job.filesize_mb,
+        rate_fn,
+    ))
+    dl_task.add_done_callback(lambda t: tail.finish(not t.cancelled() and t.exception() is None))
+
+    await tail.started.wait()
+    if dl_task.done():
+        # Terminou (ou falhou) antes do primeiro progresso
+        return await dl_task, None
+
+    upload_task = asyncio.create_task(send_file(
+        bot, job.chat_id, Path(tail.final_path), caption, settings.force_document,
+        input_file=GrowingFileInput(tail, final_name(tail)),
+        extractor=(job.extractor or "").lower(),
+    ))
+    # Evita "exception was never retrieved" quando o download falha primeiro
+    upload_task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
-                    progress_text["txt"] = "UPLOAD: enviando para o Telegram..."
-                    await asyncio.sleep(0.2)
-
-                    caption = info.get("title") or None
-                    file_id = await send_file(bot, job.chat_id, file_path, caption, settings.force_document)
-
-                    selected = {"format_id": job.format_id, "telegram_file_id": file_id, "filename": file_path.name}
-                    storage.save_link_record(job.user_id, info, job.url, selected)
+    try:
+        file_path = await dl_task
+    except BaseException:
+        upload_task.cancel()
+        raise
 
-                    await bot.edit_message_text(job.chat_id, job.message_id, "Enviado. Limpando temporários em alguns minutos...")
+    try:
+        return file_path, await upload_task
+    except Exception as e:
+        logging.info("Upload em pipeline falhou no job %s (%s); usando upload normal", job.request_id, e)
+        return file_path, None
+
+async def _process_job(
+    bot,
+    job: DownloadJob,
+    queue: QueueService,
+    storage: StorageService,
+    disk: DiskService,
+    file_cache: FileIdCache,
+    progress: ProgressService,
+    settings,
+):
+    # Retorna True quando o job voltou para a fila (throttle do site)
+    queued = QUEUE_TRACKERS.pop(job.job_id, None)
+    if queued is not None:
+        await queued.close()
+    info = job.info()
+    caption = job.title or None
+    key = cache_key(info, job.format_id)
+
+    # Cancelado enquanto esperava na fila (por todos os interessados)
+    if all(j.job_id in CANCELLED for j in [job, *queue.followers(job)]):
+        await _finish(bot, queue, [job, *queue.detach(job)], "cancelled", "Cancelado.")
+        return
 
-                    asyncio.create_task(cleanup.schedule_delete_dir(temp_dir))
-                    pusher_task.cancel()
+    # Outro job pode ter enviado o mesmo arquivo enquanto este esperava na fila
+    sent = await _send_from_cache(bot, job.chat_id, file_cache, key, caption)
+    if sent is not None:
+        storage.save_link_record(job.user_id, info, job.url, _selection(job.format_id, sent, cached=True))
+        await _finish(bot, queue, [job], "done", "Enviado (cache).")
+        await _deliver_followers(bot, queue, queue.detach(job), sent, storage, info, caption)
+        return
 
+    work_dir = storage.job_dir(job.user_id, job.job_id)
+
+    expected = _expected_bytes(job.filesize_mb, settings)
+    if not await disk.admit(job.job_id, work_dir, expected, timeout=0):
+        await _notify(bot, [job, *queue.followers(job)], "Aguardando espaço em disco para baixar...")
+        if not await disk.admit(job.job_id, work_dir, expected, timeout=settings.disk_wait_seconds):
+            await _finish(
+                bot, queue, [job, *queue.detach(job)], "failed",
+                "Sem espaço em disco para este download agora. Tente mais tarde.",
+            )
+            return
+
+    # Quem vê o progresso: o job e os anexados; depois do detach, os que
+    # continuam esperando o upload
+    group: list[DownloadJob] | None = None
+
+    def members() -> list[DownloadJob]:
+        if group is not None:
+            return [j for j in group if j.job_id not in CANCELLED]
+        return [job, *queue.followers(job)]
+
+    def cancel_check() -> bool:
+        # Download compartilhado só para se todos os interessados cancelarem
+        return all(j.job_id in CANCELLED for j in members())
+
+    def watchers() -> list[DownloadJob]:
+        # Itens de lote mostram progresso na mensagem agregada do lote
+        return [j for j in members() if not j.batch_id]
+
+    batch = BATCHES.get(job.batch_id) if job.batch_id else None
+
+    # O flusher compartilhado só edita quando o texto muda, dentro dos limites
+    # do Telegram. O tracker é fechado antes de cada mensagem final (e no
+    # finally), então nenhuma edição de progresso atrasada a sobrescreve.
+    tracker = progress.track(watchers, "Baixando... (0%)")
+
+    budget = bandwidth.get_budget()
+    rate_fn = (lambda: budget.share(job.job_id)) if budget.enabled else None
+
+    def progress_cb(d: dict):
+        if rate_fn is not None:
+            budget.observe(job.job_id, d.get("speed"))
+        if batch is not None and d.get("status") == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            if total:
+                batch.item_progress(job.job_id, (d.get("downloaded_bytes") or 0) / total)
+        if d.get("status") == "downloading":
+            p = d.get("_percent_str", "").strip()
+            s = d.get("_speed_str", "").strip()
+            eta = d.get("_eta_str", "").strip()
+            tracker.update(f"Baixando... {p} | {s} | ETA {eta}".strip())
+        elif d.get("status") == "finished":
+            tracker.update("Finalizando (pós-processamento)...")
+
+    extractor = (job.extractor or "").lower()
+    streamed: CachedFile | None = None
+    t0 = time.perf_counter()
+    try:
+        if rate_fn is not None:
+            budget.register(job.job_id, job.user_id)
+        try:
+            # Com Bot API local o upload é só um caminho: não há o que sobrepor
+            if settings.pipeline_upload and job.streamable and not settings.bot_api_local:
+                file_path, streamed = await _download_streaming(
+                    bot, job, work_dir, caption, settings, cancel_check, progress_cb, rate_fn
+                )
+            else:
+                file_path = await ytdlp_service.download(
+                    job.url,
+                    job.format_id,
+                    work_dir,
+                    settings.ytdlp_cookies_file,
+                    cancel_check,
+                    progress_cb,
+                    job.extractor,
+                    job.protocol,
+                    job.filesize_mb,
+                    rate_fn,
+                )
+        except ytdlp_service.DownloadCancelled:
+            await tracker.close()
+            await _finish(bot, queue, [job, *queue.detach(job)], "cancelled", "Cancelado.")
+            # Nada a reenviar: o parcial do job sai na próxima varredura
+            disk.mark_done(work_dir, delay=0)
+            return
+        except Exception as e:
+            await tracker.close()
+            if site_limiter.classify(e) == site_limiter.THROTTLED and await queue.requeue(job):
+                # O site pediu calma: volta para a fila (com os anexados e o
+                # .part para retomar) e recomeça depois do backoff do site
+                wait = queue.limiter.backoff_remaining(queue.site(job))
+                await _notify(bot, members(), f"O site está limitando downloads; nova tentativa em ~{wait:.0f}s...")
+                return True
+            await _finish(bot, queue, [job, *queue.detach(job)], "failed", f"Falha no download: {type(e).__name__}: {e}")
+            return
         finally:
-            queue.task_done()
+            budget.release(job.job_id)
 
-@router.message(F.text == "/cancel")
-async def cmd_cancel(m: Message, storage: StorageService):
-    CANCEL_FLAGS[m.from_user.id] = True
-    # Limpa temp imediatamente (melhor esforço)
-    try:
-        temp = storage.temp_dir(m.from_user.id)
-        # não deleta a pasta raiz aqui para evitar corrida com worker; apaga conteúdo
-        for p in temp.glob("*"):
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="download", extractor=extractor)
+        size = (await io_executor.run(file_path.stat)).st_size
+        metrics.BYTES.inc(size, direction="down", extractor=extractor)
+
+        if settings.transcode_oversize and streamed is None and size > settings.max_upload_mb * MB:
+            # Acima do limite: tenta encaixar com ffmpeg antes de dividir
+            t1 = time.perf_counter()
+            tracker.update("Arquivo acima do limite, comprimindo...")
             try:
-                p.unlink()
-            except Exception:
-                pass
-    except Exception:
-        pass
-    await m.answer("Cancelamento solicitado.")
+                shrunk = await transcode_service.shrink(
+                    file_path, settings.max_upload_mb, work_dir / "shrink", cancel_check, tracker.update
+                )
+            except transcode_service.TranscodeCancelled:
+                await tracker.close()
+                await _finish(bot, queue, [job, *queue.detach(job)], "cancelled", "Cancelado.")
+                disk.mark_done(work_dir, delay=0)
+                return
+            except Exception as e:
+                logging.warning("Falha ao comprimir o job %s: %s", job.request_id, e)
+                shrunk = None
+            if shrunk is not None:
+                file_path = shrunk
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - t1, stage="transcode", extractor=extractor)
+
+        tracker.update("Enviando para o Telegram...")
+        queue.set_state(job, "uploading")
+
+        # Se o dono do job cancelou mas outros ainda querem o arquivo, o upload vai
+        # para o primeiro interessado que continua na espera.
+        group = [job, *queue.detach(job)]
+        active = [j for j in group if j.job_id not in CANCELLED]
+        if streamed is not None and job not in active:
+            # No pipeline o arquivo já foi para o chat do dono do job
+            active.insert(0, job)
+        # Os cancelados já saíram de members(); só falta a edição em voo
+        await progress.wait_idle()
+        await _finish(bot, queue, [j for j in group if j not in active], "cancelled", "Cancelado.")
+        if not active:
+            return
+        target, followers = active[0], active[1:]
+        if streamed is not None:
+            uploaded = streamed
+        else:
+            try:
+                uploaded = await _upload(bot, target.chat_id, file_path, caption, settings, tracker, extractor)
+            except Exception as e:
+                logging.warning("Falha no upload do job %s: %s", job.request_id, e)
+                await tracker.close()
+                await _finish(bot, queue, active, "failed", f"Falha no envio: {type(e).__name__}: {e}")
+                return
+        await tracker.close()
+        await file_cache.put(key, uploaded)
+
+        storage.save_link_record(target.user_id, info, target.url, _selection(target.format_id, uploaded))
+
+        await _finish(bot, queue, [target], "done", "Enviado. Limpando temporários em alguns minutos...")
+        await _deliver_followers(bot, queue, followers, uploaded, storage, info, caption)
+    finally:
+        await tracker.close()
@@ -1,38 +1,74 @@
 from __future__ import annotations
-from pathlib import Path
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 
 from bot.keyboards import links_keyboard
 from bot.services.storage_service import StorageService
 
 router = Router()
 
-def _short_label(p: Path) -> str:
-    return p.name[:60]
+PAGE_SIZE = 10
+# callback_data tem limite de 64 bytes; a busca viaja junto na paginação
+MAX_QUERY_BYTES = 40
+
+def _short_label(rec: dict) -> str:
+    title = rec.get("title") or "Sem título"
+    ts = rec.get("timestamp") or ""
+    date = f"{ts[6:8]}/{ts[4:6]} " if len(ts) >= 8 else ""
+    return f"{date}{title}"[:60]
+
+def _clip_query(query: str) -> str:
+    return query.encode("utf-8")[:MAX_QUERY_BYTES].decode("utf-8", "ignore").replace("|", " ").strip()
+
+async def _render_page(storage: StorageService, user_id: int, page: int, query: str):
+    total = await storage.count_link_records(user_id, query or None)
+    records = await storage.list_link_records(user_id, PAGE_SIZE, page * PAGE_SIZE, query or None)
+    if not records:
+        return None, None
+
+    first = page * PAGE_SIZE + 1
+    last = page * PAGE_SIZE + len(records)
+    head = f"Busca '{query}': " if query else "Histórico: "
+    text = f"{head}{first}-{last} de {total}"
+
+    items = [{"label": _short_label(r), "record_id": r["record_id"]} for r in records]
+    kb = links_keyboard(items, page=page, has_next=last < total, query=query)
+    return text, kb
 
 @router.message(Command("links"))
-async def cmd_links(m: Message, storage: StorageService):
-    user_id = m.from_user.id
-    files = storage.list_link_records(user_id)[:20]
-    if not files:
-        await m.answer("Nenhum link salvo ainda.")
+async def cmd_links(m: Message, command: CommandObject, storage: StorageService):
+    # /links -> últimos; /links termo -> busca por título
+    query = _clip_query(command.args or "")
+    text, kb = await _render_page(storage, m.from_user.id, 0, query)
+    if text is None:
+        await m.answer("Nada encontrado." if query else "Nenhum link salvo ainda.")
         return
+    await m.answer(text, reply_markup=kb)
 
-    items = [{"label": _short_label(p), "file": str(p)} for p in files]
-    await m.answer("Histórico (últimos 20):", reply_markup=links_keyboard(items))
+@router.callback_query(F.data.startswith("links|page|"))
+async def cb_links_page(cq: CallbackQuery, storage: StorageService):
+    parts = cq.data.split("|", 3)
+    if len(parts) != 4 or not parts[2].isdigit():
+        await cq.answer("Callback inválido.", show_alert=True)
+        return
+
+    text, kb = await _render_page(storage, cq.from_user.id, int(parts[2]), parts[3])
+    if text is None:
+        await cq.answer("Nada nesta página.", show_alert=True)
+        return
+    await cq.message.edit_text(text, reply_markup=kb)
+    await cq.answer()
 
 @router.callback_query(F.data.startswith("links|send|"))
 async def cb_send_link(cq: CallbackQuery, storage: StorageService):
-    _, _, file_path = cq.data.split("|", 2)
-    p = Path(file_path)
-    if not p.exists():
+    _, _, record_id = cq.data.split("|", 2)
+    data = await storage.get_link_record(cq.from_user.id, int(record_id)) if record_id.isdigit() else None
+    if data is None:
         await cq.answer("Registro não encontrado.", show_alert=True)
         return
 
-    data = storage.read_json(p)
     await cq.message.answer(
         f"Título: {data.get('title')}\nURL: {data.get('original_url')}\nSelecionado: {data.get('selected')}"
     )
@@ -2,15 +2,34 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 def formats_keyboard(request_id: str, items: list[dict]) -> InlineKeyboardMarkup:
     # items: [{label, format_id}]
+    # callback_data leva o índice da opção (limite de 64 bytes do Telegram;
+    # format_ids combinados como "137+140" ou seletores não caberiam)
     rows = []
-    for it in items[:30]:
-        rows.append([InlineKeyboardButton(text=it["label"], callback_data=f"dl|{request_id}|{it['format_id']}")])
+    for idx, it in enumerate(items[:30]):
+        rows.append([InlineKeyboardButton(text=it["label"], callback_data=f"dl|{request_id}|{idx}")])
     rows.append([InlineKeyboardButton(text="Cancelar", callback_data=f"dl|{request_id}|__cancel__")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def links_keyboard(items: list[dict]) -> InlineKeyboardMarkup:
-    # items: [{label, file_path}]
+def batch_keyboard(request_id: str, policies: dict[str, str]) -> InlineKeyboardMarkup:
+    # policies: {política: rótulo}; a mesma escolha vale para todos os itens
+    rows = [
+        [InlineKeyboardButton(text=label, callback_data=f"batch|{request_id}|{policy}")]
+        for policy, label in policies.items()
+    ]
+    rows.append([InlineKeyboardButton(text="Cancelar", callback_data=f"batch|{request_id}|__cancel__")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def links_keyboard(items: list[dict], page: int = 0, has_next: bool = False, query: str = "") -> InlineKeyboardMarkup:
+    # items: [{label, record_id}]
     rows = []
     for it in items[:30]:
-        rows.append([InlineKeyboardButton(text=it["label"], callback_data=f"links|send|{it['file']}")])
+        rows.append([InlineKeyboardButton(text=it["label"], callback_data=f"links|send|{it['record_id']}")])
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="« Anteriores", callback_data=f"links|page|{page - 1}|{query}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Próximos »", callback_data=f"links|page|{page + 1}|{query}"))
+    if nav:
+        rows.append(nav)
     return InlineKeyboardMarkup(inline_keyboard=rows)
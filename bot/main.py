@@ -1,43 +1,238 @@
 import asyncio
 import logging
+import signal
+from pathlib import Path
+
+from aiohttp import web
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from bot.config import load_settings
 from bot.handlers.start import router as start_router
-from bot.handlers.download import router as download_router, worker_loop
+from bot.handlers.download import (
+    CANCELLED, batch_sync_loop, router as download_router, queue_status_loop, restore_batches, worker_loop,
+)
 from bot.handlers.links import router as links_router
 from bot.services.queue_service import QueueService
+from bot.services.job_store import open_job_store
 from bot.services.storage_service import StorageService
-from bot.services.cleanup_service import CleanupService
+from bot.services.disk_service import DiskService
+from bot.services.file_cache import FileIdCache
+from bot.services.info_cache import InfoCache
+from bot.services.pending_store import PendingStore
+from bot.services.progress_service import ProgressService
+from bot.services.telegram_session import build_session
+from bot.services import (
+    bandwidth, download_profiles, io_executor, loop_monitor, metrics, proxy_pool, site_limiter,
+    transcode_service, ytdlp_service,
+)
+
+ROLES = ("all", "frontend", "worker")
+
+def _fsm_storage(settings):
+    # Estado do FSM em Redis quando há REDIS_URL (sobrevive a restarts do
+    # front-end); senão em memória
+    if settings.redis_url:
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("REDIS_URL exige o pacote redis (pip install -r requirements-redis.txt)") from e
+        return RedisStorage.from_url(settings.redis_url)
+    return MemoryStorage()
+
+async def _wait_for_signal() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+async def _run_webhook(bot: Bot, dp: Dispatcher, settings) -> None:
+    # Updates chegam por HTTP (aiohttp); o Telegram manda o segredo no header
+    # X-Telegram-Bot-Api-Secret-Token
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=settings.webhook_secret).register(
+        app, path=settings.webhook_path
+    )
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+    await bot.set_webhook(
+        settings.webhook_url + settings.webhook_path,
+        secret_token=settings.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info("Webhook em %s:%d%s", settings.webhook_host, settings.webhook_port, settings.webhook_path)
+    try:
+        await _wait_for_signal()
+    finally:
+        await runner.cleanup()
 
 async def main():
     logging.basicConfig(level=logging.INFO)
 
     settings = load_settings()
+    io_executor.configure(settings.io_threads)
+    ytdlp_service.configure(settings.ytdlp_executor, settings.ytdlp_pool_size)
+    transcode_service.configure(settings.transcode_concurrency)
+    download_profiles.configure(settings.fragment_concurrency, settings.http_chunk_mb, settings.large_file_mb)
+    bandwidth.configure(settings.download_bandwidth_mbps, settings.user_bandwidth_mbps)
+    proxies = proxy_pool.configure(
+        proxy_pool.load_proxies(settings.http_proxy, settings.proxy_list, settings.proxy_file),
+        settings.proxy_probe_url,
+        settings.proxy_probe_interval_seconds,
+    )
+    site_limiter.configure(
+        settings.site_start_concurrency,
+        settings.site_max_concurrency or settings.global_concurrency,
+        settings.site_limits,
+    )
+
+    disk = DiskService(
+        settings.data_dir,
+        settings.temp_ttl_seconds,
+        settings.disk_quota_mb,
+        settings.disk_min_free_mb,
+        settings.sweep_interval_seconds,
+        settings.orphan_max_age_seconds,
+    )
+
+    if settings.metrics_port:
+        metrics.REGISTRY.enabled = True
+        metrics.track_temp_bytes(lambda: disk.used_bytes)
+        await metrics.serve_metrics(settings.metrics_host, settings.metrics_port)
 
-    bot = Bot(token=settings.bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
+    if settings.bot_role not in ROLES:
+        raise RuntimeError(f"BOT_ROLE inválido: {settings.bot_role!r} (use all, frontend ou worker)")
+    front = settings.bot_role in ("all", "frontend")
+    work = settings.bot_role in ("all", "worker")
+
+    bot = Bot(token=settings.bot_token, session=build_session(settings))
+    dp = Dispatcher(storage=_fsm_storage(settings))
 
     # Dependências (injeção simples via dp["..."])
     dp["settings"] = settings
-    dp["queue"] = QueueService(settings.global_concurrency, settings.per_user_concurrency)
+    job_store = open_job_store(settings.job_store, settings.data_dir, settings.redis_url)
+    # Fila compartilhada: front-end só grava no store, workers reivindicam dele
+    shared = settings.bot_role != "all" or settings.job_store == "redis"
+    if shared and not job_store.shared:
+        raise RuntimeError(f"BOT_ROLE={settings.bot_role} exige JOB_STORE=sqlite ou redis")
+    dp["queue"] = QueueService(
+        settings.global_concurrency, settings.per_user_concurrency, job_store, frontend_only=shared,
+        aging_mb_per_minute=settings.queue_aging_mb_per_minute, unknown_mb=settings.max_upload_mb,
+    )
     dp["storage"] = StorageService(settings.data_dir)
-    dp["cleanup"] = CleanupService(settings.temp_ttl_seconds)
+    migrated = dp["storage"].migrate_link_records()
+    if migrated:
+        logging.info("Histórico: %d registro(s) JSON importados para o índice", migrated)
+    dp["disk"] = disk
+    dp["file_cache"] = FileIdCache(settings.data_dir)
+    dp["pending"] = PendingStore(settings.pending_ttl_seconds, settings.pending_max_entries, settings.pending_max_mb)
+    progress = ProgressService(bot, settings.progress_interval_seconds, settings.progress_edits_per_second)
+    dp["progress"] = progress
+
+    async def fetch_info(url: str) -> dict:
+        return await ytdlp_service.extract_info(url, settings.ytdlp_cookies_file, settings.batch_max_items)
+
+    info_cache = InfoCache(
+        fetch_info,
+        settings.info_cache_ttl_seconds,
+        settings.info_cache_max_mb,
+        Path(settings.data_dir) / "cache" / "info.json.gz" if settings.info_cache_persist else None,
+    )
+    dp["info_cache"] = info_cache
 
     # Routers
     dp.include_router(start_router)
     dp.include_router(links_router)
     dp.include_router(download_router)
 
-    # Worker (fila)
-    queue = dp["queue"]
-    storage = dp["storage"]
-    cleanup = dp["cleanup"]
-    asyncio.create_task(worker_loop(bot, queue, storage, cleanup, settings))
+    tasks = [
+        asyncio.create_task(job_store.run_flusher()),
+        asyncio.create_task(progress.run()),
+        asyncio.create_task(proxies.run_health_checks()),
+        asyncio.create_task(dp["storage"].run_flusher()),
+    ]
+    if settings.loop_lag_threshold_ms > 0:
+        tasks.append(asyncio.create_task(loop_monitor.run_loop_monitor(settings.loop_lag_threshold_ms)))
+    if front:
+        info_cache.load()
+        tasks.append(asyncio.create_task(info_cache.run_maintenance()))
+        if shared:
+            # Itens de lote rodam nos workers: resultado e resumo vêm do store
+            tasks.append(asyncio.create_task(batch_sync_loop(bot, job_store)))
+
+    if work:
+        # Workers (fila): um por vaga global. Em modo compartilhado a fila
+        # local é alimentada pelo feeder com o que este processo reivindicou.
+        queue = dp["queue"]
+        if shared:
+            queue = QueueService(
+                settings.global_concurrency, settings.per_user_concurrency, job_store,
+                aging_mb_per_minute=settings.queue_aging_mb_per_minute, unknown_mb=settings.max_upload_mb,
+            )
+            tasks.append(asyncio.create_task(
+                queue.run_feeder(settings.worker_id, CANCELLED.update, settings.lease_seconds)
+            ))
+        storage = dp["storage"]
+        file_cache = dp["file_cache"]
+        tasks.extend(
+            asyncio.create_task(worker_loop(bot, queue, storage, disk, file_cache, progress, settings))
+            for _ in range(queue.global_concurrency)
+        )
+        if settings.queue_status_interval_seconds > 0:
+            tasks.append(asyncio.create_task(
+                queue_status_loop(queue, progress, settings.queue_status_interval_seconds)
+            ))
+
+        # Jobs interrompidos pelo último restart voltam para a fila (no modo
+        # compartilhado quem devolve é o lease vencido)
+        restored = [] if shared else await queue.restore()
+        if restored:
+            logging.info("Retomando %d job(s) da fila persistida", len(restored))
+        restore_batches(restored, progress)
+
+        async def unfinished_dirs() -> set[Path]:
+            # O store também lista jobs ainda não reivindicados e os de outros
+            # workers que usam o mesmo volume
+            jobs = queue.held_jobs() + await io_executor.run(job_store.load_unfinished)
+            return {storage.job_dir(j.user_id, j.job_id) for j in jobs}
+
+        # Só depois do restore: a primeira varredura já vê os jobs retomados
+        disk.track_unfinished(unfinished_dirs)
+        tasks.append(asyncio.create_task(disk.run_sweeper()))
+        for job in restored:
+            if job.batch_id:
+                continue
+            try:
+                await bot.edit_message_text(
+                    chat_id=job.chat_id, message_id=job.message_id,
+                    text="Bot reiniciado. Seu pedido voltou para a fila...",
+                )
+            except Exception:
+                pass
 
-    await dp.start_polling(bot)
+    try:
+        if front and settings.webhook_url:
+            await _run_webhook(bot, dp, settings)
+        elif front:
+            await dp.start_polling(bot)
+        else:
+            logging.info("Worker %s consumindo a fila compartilhada", settings.worker_id)
+            await _wait_for_signal()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # O flusher grava o que ainda está pendente ao ser cancelado
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if front:
+            info_cache.save()
+        ytdlp_service.shutdown()
+        job_store.close()
+        io_executor.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
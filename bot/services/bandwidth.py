@@ -0,0 +1,107 @@
+from __future__ import annotations
+import math
+import threading
+import time
+
+# Orçamento de banda dos downloads: um teto global (DOWNLOAD_BANDWIDTH_MBPS)
+# e um por usuário (USER_BANDWIDTH_MBPS), repartidos em max-min justo:
+# primeiro entre usuários, depois entre os jobs de cada usuário. Quem usa
+# menos do que recebeu (site lento) só "pede" um pouco acima do que está
+# baixando, e a sobra vai para os outros. O yt-dlp lê share() como
+# ratelimit; progress_cb informa a velocidade real por observe().
+# Chamado de threads do executor: tudo sob um lock.
+
+# Job abaixo disso do que recebeu é considerado limitado pela origem...
+UNDERUSE_RATIO = 0.8
+# ...e pede essa folga sobre a velocidade atual, para poder crescer
+HEADROOM = 1.5
+REBALANCE_INTERVAL = 1.0
+
+def _water_fill(capacity: float, demands: dict) -> dict:
+    # Max-min: atende as menores demandas por inteiro e divide o resto igual
+    if math.isinf(capacity):
+        return dict(demands)
+    out = {}
+    left = capacity
+    pending = sorted(demands.items(), key=lambda kv: kv[1])
+    for i, (key, demand) in enumerate(pending):
+        give = min(demand, left / (len(pending) - i))
+        out[key] = give
+        left -= give
+    return out
+
+class _Job:
+    __slots__ = ("user_id", "speed", "share")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.speed: float | None = None
+        self.share = math.inf
+
+    def demand(self) -> float:
+        if self.speed and not math.isinf(self.share) and self.speed < self.share * UNDERUSE_RATIO:
+            return self.speed * HEADROOM
+        return math.inf
+
+class BandwidthBudget:
+    def __init__(self, total_bps: float = 0, user_bps: float = 0):
+        self.total = total_bps if total_bps > 0 else math.inf
+        self.per_user = user_bps if user_bps > 0 else math.inf
+        self.jobs: dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._balanced_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return not (math.isinf(self.total) and math.isinf(self.per_user))
+
+    def register(self, job_id: str, user_id: int) -> None:
+        with self._lock:
+            self.jobs[job_id] = _Job(user_id)
+            self._rebalance()
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            if self.jobs.pop(job_id, None) is not None:
+                self._rebalance()
+
+    def observe(self, job_id: str, speed: float | None) -> None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and speed:
+                job.speed = float(speed)
+
+    def share(self, job_id: str) -> float | None:
+        # bytes/s para o job agora, ou None sem limite
+        with self._lock:
+            if time.monotonic() - self._balanced_at >= REBALANCE_INTERVAL:
+                self._rebalance()
+            job = self.jobs.get(job_id)
+            if job is None or math.isinf(job.share):
+                return None
+            return max(1.0, job.share)
+
+    def _rebalance(self) -> None:
+        self._balanced_at = time.monotonic()
+        by_user: dict[int, dict[str, float]] = {}
+        for job_id, job in self.jobs.items():
+            by_user.setdefault(job.user_id, {})[job_id] = job.demand()
+        user_demand = {u: min(self.per_user, sum(d.values())) for u, d in by_user.items()}
+        user_share = _water_fill(self.total, user_demand)
+        for user_id, demands in by_user.items():
+            for job_id, share in _water_fill(user_share[user_id], demands).items():
+                self.jobs[job_id].share = share
+
+_budget: BandwidthBudget | None = None
+
+def configure(total_mbps: float, user_mbps: float) -> BandwidthBudget:
+    # Mbps (megabits/s) na configuração, bytes/s por dentro
+    global _budget
+    _budget = BandwidthBudget(total_mbps * 1e6 / 8, user_mbps * 1e6 / 8)
+    return _budget
+
+def get_budget() -> BandwidthBudget:
+    global _budget
+    if _budget is None:
+        _budget = BandwidthBudget()
+    return _budget
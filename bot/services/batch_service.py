@@ -0,0 +1,98 @@
+from __future__ import annotations
+import logging
+import threading
+
+from bot.services.progress_service import ProgressService, ProgressTracker
+
+# Modo lote: cada item vira um DownloadJob normal (fila justa, limite por
+# usuário, dedup, cache de file_id), mas com batch_id. Em vez de uma mensagem
+# por item, o lote tem uma mensagem só, com progresso agregado e, no fim, um
+# resumo. Com fila compartilhada os itens rodam em outros processos: o
+# front-end lê o resultado deles no store (batch_sync_loop) e só mostra os
+# itens concluídos, sem a porcentagem dos que estão em andamento.
+
+MAX_FAILURES_LISTED = 10
+
+class Batch:
+    def __init__(
+        self,
+        batch_id: str,
+        chat_id: int,
+        message_id: int,
+        title: str | None,
+        total: int,
+        progress: ProgressService,
+    ):
+        self.batch_id = batch_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.title = title
+        self.total = total
+        self.results: dict[str, int] = {"done": 0, "failed": 0, "cancelled": 0}
+        # job_id -> fração baixada (0..1) dos itens em andamento. Escrito pelo
+        # hook de progresso (threads do executor) e lido no loop: sob o lock
+        self.running: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.failures: list[str] = []
+        # job_id -> título dos itens ainda sem resultado; cada item conta uma
+        # vez, mesmo que o resultado chegue pelo worker local e pelo store
+        self.pending: dict[str, str | None] = {}
+        self.tracker: ProgressTracker = progress.track(lambda: [self], self.render())
+
+    @property
+    def finished(self) -> int:
+        return sum(self.results.values())
+
+    def render(self) -> str:
+        head = f"Lote: {self.title}\n" if self.title else "Lote\n"
+        line = f"{self.results['done']}/{self.total} enviados"
+        with self._lock:
+            fractions = list(self.running.values())
+        if fractions:
+            pct = 100 * sum(fractions) / len(fractions)
+            line += f" | baixando {len(fractions)} ({pct:.0f}%)"
+        if self.results["failed"]:
+            line += f" | {self.results['failed']} falha(s)"
+        return head + line
+
+    def add_item(self, job_id: str, title: str | None) -> None:
+        self.pending[job_id] = title
+
+    def item_progress(self, job_id: str, fraction: float) -> None:
+        # Chamado pelo hook de progresso (fora do event loop): só atualiza o texto
+        with self._lock:
+            self.running[job_id] = min(1.0, max(0.0, fraction))
+        self.tracker.update(self.render())
+
+    def record(self, job_id: str, title: str | None, state: str, text: str) -> bool:
+        # Registra o fim de um item; True quando o lote inteiro terminou
+        if job_id not in self.pending:
+            return False
+        del self.pending[job_id]
+        with self._lock:
+            self.running.pop(job_id, None)
+        self.results[state] = self.results.get(state, 0) + 1
+        if state == "failed":
+            self.failures.append(f"- {title or 'item'}: {text}")
+        self.tracker.update(self.render())
+        return self.finished >= self.total
+
+    def summary(self) -> str:
+        r = self.results
+        lines = [
+            f"Lote concluído{': ' + self.title if self.title else ''}",
+            f"{r['done']} enviado(s), {r['failed']} falha(s), {r['cancelled']} cancelado(s) de {self.total}.",
+        ]
+        if self.failures:
+            lines.append("")
+            lines.extend(self.failures[:MAX_FAILURES_LISTED])
+            if len(self.failures) > MAX_FAILURES_LISTED:
+                lines.append(f"... e mais {len(self.failures) - MAX_FAILURES_LISTED}")
+        return "\n".join(lines)
+
+    async def close(self, bot) -> None:
+        await self.tracker.close()
+        try:
+            await bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id, text=self.summary())
+        except Exception as e:
+            logging.info("Falha ao enviar resumo do lote %s: %s", self.batch_id, e)
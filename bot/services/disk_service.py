@@ -0,0 +1,191 @@
+from __future__ import annotations
+import asyncio
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable
+
+from bot.services import io_executor, metrics
+
+# Gerência do espaço temporário (DATA_DIR/users/*/temp/{job_id}):
+# - um único sweeper periódico apaga diretórios de job cujo TTL venceu (antes
+#   era uma task dormindo por job) e os órfãos de crashes/restarts, com os
+#   .part/.ytdl que ficaram dentro deles;
+# - admissão: antes de baixar, o job reserva o tamanho esperado; se passar da
+#   cota (ou do espaço livre mínimo), espera liberar ou é recusado.
+# Diretórios de jobs não finalizados (na fila, restaurados após restart,
+# anexados ou de outro worker no mesmo volume) nunca são órfãos: os .part
+# deles são o que permite retomar o download.
+
+@dataclass
+class _Reservation:
+    dir_path: Path
+    nbytes: int
+
+class DiskService:
+    def __init__(
+        self,
+        data_dir: str,
+        ttl_seconds: int,
+        quota_mb: int,
+        min_free_mb: int,
+        sweep_interval: float,
+        orphan_max_age: float,
+    ):
+        self.data_dir = Path(data_dir)
+        self.ttl_seconds = ttl_seconds
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self.sweep_interval = sweep_interval
+        self.orphan_max_age = orphan_max_age
+        self.used_bytes = 0
+        self.expiries: dict[Path, float] = {}
+        self.reservations: dict[str, _Reservation] = {}
+        self._changed = asyncio.Condition()
+        self._unfinished: Callable[[], Awaitable[Iterable[Path]]] | None = None
+
+    def track_unfinished(self, collect: Callable[[], Awaitable[Iterable[Path]]]) -> None:
+        # Diretórios dos jobs ainda não finalizados (vem da fila/store)
+        self._unfinished = collect
+
+    def temp_roots(self) -> list[Path]:
+        return list((self.data_dir / "users").glob("*/temp"))
+
+    def reserved_bytes(self) -> int:
+        return sum(r.nbytes for r in self.reservations.values())
+
+    def busy_dirs(self) -> set[Path]:
+        return {r.dir_path for r in self.reservations.values()}
+
+    # ---- admissão ----
+
+    async def _fits(self, nbytes: int) -> bool:
+        if self.quota_bytes and self.used_bytes + self.reserved_bytes() + nbytes > self.quota_bytes:
+            return False
+        if self.min_free_bytes:
+            # statvfs num volume de rede pode demorar: fora do loop
+            free = (await io_executor.run(shutil.disk_usage, self.data_dir)).free
+            # Reservas ainda não escritas também vão consumir o espaço livre
+            if free - self.reserved_bytes() - nbytes < self.min_free_bytes:
+                return False
+        return True
+
+    def can_ever_fit(self, nbytes: int) -> bool:
+        return not self.quota_bytes or nbytes <= self.quota_bytes
+
+    async def admit(self, job_id: str, dir_path: Path, nbytes: int, timeout: float) -> bool:
+        # Reserva espaço para o job; espera até `timeout` por liberação
+        if not self.can_ever_fit(nbytes):
+            return False
+        deadline = time.monotonic() + timeout
+        async with self._changed:
+            while not await self._fits(nbytes):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=min(left, self.sweep_interval))
+                except asyncio.TimeoutError:
+                    pass
+            self.reservations[job_id] = _Reservation(dir_path, nbytes)
+        return True
+
+    async def release(self, job_id: str) -> None:
+        # Os arquivos continuam no disco até o TTL: mede o que existe agora
+        # (a medida da última varredura pode já incluir parte deste job, e
+        # somar a reserva contaria o mesmo espaço duas vezes)
+        if job_id not in self.reservations:
+            return
+        used = await io_executor.run(self._measure)
+        async with self._changed:
+            self.reservations.pop(job_id, None)
+            self.used_bytes = used
+            self._changed.notify_all()
+
+    # ---- limpeza ----
+
+    def mark_done(self, dir_path: Path, delay: float | None = None) -> None:
+        # Substitui o antigo schedule_delete_dir: o sweeper apaga após o TTL
+        # (ou `delay`). Vale para sucesso, falha e cancelamento; se marcado
+        # duas vezes, vale o prazo mais curto.
+        expires = time.time() + (self.ttl_seconds if delay is None else delay)
+        self.expiries[dir_path] = min(expires, self.expiries.get(dir_path, expires))
+
+    @staticmethod
+    def _size(entry: Path) -> int:
+        if entry.is_file():
+            return entry.stat().st_size
+        total = 0
+        for p in entry.rglob("*"):
+            try:
+                if p.is_file():
+                    total += p.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    @staticmethod
+    def _remove(entry: Path) -> None:
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+
+    def _scan(self, busy: set[Path], due: list[Path], known: set[Path]) -> int:
+        for d in due:
+            shutil.rmtree(d, ignore_errors=True)
+
+        now = time.time()
+        total = 0
+        for root in self.temp_roots():
+            for entry in root.iterdir():
+                try:
+                    if (
+                        entry not in busy
+                        and entry not in known
+                        and now - entry.stat().st_mtime > self.orphan_max_age
+                    ):
+                        # Sobra de crash/restart (ou arquivo solto de versões
+                        # antigas) que nenhum job vai retomar
+                        self._remove(entry)
+                        logging.info("Removido temporário órfão: %s", entry)
+                        continue
+                    total += self._size(entry)
+                except OSError:
+                    pass
+        return total
+
+    def _measure(self) -> int:
+        total = 0
+        for root in self.temp_roots():
+            for entry in root.iterdir():
+                try:
+                    total += self._size(entry)
+                except OSError:
+                    pass
+        return total
+
+    async def sweep(self) -> None:
+        now = time.time()
+        busy = self.busy_dirs()
+        if self._unfinished is not None:
+            busy |= set(await self._unfinished())
+        due = [d for d, t in self.expiries.items() if t <= now and d not in busy]
+        for d in due:
+            self.expiries.pop(d, None)
+
+        with metrics.STAGE_SECONDS.time(stage="cleanup"):
+            self.used_bytes = await io_executor.run(self._scan, busy, due, set(self.expiries))
+
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def run_sweeper(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logging.exception("Falha no sweeper de temporários")
+            await asyncio.sleep(self.sweep_interval)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+from dataclasses import dataclass
+
+# Perfis de download do yt-dlp, escolhidos pelo protocolo do formato e pelo
+# tamanho estimado:
+# - segmented (HLS/DASH/ISM): vários fragmentos em paralelo — cada fragmento é
+#   uma requisição curta, então a latência domina se forem um por vez;
+# - progressive_large (HTTP, arquivo grande): pedaços de http_chunk_size por
+#   requisição (contorna o throttle por conexão de sites como o YouTube) e
+#   buffer de leitura maior;
+# - progressive (HTTP, arquivo pequeno): só o buffer;
+# - default (protocolo desconhecido, ex.: lote por política): paralelismo de
+#   fragmentos moderado, que não tem efeito em downloads HTTP simples.
+
+MB = 1024 * 1024
+
+SEGMENTED_PROTOCOLS = ("m3u8", "m3u8_native", "http_dash_segments", "dash", "ism", "f4m", "dash_frag_urls")
+
+@dataclass(frozen=True, slots=True)
+class DownloadProfile:
+    name: str
+    concurrent_fragments: int = 1
+    http_chunk_size: int | None = None
+    buffersize: int | None = None
+
+    def opts(self) -> dict:
+        opts: dict = {"concurrent_fragment_downloads": self.concurrent_fragments}
+        if self.http_chunk_size:
+            opts["http_chunk_size"] = self.http_chunk_size
+        if self.buffersize:
+            opts["buffersize"] = self.buffersize
+        return opts
+
+def build_profiles(fragments: int, chunk_mb: int) -> dict[str, DownloadProfile]:
+    fragments = max(1, fragments)
+    return {
+        "segmented": DownloadProfile("segmented", concurrent_fragments=fragments),
+        "progressive_large": DownloadProfile(
+            "progressive_large", http_chunk_size=chunk_mb * MB if chunk_mb > 0 else None, buffersize=MB,
+        ),
+        "progressive": DownloadProfile("progressive", buffersize=256 * 1024),
+        "default": DownloadProfile("default", concurrent_fragments=max(1, fragments // 2)),
+    }
+
+_profiles = build_profiles(8, 10)
+_large_mb = 100.0
+
+def configure(fragments: int, chunk_mb: int, large_mb: float) -> None:
+    global _profiles, _large_mb
+    _profiles = build_profiles(fragments, chunk_mb)
+    _large_mb = large_mb
+
+def choose_profile(protocol: str | None, filesize_mb: float | None) -> DownloadProfile:
+    if not protocol:
+        return _profiles["default"]
+    # Formatos com merge vêm como "m3u8_native+https": qualquer parte
+    # segmentada já ganha com fragmentos em paralelo
+    parts = protocol.split("+")
+    if any(p in SEGMENTED_PROTOCOLS for p in parts):
+        return _profiles["segmented"]
+    if filesize_mb is not None and filesize_mb >= _large_mb:
+        return _profiles["progressive_large"]
+    return _profiles["progressive"]
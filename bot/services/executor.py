@@ -0,0 +1,207 @@
+from __future__ import annotations
+import asyncio
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+# Onde roda o trabalho pesado do yt-dlp (extração, assinaturas JS, hooks):
+# - "thread": pool de threads limitado; simples, mas o código Python do
+#   yt-dlp disputa o GIL com o event loop do aiogram;
+# - "process": pool persistente de processos (spawn). Cada processo importa o
+#   yt-dlp uma vez (warmup) e mantém suas instâncias; progresso volta por uma
+#   fila multiprocessing e o cancelamento vai por um flag em memória
+#   compartilhada, um slot por job.
+#
+# run_job(fn, args, cancel_check, progress_cb, rate_fn) chama fn(*args,
+# cancel_check, progress_cb, rate_limit) no worker. Nos dois modos progress_cb
+# é chamado fora do event loop (thread do worker ou thread leitora da fila).
+# rate_limit() devolve o limite de banda atual do job (bytes/s ou None): no
+# modo process o valor de rate_fn() é copiado para memória compartilhada a
+# cada CANCEL_POLL_INTERVAL.
+
+PROGRESS_MIN_INTERVAL = 0.5
+CANCEL_POLL_INTERVAL = 0.5
+
+def _no_limit() -> None:
+    return None
+
+def throttle_progress(progress_cb: Callable[[dict], None]) -> Callable[[dict], None]:
+    # O hook do yt-dlp dispara a cada bloco baixado. Mudança de status sempre
+    # passa (o pipeline depende do primeiro "downloading"); o resto é
+    # limitado a um a cada PROGRESS_MIN_INTERVAL. Igual nos dois modos.
+    last = 0.0
+    last_status = None
+
+    def cb(d: dict) -> None:
+        nonlocal last, last_status
+        now = time.monotonic()
+        status = d.get("status")
+        if status == last_status and now - last < PROGRESS_MIN_INTERVAL:
+            return
+        last, last_status = now, status
+        progress_cb(d)
+
+    return cb
+
+class ThreadBackend:
+    kind = "thread"
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.pool = ThreadPoolExecutor(self.size, thread_name_prefix="ytdlp")
+
+    async def run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def run_job(
+        self,
+        fn: Callable,
+        args: tuple,
+        cancel_check: Callable[[], bool],
+        progress_cb: Callable[[dict], None],
+        rate_fn: Callable[[], float | None] | None = None,
+    ) -> Any:
+        return await self.run(fn, *args, cancel_check, throttle_progress(progress_cb), rate_fn or _no_limit)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+# ---- lado do processo worker ----
+
+_PROGRESS = None
+_CANCEL = None
+_RATES = None
+
+def _init_worker(progress_q, cancel_flags, rates, warmup: Callable[[], None] | None) -> None:
+    global _PROGRESS, _CANCEL, _RATES
+    _PROGRESS = progress_q
+    _CANCEL = cancel_flags
+    _RATES = rates
+    if warmup is not None:
+        warmup()
+
+# Campos do dict de progresso que atravessam o processo (o resto do dict do
+# yt-dlp tem objetos que não serializam e ninguém aqui usa)
+PROGRESS_KEYS = (
+    "status", "filename", "tmpfilename", "downloaded_bytes", "total_bytes",
+    "total_bytes_estimate", "speed", "_percent_str", "_speed_str", "_eta_str",
+)
+
+def _job_entry(fn: Callable, slot: int, args: tuple) -> Any:
+    def cancel_check() -> bool:
+        return _CANCEL[slot] == 1
+
+    def rate_limit() -> float | None:
+        return _RATES[slot] or None
+
+    def send_progress(d: dict) -> None:
+        _PROGRESS.put((slot, {k: d[k] for k in PROGRESS_KEYS if k in d}))
+
+    try:
+        return fn(*args, cancel_check, throttle_progress(send_progress), rate_limit)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            # A exceção original não volta pelo pool: preserva tipo e mensagem
+            raise RuntimeError(f"{type(e).__name__}: {e}") from None
+        raise
+
+# ---- lado do bot ----
+
+class ProcessBackend:
+    kind = "process"
+
+    def __init__(self, size: int, warmup: Callable[[], None] | None = None, slots: int = 256):
+        self.size = max(1, size)
+        ctx = multiprocessing.get_context("spawn")
+        self._progress = ctx.Queue()
+        self._cancel = ctx.Array("b", slots, lock=False)
+        self._rates = ctx.Array("d", slots, lock=False)
+        self._free = list(range(slots))
+        self._slot_freed = asyncio.Condition()
+        self._callbacks: dict[int, Callable[[dict], None]] = {}
+        self.pool = ProcessPoolExecutor(
+            self.size, mp_context=ctx, initializer=_init_worker,
+            initargs=(self._progress, self._cancel, self._rates, warmup),
+        )
+        self._reader = threading.Thread(target=self._read_progress, name="ytdlp-progress", daemon=True)
+        self._reader.start()
+
+    def _read_progress(self) -> None:
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            slot, d = item
+            cb = self._callbacks.get(slot)
+            if cb is None:
+                continue
+            try:
+                cb(d)
+            except Exception:
+                logging.exception("Falha no callback de progresso")
+
+    async def run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def _acquire_slot(self) -> int:
+        async with self._slot_freed:
+            while not self._free:
+                await self._slot_freed.wait()
+            return self._free.pop()
+
+    def _release_slot(self, slot: int) -> None:
+        self._callbacks.pop(slot, None)
+        self._free.append(slot)
+
+        async def notify():
+            async with self._slot_freed:
+                self._slot_freed.notify()
+
+        asyncio.ensure_future(notify())
+
+    async def run_job(
+        self,
+        fn: Callable,
+        args: tuple,
+        cancel_check: Callable[[], bool],
+        progress_cb: Callable[[dict], None],
+        rate_fn: Callable[[], float | None] | None = None,
+    ) -> Any:
+        slot = await self._acquire_slot()
+        self._cancel[slot] = 0
+        self._rates[slot] = (rate_fn() or 0.0) if rate_fn else 0.0
+        self._callbacks[slot] = progress_cb
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self.pool, _job_entry, fn, slot, args)
+        # O slot só volta ao pool quando o processo terminou de usá-lo
+        fut.add_done_callback(lambda _: self._release_slot(slot))
+        try:
+            while True:
+                done, _ = await asyncio.wait({fut}, timeout=CANCEL_POLL_INTERVAL)
+                if done:
+                    return fut.result()
+                if cancel_check():
+                    self._cancel[slot] = 1
+                if rate_fn:
+                    self._rates[slot] = rate_fn() or 0.0
+        finally:
+            if not fut.done():
+                # Task cancelada (ex.: shutdown): o worker para no próximo hook
+                self._cancel[slot] = 1
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self._progress.put(None)
+
+def create_executor(kind: str, size: int, warmup: Callable[[], None] | None = None):
+    if kind == "process":
+        return ProcessBackend(size, warmup)
+    if kind != "thread":
+        raise RuntimeError(f"YTDLP_EXECUTOR inválido: {kind!r} (use thread ou process)")
+    return ThreadBackend(size)
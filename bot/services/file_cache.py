@@ -0,0 +1,133 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from bot.services import io_executor, metrics
+
+# Cache global de file_id do Telegram, endereçado pelo conteúdo
+# (extractor, id do vídeo, format_id). Um file_id vale para qualquer chat do
+# mesmo bot, então um hit reenvia o arquivo sem baixar nem fazer upload.
+
+@dataclass(frozen=True)
+class CachedFile:
+    file_id: str
+    kind: str  # "video" | "audio" | "document"
+    filename: str | None
+    # Arquivo enviado em partes (acima do limite): file_id de cada parte, em ordem
+    parts: tuple[str, ...] = ()
+
+def cache_key(info: dict, format_id: str) -> tuple[str, str, str] | None:
+    extractor = info.get("extractor_key") or info.get("extractor")
+    vid = info.get("id")
+    if not extractor or not vid:
+        return None
+    return (str(extractor).lower(), str(vid), format_id)
+
+class FileIdCache:
+    def __init__(self, data_dir: str):
+        self.path = Path(data_dir) / "cache" / "file_ids.sqlite3"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                " extractor TEXT NOT NULL,"
+                " video_id TEXT NOT NULL,"
+                " format_id TEXT NOT NULL,"
+                " file_id TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " filename TEXT,"
+                " created_at REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " parts TEXT,"
+                " PRIMARY KEY (extractor, video_id, format_id))"
+            )
+            cols = {row[1] for row in conn.execute("PRAGMA table_info(file_ids)")}
+            if "parts" not in cols:
+                conn.execute("ALTER TABLE file_ids ADD COLUMN parts TEXT")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, key: tuple[str, str, str]) -> CachedFile | None:
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT file_id, kind, filename, parts FROM file_ids WHERE extractor=? AND video_id=? AND format_id=?",
+                key,
+            ).fetchone()
+            if row:
+                db.execute(
+                    "UPDATE file_ids SET hits = hits + 1 WHERE extractor=? AND video_id=? AND format_id=?",
+                    key,
+                )
+                db.commit()
+        if not row:
+            return None
+        parts = tuple(row[3].split("\n")) if row[3] else ()
+        return CachedFile(file_id=row[0], kind=row[1], filename=row[2], parts=parts)
+
+    def _put_sync(self, key: tuple[str, str, str], cached: CachedFile) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO file_ids (extractor, video_id, format_id, file_id, kind, filename, created_at, parts)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, cached.file_id, cached.kind, cached.filename, time.time(), "\n".join(cached.parts) or None),
+            )
+            db.commit()
+
+    def _evict_sync(self, key: tuple[str, str, str]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM file_ids WHERE extractor=? AND video_id=? AND format_id=?", key)
+            db.commit()
+
+    async def get(self, key: tuple[str, str, str] | None) -> CachedFile | None:
+        if key is None:
+            return None
+        cached = await io_executor.run(self._get_sync, key)
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache="file_id", result="miss" if cached is None else "hit")
+        return cached
+
+    async def put(self, key: tuple[str, str, str] | None, cached: CachedFile) -> None:
+        if key is None:
+            return
+        await io_executor.run(self._put_sync, key, cached)
+
+    async def evict(self, key: tuple[str, str, str] | None) -> None:
+        # Chamado quando o Telegram rejeita o file_id (apagado/inválido)
+        if key is None:
+            return
+        self.evictions += 1
+        await io_executor.run(self._evict_sync, key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
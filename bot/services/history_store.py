@@ -0,0 +1,132 @@
+from __future__ import annotations
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Histórico de links em SQLite com índice por (usuário, data). Substitui o
+# JSON por download em users/{id}/links, que exigia glob + stat de todos os
+# arquivos a cada /links.
+
+class HistoryStore:
+    INSERT_SQL = (
+        "INSERT INTO links (user_id, created_at, timestamp, original_url, video_id, title, uploader, duration, selected)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " original_url TEXT NOT NULL,"
+            " video_id TEXT,"
+            " title TEXT,"
+            " uploader TEXT,"
+            " duration REAL,"
+            " selected TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS links_user_time ON links (user_id, created_at DESC)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    @staticmethod
+    def _params(user_id: int, payload: dict, created_at: float | None) -> tuple:
+        return (
+            user_id,
+            created_at if created_at is not None else time.time(),
+            payload["timestamp"],
+            payload["original_url"],
+            payload.get("id"),
+            payload.get("title"),
+            payload.get("uploader"),
+            payload.get("duration"),
+            json.dumps(payload.get("selected"), ensure_ascii=False),
+        )
+
+    def add(self, user_id: int, payload: dict, created_at: float | None = None) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute(self.INSERT_SQL, self._params(user_id, payload, created_at))
+            return cur.lastrowid
+
+    def add_many(self, rows: list[tuple[int, dict, float]]) -> None:
+        # (user_id, payload, created_at) numa transação só
+        with self._lock, self._conn:
+            self._conn.executemany(self.INSERT_SQL, [self._params(u, p, t) for u, p, t in rows])
+
+    def _where(self, user_id: int, query: str | None) -> tuple[str, tuple]:
+        if query:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return "user_id=? AND title LIKE ? ESCAPE '\\'", (user_id, f"%{escaped}%")
+        return "user_id=?", (user_id,)
+
+    def list(self, user_id: int, limit: int, offset: int = 0, query: str | None = None) -> list[dict]:
+        where, params = self._where(user_id, query)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM links WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def count(self, user_id: int, query: str | None = None) -> int:
+        where, params = self._where(user_id, query)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM links WHERE {where}", params).fetchone()[0]
+
+    def get(self, user_id: int, record_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM links WHERE id=? AND user_id=?", (record_id, user_id)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    @staticmethod
+    def _row(r: sqlite3.Row) -> dict:
+        return {
+            "record_id": r["id"],
+            "timestamp": r["timestamp"],
+            "original_url": r["original_url"],
+            "id": r["video_id"],
+            "title": r["title"],
+            "uploader": r["uploader"],
+            "duration": r["duration"],
+            "selected": json.loads(r["selected"]) if r["selected"] else None,
+        }
+
+    def migrate_json_records(self, users_dir: Path) -> int:
+        # Importa uma única vez os registros antigos (um JSON por download).
+        # Os arquivos ficam onde estão; só não são mais lidos.
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key='json_migrated'").fetchone()
+        if done:
+            return 0
+
+        rows = []
+        for f in users_dir.glob("*/links/*.json"):
+            try:
+                user_id = int(f.parent.parent.name)
+                payload = json.loads(f.read_text(encoding="utf-8"))
+                rows.append(self._params(user_id, payload, f.stat().st_mtime))
+            except Exception as e:
+                logging.warning("Registro antigo ignorado na migração (%s): %s", f, e)
+
+        # Uma transação só, inclusive a marca de migração concluída
+        with self._lock, self._conn:
+            self._conn.executemany(self.INSERT_SQL, rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(len(rows)),))
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
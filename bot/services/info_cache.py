@@ -0,0 +1,212 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from bot.services import io_executor, metrics
+
+# Cache LRU + TTL dos metadados extraídos pelo yt-dlp, com
+# stale-while-revalidate: perto de expirar, a entrada ainda é servida e a
+# extração roda de novo em background.
+
+TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid", "igshid", "ref", "ref_src", "pp"}
+
+# Só o que build_options e o histórico usam; o resto (thumbnails, legendas,
+# headers, URLs assinadas) é descartado para o cache caber na memória.
+INFO_KEYS = ("id", "title", "extractor", "extractor_key", "uploader", "channel", "duration", "webpage_url")
+ENTRY_KEYS = ("url", "webpage_url", "id", "title", "ie_key", "duration")
+FORMAT_KEYS = (
+    "format_id", "ext", "vcodec", "acodec", "height", "width", "fps",
+    "abr", "vbr", "tbr", "filesize", "filesize_approx", "protocol", "container",
+)
+
+def canonical_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip("/")
+
+    if host == "youtu.be" and path:
+        host, query = "youtube.com", urlencode({"v": path.lstrip("/")})
+        path = "/watch"
+    else:
+        pairs = [
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k not in TRACKING_PARAMS and not k.startswith("utm_")
+        ]
+        query = urlencode(sorted(pairs))
+
+    return urlunsplit(("https", host, path, query, ""))
+
+def trim_info(info: dict) -> dict:
+    out = {k: info.get(k) for k in INFO_KEYS if info.get(k) is not None}
+    out["formats"] = [
+        {k: f.get(k) for k in FORMAT_KEYS if f.get(k) is not None}
+        for f in info.get("formats") or []
+    ]
+    if info.get("_type") == "playlist":
+        # Playlist flat: só o necessário para enfileirar cada item
+        out["_type"] = "playlist"
+        out["entries"] = [
+            {k: e.get(k) for k in ENTRY_KEYS if e.get(k) is not None}
+            for e in info.get("entries") or []
+            if e
+        ]
+    return out
+
+@dataclass
+class _Entry:
+    info: dict
+    size: int
+    fetched_at: float
+    expires_at: float
+    refresh_at: float
+
+class InfoCache:
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[dict]],
+        ttl_seconds: int,
+        max_mb: int,
+        persist_path: Path | None = None,
+    ):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_mb * 1024 * 1024
+        self.persist_path = persist_path
+        self.entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._refreshing: set[str] = set()
+
+    async def get(self, url: str) -> dict:
+        key = canonical_url(url)
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            self.hits += 1
+            metrics.CACHE_LOOKUPS.inc(cache="info", result="hit")
+            self.entries.move_to_end(key)
+            if entry.refresh_at <= now:
+                self._refresh_in_background(key, url)
+            return entry.info
+
+        self.misses += 1
+        metrics.CACHE_LOOKUPS.inc(cache="info", result="miss")
+        return await self._load(key, url)
+
+    async def _load(self, key: str, url: str) -> dict:
+        # Várias mensagens com o mesmo link ao mesmo tempo => uma extração só
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return await asyncio.shield(fut)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            info = trim_info(await self.fetch(url))
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # evita "exception was never retrieved" sem ninguém esperando
+            raise
+        else:
+            self._store(key, info, time.time())
+            fut.set_result(info)
+            return info
+        finally:
+            self._inflight.pop(key, None)
+
+    def _refresh_in_background(self, key: str, url: str) -> None:
+        if key in self._refreshing or key in self._inflight:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                await self._load(key, url)
+            except Exception as e:
+                logging.info("Falha ao revalidar metadados de %s: %s", key, e)
+            finally:
+                self._refreshing.discard(key)
+
+        asyncio.create_task(refresh())
+
+    def _store(self, key: str, info: dict, fetched_at: float) -> None:
+        size = len(json.dumps(info, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old.size
+
+        self.entries[key] = _Entry(
+            info=info,
+            size=size,
+            fetched_at=fetched_at,
+            expires_at=fetched_at + self.ttl_seconds,
+            refresh_at=fetched_at + self.ttl_seconds * 0.8,
+        )
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        for key in [k for k, e in self.entries.items() if e.expires_at <= now]:
+            self.total_bytes -= self.entries.pop(key).size
+
+    def load(self) -> None:
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            with gzip.open(self.persist_path, "rt", encoding="utf-8") as fh:
+                rows = json.load(fh)
+        except Exception as e:
+            logging.warning("Cache de metadados ignorado (%s): %s", self.persist_path, e)
+            return
+
+        now = time.time()
+        for row in rows:
+            if row["fetched_at"] + self.ttl_seconds > now:
+                self._store(row["key"], row["info"], row["fetched_at"])
+
+    def snapshot(self) -> list[dict]:
+        self.purge_expired()
+        return [{"key": k, "fetched_at": e.fetched_at, "info": e.info} for k, e in self.entries.items()]
+
+    def save(self, rows: list[dict] | None = None) -> None:
+        if not self.persist_path:
+            return
+        if rows is None:
+            rows = self.snapshot()
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.persist_path.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+            json.dump(rows, fh, ensure_ascii=False)
+        tmp.replace(self.persist_path)
+
+    async def run_maintenance(self, interval_seconds: float = 60.0) -> None:
+        # Remove expirados e grava o cache periodicamente (sobrevive a restarts)
+        while True:
+            await asyncio.sleep(interval_seconds)
+            rows = self.snapshot()
+            if self.persist_path:
+                try:
+                    # snapshot no loop, escrita (gzip + disco) fora dele
+                    await io_executor.run(self.save, rows)
+                except Exception as e:
+                    logging.warning("Falha ao gravar cache de metadados: %s", e)
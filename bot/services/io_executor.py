@@ -0,0 +1,33 @@
+from __future__ import annotations
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Pool de threads só para I/O de disco (SQLite do histórico/cache/fila,
+# stat/mkdir, varredura e rmtree dos temporários, split de bytes). Antes isso
+# ia para asyncio.to_thread, o executor padrão do loop, que também resolve
+# DNS para o aiohttp: um rmtree de vários GB num volume de rede lento
+# ocupava as threads e travava o polling de todo mundo. Com pool próprio o
+# I/O lento só atrasa outro I/O.
+
+_pool: ThreadPoolExecutor | None = None
+
+def configure(size: int) -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+    _pool = ThreadPoolExecutor(max(1, size), thread_name_prefix="io")
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(4, thread_name_prefix="io")
+    return _pool
+
+async def run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), functools.partial(fn, *args, **kwargs))
+
+def shutdown() -> None:
+    if _pool is not None:
+        _pool.shutdown(wait=True)
@@ -0,0 +1,308 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Protocol
+
+from bot.services import io_executor
+from bot.services.queue_service import DownloadJob
+
+# Persistência da fila de downloads. Estados:
+#   queued -> running -> uploading -> done | failed | cancelled
+# Jobs em queued/running/uploading num restart são recolocados na fila.
+#
+# Modo compartilhado (BOT_ROLE=frontend/worker ou JOB_STORE=redis): o store é
+# a fila entre processos. O front-end só grava jobs "queued"; cada worker
+# reivindica (claim) jobs com um lease que renova enquanto os tem. Lease
+# vencido (worker morreu) devolve o job para quem reivindicar depois. O
+# pedido de cancelamento também passa pelo store, e o resultado dos itens de
+# lote (estado final + texto) volta por ele para o front-end (results).
+
+UNFINISHED = ("queued", "running", "uploading")
+FINISHED = ("done", "failed", "cancelled")
+
+class JobStore(Protocol):
+    shared: bool
+
+    def add(self, job: DownloadJob) -> None: ...
+    def set_state(self, job_id: str, state: str, detail: str | None = None) -> None: ...
+    def load_unfinished(self) -> list[DownloadJob]: ...
+    async def run_flusher(self) -> None: ...
+    def close(self) -> None: ...
+    # ---- modo compartilhado ----
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> list[DownloadJob]: ...
+    async def renew(self, owner: str, job_ids: list[str], lease_seconds: float) -> None: ...
+    async def request_cancel(self, job_ids: list[str]) -> None: ...
+    async def cancelled(self, job_ids: list[str]) -> set[str]: ...
+    async def unfinished_of(self, user_id: int) -> list[DownloadJob]: ...
+    async def results(self, job_ids: list[str]) -> dict[str, tuple[str, str | None]]: ...
+
+class MemoryJobStore:
+    # Backend em memória (testes / quando não se quer persistência). Não
+    # atravessa processos: só serve para BOT_ROLE=all.
+    shared = False
+
+    def __init__(self):
+        self.jobs: dict[str, tuple[str, DownloadJob]] = {}
+        self.details: dict[str, str] = {}
+        self.cancel_requested: set[str] = set()
+
+    def add(self, job: DownloadJob) -> None:
+        self.jobs[job.job_id] = ("queued", job)
+
+    def set_state(self, job_id: str, state: str, detail: str | None = None) -> None:
+        item = self.jobs.get(job_id)
+        if item is not None:
+            self.jobs[job_id] = (state, item[1])
+            if detail is not None:
+                self.details[job_id] = detail
+
+    def load_unfinished(self) -> list[DownloadJob]:
+        return [job for state, job in self.jobs.values() if state in UNFINISHED]
+
+    async def run_flusher(self) -> None:
+        return None
+
+    def close(self) -> None:
+        pass
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> list[DownloadJob]:
+        out = []
+        for job_id, (state, job) in self.jobs.items():
+            if len(out) >= limit:
+                break
+            if state == "queued":
+                self.jobs[job_id] = ("running", job)
+                out.append(job)
+        return out
+
+    async def renew(self, owner: str, job_ids: list[str], lease_seconds: float) -> None:
+        return None
+
+    async def request_cancel(self, job_ids: list[str]) -> None:
+        self.cancel_requested.update(job_ids)
+
+    async def cancelled(self, job_ids: list[str]) -> set[str]:
+        return self.cancel_requested.intersection(job_ids)
+
+    async def unfinished_of(self, user_id: int) -> list[DownloadJob]:
+        return [job for state, job in self.jobs.values() if state in UNFINISHED and job.user_id == user_id]
+
+    async def results(self, job_ids: list[str]) -> dict[str, tuple[str, str | None]]:
+        out = {}
+        for job_id in job_ids:
+            state = self.jobs.get(job_id, ("", None))[0]
+            if state in FINISHED:
+                out[job_id] = (state, self.details.get(job_id))
+        return out
+
+class SqliteJobStore:
+    # SQLite em WAL. As escritas são só enfileiradas no loop e gravadas em lote
+    # (uma transação) por run_flusher, fora do event loop. Vários processos no
+    # mesmo volume podem usar o mesmo arquivo (modo compartilhado de um nó).
+    shared = True
+
+    def __init__(self, path: Path, flush_interval: float = 0.5, batch_size: int = 200, keep_days: int = 7):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.keep_seconds = keep_days * 86400
+        self._ops: list[tuple[str, tuple]] = []
+        self._wake = asyncio.Event()
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        # Colunas do modo compartilhado (bancos antigos ganham as colunas aqui)
+        cols = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, decl in (
+            ("owner", "TEXT"), ("lease_until", "REAL"), ("cancel", "INTEGER NOT NULL DEFAULT 0"), ("detail", "TEXT"),
+        ):
+            if name not in cols:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+        self._conn.commit()
+
+    def _enqueue(self, sql: str, params: tuple) -> None:
+        self._ops.append((sql, params))
+        if len(self._ops) >= self.batch_size:
+            self._wake.set()
+
+    def add(self, job: DownloadJob) -> None:
+        now = time.time()
+        self._enqueue(
+            "INSERT OR REPLACE INTO jobs (job_id, state, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job.job_id, json.dumps(asdict(job), ensure_ascii=False), now, now),
+        )
+        # Outro processo pode estar esperando por este job: grava logo
+        self._wake.set()
+
+    def set_state(self, job_id: str, state: str, detail: str | None = None) -> None:
+        self._enqueue(
+            "UPDATE jobs SET state=?, detail=COALESCE(?, detail), updated_at=? WHERE job_id=?",
+            (state, detail, time.time(), job_id),
+        )
+
+    def _write(self, ops: list[tuple[str, tuple]]) -> None:
+        with self._lock:
+            with self._conn:
+                for sql, params in ops:
+                    self._conn.execute(sql, params)
+
+    def _prune(self) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE state NOT IN (?, ?, ?) AND updated_at < ?",
+                    (*UNFINISHED, time.time() - self.keep_seconds),
+                )
+
+    def flush(self) -> None:
+        ops, self._ops = self._ops, []
+        if ops:
+            self._write(ops)
+
+    async def run_flusher(self) -> None:
+        last_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            ops, self._ops = self._ops, []
+            try:
+                if ops:
+                    await io_executor.run(self._write, ops)
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    await io_executor.run(self._prune)
+            except Exception:
+                logging.exception("Falha ao gravar estado da fila (%d operações)", len(ops))
+
+    def load_unfinished(self) -> list[DownloadJob]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM jobs WHERE state IN (?, ?, ?) ORDER BY created_at",
+                UNFINISHED,
+            ).fetchall()
+        return self._jobs(rows)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # ---- modo compartilhado ----
+
+    @staticmethod
+    def _jobs(rows) -> list[DownloadJob]:
+        jobs = []
+        for (payload,) in rows:
+            try:
+                jobs.append(DownloadJob(**json.loads(payload)))
+            except Exception as e:
+                logging.warning("Job persistido ignorado (payload inválido): %s", e)
+        return jobs
+
+    def _claim(self, owner: str, limit: int, lease_seconds: float) -> list[DownloadJob]:
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                # IMMEDIATE: dois workers nunca pegam o mesmo job
+                self._conn.execute("BEGIN IMMEDIATE")
+                rows = self._conn.execute(
+                    "SELECT job_id, payload FROM jobs"
+                    " WHERE state = 'queued' OR (state IN ('running', 'uploading') AND COALESCE(lease_until, 0) < ?)"
+                    " ORDER BY created_at LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET state='running', owner=?, lease_until=?, updated_at=? WHERE job_id=?",
+                    [(owner, now + lease_seconds, now, job_id) for job_id, _ in rows],
+                )
+        return self._jobs((payload,) for _, payload in rows)
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> list[DownloadJob]:
+        return await io_executor.run(self._claim, owner, limit, lease_seconds)
+
+    def _write_many(self, sql: str, params: list[tuple]) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, params)
+
+    async def renew(self, owner: str, job_ids: list[str], lease_seconds: float) -> None:
+        if job_ids:
+            until = time.time() + lease_seconds
+            await io_executor.run(
+                self._write_many,
+                "UPDATE jobs SET lease_until=? WHERE job_id=? AND owner=?",
+                [(until, job_id, owner) for job_id in job_ids],
+            )
+
+    async def request_cancel(self, job_ids: list[str]) -> None:
+        if job_ids:
+            await io_executor.run(
+                self._write_many, "UPDATE jobs SET cancel=1 WHERE job_id=?", [(j,) for j in job_ids]
+            )
+
+    def _select(self, sql: str, params: tuple) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def cancelled(self, job_ids: list[str]) -> set[str]:
+        if not job_ids:
+            return set()
+        marks = ",".join("?" * len(job_ids))
+        rows = await io_executor.run(
+            self._select, f"SELECT job_id FROM jobs WHERE cancel=1 AND job_id IN ({marks})", tuple(job_ids)
+        )
+        return {job_id for (job_id,) in rows}
+
+    async def unfinished_of(self, user_id: int) -> list[DownloadJob]:
+        # Poucas linhas não finalizadas: filtra o usuário no payload
+        rows = await io_executor.run(
+            self._select,
+            "SELECT payload FROM jobs WHERE state IN (?, ?, ?) AND json_extract(payload, '$.user_id') = ?",
+            (*UNFINISHED, user_id),
+        )
+        return self._jobs(rows)
+
+    async def results(self, job_ids: list[str]) -> dict[str, tuple[str, str | None]]:
+        if not job_ids:
+            return {}
+        marks = ",".join("?" * len(job_ids))
+        rows = await io_executor.run(
+            self._select,
+            f"SELECT job_id, state, detail FROM jobs WHERE state IN (?, ?, ?) AND job_id IN ({marks})",
+            (*FINISHED, *job_ids),
+        )
+        return {job_id: (state, detail) for job_id, state, detail in rows}
+
+def open_job_store(backend: str, data_dir: str, redis_url: str | None = None) -> JobStore:
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SqliteJobStore(Path(data_dir) / "jobs.sqlite3")
+    if backend == "redis":
+        if not redis_url:
+            raise RuntimeError("JOB_STORE=redis exige REDIS_URL")
+        from bot.services.redis_job_store import RedisJobStore
+        return RedisJobStore(redis_url)
+    raise RuntimeError(f"JOB_STORE inválido: {backend!r} (use sqlite, redis ou memory)")
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from bot.services import metrics
+
+# Vigia do event loop:
+# - uma task acorda a cada TICK e mede o atraso (quanto o sleep passou do
+#   previsto) no histograma ytbot_loop_lag_seconds;
+# - uma thread confere o "batimento" dessa task; se o loop ficar parado mais
+#   que o limite, captura a pilha da thread do loop naquele momento e loga
+#   (uma vez por travada), mostrando a chamada bloqueante responsável;
+# - atraso acima do limite sem travada única (várias callbacks médias em
+#   sequência) só vai para o log com o valor.
+
+TICK = 0.05
+STACK_LIMIT = 25
+
+class LoopMonitor:
+    def __init__(self, threshold: float):
+        # Abaixo de 2 ticks o próprio sleep da task pareceria travada
+        self.threshold = max(threshold, 2 * TICK)
+        self.beat = time.monotonic()
+        self.loop_thread: int | None = None
+        # Travada em andamento já logada pela thread (evita repetir a pilha)
+        self._reported = False
+        self._stop = threading.Event()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 4):
+            stalled = time.monotonic() - self.beat
+            if stalled < self.threshold or self._reported or self.loop_thread is None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            self._reported = True
+            # Sem os frames do próprio asyncio (run_forever, _run_once...)
+            frames = traceback.extract_stack(frame, limit=STACK_LIMIT)
+            app = [f for f in frames if "/asyncio/" not in f.filename.replace("\\", "/")] or frames
+            stack = "".join(traceback.format_list(app))
+            logging.warning("Event loop parado há %.0fms; executando agora:\n%s", stalled * 1000, stack)
+
+    async def run(self) -> None:
+        self.loop_thread = threading.get_ident()
+        watcher = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        watcher.start()
+        try:
+            while True:
+                expected = time.monotonic() + TICK
+                await asyncio.sleep(TICK)
+                now = time.monotonic()
+                lag = max(0.0, now - expected)
+                metrics.LOOP_LAG.observe(lag)
+                if lag >= self.threshold and not self._reported:
+                    logging.warning(
+                        "Event loop atrasou %.0fms (várias callbacks seguidas, nenhuma travou sozinha)", lag * 1000
+                    )
+                self.beat = now
+                self._reported = False
+        finally:
+            self._stop.set()
+
+async def run_loop_monitor(threshold_ms: float) -> None:
+    await LoopMonitor(threshold_ms / 1000).run()
@@ -0,0 +1,207 @@
+from __future__ import annotations
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from bot.services import io_executor
+
+# Métricas no formato de texto do Prometheus, sem dependências externas.
+# Desligadas por padrão: cada chamada só testa REGISTRY.enabled e retorna,
+# então instrumentar o código não custa nada quando METRICS_PORT=0.
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: Registry, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        registry.metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        for key, v in self.values.items():
+            yield f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}"
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, collect: Callable[[], float] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple[str, ...], float] = {}
+        # Gauge calculado na hora do scrape (ex.: bytes em disco)
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> Iterator[str]:
+        for key, v in self.values.items():
+            yield f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # chave -> [contagens por bucket..., soma, total]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        if not self.registry.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> Iterator[str]:
+        for key, row in self.values.items():
+            acc = 0.0
+            for i, bound in enumerate(self.buckets):
+                acc += row[i]
+                le = 'le="' + _fmt_value(bound) + '"'
+                yield f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {_fmt_value(acc)}"
+            yield f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-2])}"
+            yield f"{self.name}_count{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-1])}"
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.metrics: list[_Metric] = []
+
+    def collect(self) -> dict[str, float]:
+        # Gauges calculados no scrape; podem bloquear, rode fora do loop
+        out = {}
+        for m in self.metrics:
+            if isinstance(m, Gauge) and m.collect is not None:
+                try:
+                    out[m.name] = float(m.collect())
+                except Exception as e:
+                    logging.debug("Falha ao coletar %s: %s", m.name, e)
+        return out
+
+    def render(self, collected: dict[str, float] | None = None) -> str:
+        for m in self.metrics:
+            if collected and m.name in collected and isinstance(m, Gauge):
+                m.values[()] = collected[m.name]
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+JOBS = Counter(REGISTRY, "ytbot_jobs_total", "Jobs finalizados por resultado", ("result",))
+EXTRACT_ERRORS = Counter(REGISTRY, "ytbot_extract_errors_total", "Falhas de extração", ("error",))
+STAGE_SECONDS = Histogram(
+    REGISTRY, "ytbot_stage_seconds", "Duração de cada etapa (extract/download/transcode/upload/cleanup/queue_wait)",
+    ("stage", "extractor"),
+)
+BYTES = Counter(REGISTRY, "ytbot_bytes_total", "Bytes baixados/enviados", ("direction", "extractor"))
+QUEUE_LENGTH = Gauge(REGISTRY, "ytbot_queue_length", "Jobs aguardando na fila")
+ACTIVE_WORKERS = Gauge(REGISTRY, "ytbot_active_workers", "Jobs em execução")
+CACHE_LOOKUPS = Counter(REGISTRY, "ytbot_cache_lookups_total", "Consultas a caches", ("cache", "result"))
+PROGRESS_EDITS = Counter(
+    REGISTRY, "ytbot_progress_edits_total", "Edições de mensagens de progresso (sent/retry_after/error)", ("result",)
+)
+
+TRANSCODES = Counter(REGISTRY, "ytbot_transcodes_total", "Arquivos acima do limite encaixados com ffmpeg", ("result",))
+SITE_OUTCOMES = Counter(
+    REGISTRY, "ytbot_site_outcomes_total", "Resultados por site vistos pelo limitador (ok/throttled/error)",
+    ("site", "outcome"),
+)
+SITE_LIMIT = Gauge(REGISTRY, "ytbot_site_concurrency_limit", "Limite de concorrência atual por site", ("site",))
+PROXY_REQUESTS = Counter(REGISTRY, "ytbot_proxy_requests_total", "Jobs e sondas por proxy", ("proxy", "result"))
+LOOP_LAG = Histogram(
+    REGISTRY, "ytbot_loop_lag_seconds", "Atraso do event loop medido a cada tick",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DOWNLOAD_PROFILES = Counter(REGISTRY, "ytbot_download_profiles_total", "Downloads por perfil do yt-dlp", ("profile",))
+
+def track_temp_bytes(collect: Callable[[], float]) -> None:
+    # O valor vem do DiskService (medido pelo sweeper), sem varrer o disco no scrape
+    Gauge(REGISTRY, "ytbot_temp_disk_bytes", "Bytes em DATA_DIR/users/*/temp", collect=collect)
+
+async def serve_metrics(host: str, port: int) -> None:
+    # Endpoint /metrics local (aiohttp já vem com o aiogram)
+    from aiohttp import web
+
+    async def handle(_request: web.Request) -> web.Response:
+        # Gauges com collect= podem bloquear: coleta fora do event loop
+        collected = await io_executor.run(REGISTRY.collect)
+        body = REGISTRY.render(collected)
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info("Métricas em http://%s:%d/metrics", host, port)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import heapq
+import time
+import uuid
+
+from bot.services.ytdlp_service import FormatOption
+
+# Pedidos aguardando a escolha de formato. Guarda só o necessário para o
+# download e para o histórico (nada do dict completo do yt-dlp), expira via
+# heap (sem varrer tudo a cada mensagem) e tem teto de entradas e de bytes.
+
+class PendingRequest:
+    __slots__ = (
+        "request_id", "url", "title", "video_id", "extractor",
+        "uploader", "duration", "options", "expires_at", "size",
+    )
+
+    def __init__(self, request_id: str, url: str, info: dict, options: list[FormatOption], expires_at: float):
+        self.request_id = request_id
+        self.url = url
+        self.title = info.get("title")
+        self.video_id = info.get("id")
+        self.extractor = info.get("extractor_key") or info.get("extractor")
+        self.uploader = info.get("uploader") or info.get("channel")
+        self.duration = info.get("duration")
+        self.options = options
+        self.expires_at = expires_at
+        self.size = _estimate_size(self)
+
+    def info(self) -> dict:
+        # Formato mínimo aceito por cache_key() e save_link_record()
+        return {
+            "id": self.video_id,
+            "title": self.title,
+            "extractor_key": self.extractor,
+            "uploader": self.uploader,
+            "duration": self.duration,
+        }
+
+class PendingBatch:
+    # Lote (playlist ou vários links) aguardando a escolha da política de formato
+    __slots__ = ("request_id", "title", "entries", "expires_at", "size")
+
+    def __init__(self, request_id: str, title: str | None, entries: list[dict], expires_at: float):
+        self.request_id = request_id
+        self.title = title
+        # [{url, id?, title?, ie_key?, duration?}] (itens flat, sem formatos)
+        self.entries = entries
+        self.expires_at = expires_at
+        self.size = 200 + len(title or "") + sum(
+            100 + len(e.get("url") or "") + len(e.get("title") or "") for e in entries
+        )
+
+def _estimate_size(req: PendingRequest) -> int:
+    # Aproximação barata: objeto com slots + strings + opções
+    size = 200 + len(req.url) + len(req.title or "") + len(req.uploader or "")
+    for o in req.options:
+        size += 120 + len(o.label.encode("utf-8")) + len(o.format_id)
+    return size
+
+class PendingStore:
+    def __init__(self, ttl_seconds: int, max_entries: int, max_mb: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.items: dict[str, PendingRequest | PendingBatch] = {}
+        self.total_bytes = 0
+        # (expires_at, request_id); como o TTL é fixo, o topo é também o mais antigo
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, url: str, info: dict, options: list[FormatOption]) -> PendingRequest:
+        now = time.time()
+        return self._insert(PendingRequest(uuid.uuid4().hex, url, info, options, now + self.ttl_seconds), now)
+
+    def add_batch(self, title: str | None, entries: list[dict]) -> PendingBatch:
+        now = time.time()
+        return self._insert(PendingBatch(uuid.uuid4().hex, title, entries, now + self.ttl_seconds), now)
+
+    def _insert(self, req, now: float):
+        self._expire(now)
+        self.items[req.request_id] = req
+        self.total_bytes += req.size
+        heapq.heappush(self._heap, (req.expires_at, req.request_id))
+
+        # Teto rígido: descarta os pedidos mais antigos
+        while self.items and (len(self.items) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, rid = heapq.heappop(self._heap)
+            self._drop(rid)
+        return req
+
+    def get(self, request_id: str) -> PendingRequest | PendingBatch | None:
+        self._expire(time.time())
+        return self.items.get(request_id)
+
+    def discard(self, request_id: str) -> None:
+        # A entrada no heap vira lixo e é ignorada quando chegar ao topo
+        self._drop(request_id)
+
+    def _drop(self, request_id: str) -> None:
+        req = self.items.pop(request_id, None)
+        if req is not None:
+            self.total_bytes -= req.size
+
+    def _expire(self, now: float) -> None:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, rid = heapq.heappop(heap)
+            self._drop(rid)
+        # Entradas descartadas antes da hora acumulam no heap; compacta se crescer demais
+        if len(heap) > 2 * len(self.items) + 64:
+            self._heap = [(r.expires_at, rid) for rid, r in self.items.items()]
+            heapq.heapify(self._heap)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import asyncio
+import os
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import aiofiles
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from bot.services import io_executor
+
+# Modo pipeline: o upload para o Telegram lê o arquivo enquanto o yt-dlp
+# ainda está escrevendo, então a latência fica ~max(download, upload) em vez
+# da soma. Só vale para formatos de arquivo único sem merge/pós-processamento
+# (FormatOption.streamable); o resto segue o caminho normal.
+#
+# O leitor abre o ".part" e segue lendo pelo mesmo descritor: o rename final
+# do yt-dlp não afeta um arquivo já aberto.
+
+class PipelineAborted(Exception):
+    pass
+
+class DownloadTail:
+    # Ponte entre o hook de progresso do yt-dlp (thread) e o upload (event loop)
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.part_path: str | None = None
+        self.final_path: str | None = None
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.ok = False
+
+    def on_progress(self, d: dict) -> None:
+        if self.part_path is not None or d.get("status") != "downloading":
+            return
+        path = d.get("tmpfilename") or d.get("filename")
+        if not path:
+            return
+        self.part_path = path
+        self.final_path = d.get("filename") or path
+        self.loop.call_soon_threadsafe(self.started.set)
+
+    def finish(self, ok: bool) -> None:
+        # Chamado no event loop quando o download termina (com ou sem erro)
+        self.ok = ok
+        self.finished.set()
+        self.started.set()
+
+def _size_or_none(path: str) -> int | None:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+class GrowingFileInput(InputFile):
+    def __init__(self, tail: DownloadTail, filename: str, chunk_size: int = 256 * 1024, poll_interval: float = 0.2):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.tail = tail
+        self.poll_interval = poll_interval
+        self.sent_bytes = 0
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        tail = self.tail
+        async with aiofiles.open(tail.part_path, "rb") as f:
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if chunk:
+                    self.sent_bytes += len(chunk)
+                    yield chunk
+                    continue
+
+                if tail.finished.is_set():
+                    # Drena o que foi escrito entre a última leitura e o fim
+                    while chunk := await f.read(self.chunk_size):
+                        self.sent_bytes += len(chunk)
+                        yield chunk
+                    # Erro no download ou arquivo reescrito (retry do zero):
+                    # aborta antes de fechar o multipart para o Telegram descartar.
+                    if not tail.ok:
+                        raise PipelineAborted("download falhou durante o upload")
+                    final = tail.final_path or tail.part_path
+                    if await io_executor.run(_size_or_none, final) != self.sent_bytes:
+                        raise PipelineAborted("arquivo final difere do que foi enviado")
+                    return
+
+                try:
+                    await asyncio.wait_for(tail.finished.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+def final_name(tail: DownloadTail) -> str:
+    return Path(tail.final_path or tail.part_path or "arquivo").name
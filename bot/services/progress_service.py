@@ -0,0 +1,162 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot.services import metrics
+
+# Mensagens de progresso de todos os jobs passam por um único flusher:
+# - cada job só atualiza o texto desejado (barato, pode vir da thread do yt-dlp);
+# - a cada tick o flusher edita só as mensagens cujo texto mudou, respeitando
+#   o intervalo por chat (privado ~1/s, grupo ~20/min), o orçamento global de
+#   edições por segundo e o retry_after de cada chat;
+# - com muitos jobs o intervalo por mensagem cresce para caber no orçamento,
+#   deixando a cota da API para os uploads.
+
+GROUP_CHAT_INTERVAL = 3.0
+PRIVATE_CHAT_INTERVAL = 1.0
+
+class ProgressTracker:
+    # Progresso de um job: vive do início do download até close()
+    def __init__(self, service: ProgressService, members: Callable[[], list], text: str):
+        self.service = service
+        # Jobs (chat_id/message_id) que veem este progresso; muda com os anexados
+        self.members = members
+        self.text = text
+        self.closed = False
+        # Mensagens que não podem mais ser editadas (apagadas, antigas demais...)
+        self.dead: set[tuple[int, int]] = set()
+
+    def update(self, text: str) -> None:
+        self.text = text
+
+    async def close(self) -> None:
+        # Para de editar e espera a edição em voo, para que a mensagem final
+        # (enviada em seguida por quem chamou) não seja sobrescrita
+        if self.closed:
+            return
+        self.closed = True
+        self.service.trackers.discard(self)
+        await self.service.wait_idle()
+
+class ProgressService:
+    def __init__(self, bot: Bot, interval: float, edits_per_second: float, tick: float = 0.25):
+        self.bot = bot
+        self.interval = interval
+        self.edits_per_second = max(0.1, edits_per_second)
+        self.tick = tick
+        self.trackers: set[ProgressTracker] = set()
+        # (chat_id, message_id) -> (texto enviado, momento do envio)
+        self.sent: dict[tuple[int, int], tuple[str, float]] = {}
+        # chat_id -> próximo momento em que o chat aceita edição
+        self.chat_ready: dict[int, float] = {}
+        self._budget = 0.0
+        self._last_flush = time.monotonic()
+        self._inflight: asyncio.Task | None = None
+
+    def track(self, members: Callable[[], list], text: str) -> ProgressTracker:
+        tracker = ProgressTracker(self, members, text)
+        self.trackers.add(tracker)
+        return tracker
+
+    def current_interval(self, messages: int) -> float:
+        # Intervalo adaptativo: N mensagens vivas precisam caber no orçamento global
+        return max(self.interval, messages / self.edits_per_second)
+
+    async def wait_idle(self) -> None:
+        if self._inflight is not None and not self._inflight.done():
+            await asyncio.wait({self._inflight})
+
+    def _due(self, now: float) -> list[tuple[tuple[int, int], str, ProgressTracker]]:
+        targets = []
+        for tracker in self.trackers:
+            for j in tracker.members():
+                key = (j.chat_id, j.message_id)
+                if key not in tracker.dead:
+                    targets.append((key, tracker))
+
+        interval = self.current_interval(len(targets))
+        due = []
+        for key, tracker in targets:
+            text = tracker.text
+            last_text, last_at = self.sent.get(key, (None, 0.0))
+            if text == last_text:
+                continue
+            if now - last_at < interval or now < self.chat_ready.get(key[0], 0.0):
+                continue
+            due.append((last_at, key, text, tracker))
+
+        # Quem está há mais tempo sem atualização vai primeiro
+        due.sort(key=lambda d: d[0])
+        out = []
+        chats: set[int] = set()
+        for _, key, text, tracker in due:
+            if len(out) >= int(self._budget):
+                break
+            if key[0] in chats:
+                continue
+            chats.add(key[0])
+            out.append((key, text, tracker))
+        return out
+
+    async def _edit(self, key: tuple[int, int], text: str, tracker: ProgressTracker) -> None:
+        chat_id, message_id = key
+        now = time.monotonic()
+        self.chat_ready[chat_id] = now + (GROUP_CHAT_INTERVAL if chat_id < 0 else PRIVATE_CHAT_INTERVAL)
+        try:
+            await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+        except TelegramRetryAfter as e:
+            self.chat_ready[chat_id] = time.monotonic() + e.retry_after
+            metrics.PROGRESS_EDITS.inc(result="retry_after")
+            logging.info("Flood wait de %ss no chat %s; pausando progresso", e.retry_after, chat_id)
+            return
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e).lower():
+                tracker.dead.add(key)
+                metrics.PROGRESS_EDITS.inc(result="error")
+                logging.debug("Mensagem de progresso %s não editável: %s", key, e)
+                return
+        except Exception as e:
+            # Erro de rede: tenta de novo no próximo intervalo
+            metrics.PROGRESS_EDITS.inc(result="error")
+            logging.debug("Falha ao editar progresso %s: %s", key, e)
+            self.sent[key] = (self.sent.get(key, ("", 0.0))[0], now)
+            return
+        self.sent[key] = (text, now)
+        metrics.PROGRESS_EDITS.inc(result="sent")
+
+    def _prune(self, now: float) -> None:
+        live = {(j.chat_id, j.message_id) for t in self.trackers for j in t.members()}
+        for key in [k for k in self.sent if k not in live]:
+            del self.sent[key]
+        for chat_id in [c for c, t in self.chat_ready.items() if t < now]:
+            del self.chat_ready[chat_id]
+
+    async def flush(self) -> None:
+        now = time.monotonic()
+        self._budget = min(
+            self.edits_per_second,
+            self._budget + (now - self._last_flush) * self.edits_per_second,
+        )
+        self._last_flush = now
+        batch = self._due(now)
+        self._prune(now)
+        if not batch:
+            return
+        self._budget -= len(batch)
+        self._inflight = asyncio.ensure_future(
+            asyncio.gather(*(self._edit(key, text, tracker) for key, text, tracker in batch))
+        )
+        await asyncio.wait({self._inflight})
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("Falha no flusher de progresso")
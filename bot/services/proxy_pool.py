@@ -0,0 +1,155 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import aiohttp
+
+from bot.services import metrics
+from bot.services.site_limiter import classify
+
+# Pool de proxies para o yt-dlp. Cada extração/download pega o proxy com
+# melhor nota no momento:
+#   nota = latência (EWMA das sondas) x (1 + 4 x taxa de falha) x (1 + jobs em uso)
+# Falhas de rede/throttle nos jobs e nas sondas entram na taxa (EWMA); falhas
+# seguidas tiram o proxy de circulação por um cooldown que dobra a cada vez.
+# Sem proxies configurados pick() devolve None (conexão direta).
+# A sonda (run_health_checks) faz um GET em PROBE_URL pelo proxy; o aiohttp
+# só fala HTTP(S) com o proxy, então proxies socks são avaliados só pelos jobs.
+
+EWMA_ALPHA = 0.3
+DEFAULT_LATENCY = 1.0
+MAX_STRIKES = 3
+COOLDOWN_BASE = 60.0
+COOLDOWN_MAX = 600.0
+
+PROXY_MARKERS = ("proxy", "tunnel", "connection refused", "connection reset", "timed out")
+
+def is_proxy_failure(exc: BaseException) -> bool:
+    # Falha que outro proxy pode não ter (rede, throttle, bloqueio do IP);
+    # erro do vídeo em si (privado, removido) não conta contra o proxy
+    text = f"{type(exc).__name__}: {exc}".lower()
+    return classify(exc) is not None or any(m in text for m in PROXY_MARKERS)
+
+def _label(proxy: str) -> str:
+    # Sem credenciais nos logs/métricas
+    return proxy.rsplit("@", 1)[-1]
+
+class ProxyStats:
+    __slots__ = ("url", "latency", "fail_rate", "in_use", "strikes", "down_until", "cooldowns")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: float | None = None
+        self.fail_rate = 0.0
+        self.in_use = 0
+        self.strikes = 0
+        self.down_until = 0.0
+        self.cooldowns = 0
+
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return latency * (1 + 4 * self.fail_rate) * (1 + self.in_use)
+
+class ProxyPool:
+    def __init__(self, proxies: list[str], probe_url: str = "", probe_interval: float = 60, probe_timeout: float = 10):
+        self.proxies = {p: ProxyStats(p) for p in dict.fromkeys(proxies)}
+        self.probe_url = probe_url
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+
+    def __len__(self) -> int:
+        return len(self.proxies)
+
+    def pick(self, exclude: list[str | None] | tuple = ()) -> str | None:
+        candidates = [s for s in self.proxies.values() if s.url not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        up = [s for s in candidates if s.down_until <= now]
+        if up:
+            return min(up, key=ProxyStats.score).url
+        # Todos fora: usa o que volta primeiro em vez de parar o bot
+        return min(candidates, key=lambda s: s.down_until).url
+
+    def has_other(self, exclude: list[str | None]) -> bool:
+        return any(p not in exclude for p in self.proxies)
+
+    @contextmanager
+    def using(self, proxy: str | None) -> Iterator[None]:
+        stats = self.proxies.get(proxy) if proxy else None
+        if stats is not None:
+            stats.in_use += 1
+        try:
+            yield
+        finally:
+            if stats is not None:
+                stats.in_use -= 1
+
+    def report(self, proxy: str | None, ok: bool, latency: float | None = None) -> None:
+        stats = self.proxies.get(proxy) if proxy else None
+        if stats is None:
+            return
+        stats.fail_rate = (1 - EWMA_ALPHA) * stats.fail_rate + EWMA_ALPHA * (0.0 if ok else 1.0)
+        if latency is not None:
+            stats.latency = latency if stats.latency is None else (1 - EWMA_ALPHA) * stats.latency + EWMA_ALPHA * latency
+        if ok:
+            stats.strikes = 0
+            if stats.down_until:
+                stats.down_until = 0.0
+                stats.cooldowns = 0
+                logging.info("Proxy %s de volta", _label(proxy))
+        else:
+            stats.strikes += 1
+            if stats.strikes >= MAX_STRIKES and stats.down_until <= time.monotonic():
+                cooldown = min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** stats.cooldowns)
+                stats.cooldowns += 1
+                stats.down_until = time.monotonic() + cooldown
+                logging.warning("Proxy %s fora por %.0fs após %d falhas", _label(proxy), cooldown, stats.strikes)
+        metrics.PROXY_REQUESTS.inc(proxy=_label(proxy), result="ok" if ok else "failed")
+
+    async def _probe(self, session: aiohttp.ClientSession, stats: ProxyStats) -> None:
+        t0 = time.perf_counter()
+        try:
+            async with session.get(self.probe_url, proxy=stats.url, allow_redirects=False) as resp:
+                ok = resp.status < 400
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            ok = False
+        self.report(stats.url, ok, time.perf_counter() - t0 if ok else None)
+
+    async def run_health_checks(self) -> None:
+        probed = [s for s in self.proxies.values() if s.url.startswith(("http://", "https://"))]
+        if not self.probe_url or not probed:
+            return
+        timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                await asyncio.gather(*(self._probe(session, s) for s in probed))
+                await asyncio.sleep(self.probe_interval)
+
+def load_proxies(single: str | None, listed: str, file: str | None) -> list[str]:
+    # HTTP_PROXY + PROXY_LIST (vírgula) + PROXY_FILE (um por linha, # comenta)
+    out = [single] if single else []
+    out.extend(p.strip() for p in listed.split(",") if p.strip())
+    if file:
+        for line in Path(file).read_text(encoding="utf-8").splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                out.append(line)
+    return list(dict.fromkeys(out))
+
+_pool: ProxyPool | None = None
+
+def configure(proxies: list[str], probe_url: str = "", probe_interval: float = 60) -> ProxyPool:
+    global _pool
+    _pool = ProxyPool(proxies, probe_url, probe_interval)
+    return _pool
+
+def get_pool() -> ProxyPool:
+    global _pool
+    if _pool is None:
+        _pool = ProxyPool([])
+    return _pool
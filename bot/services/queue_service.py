@@ -1,7 +1,19 @@
 from __future__ import annotations
 import asyncio
-from dataclasses import dataclass
+import bisect
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
 from collections import defaultdict
+from typing import TYPE_CHECKING, Callable
+from urllib.parse import urlsplit, urlunsplit
+
+from bot.services import metrics
+from bot.services.site_limiter import SiteLimiter, get_limiter
+
+if TYPE_CHECKING:
+    from bot.services.job_store import JobStore
 
 @dataclass(frozen=True)
 class DownloadJob:
@@ -11,21 +23,372 @@ class DownloadJob:
     url: str
     format_id: str
     request_id: str
+    # Jobs com a mesma chave (mesmo vídeo + formato) compartilham um download
+    dedup_key: str | None = None
+    # Metadados para legenda e histórico: o job não depende do pedido pendente
+    title: str | None = None
+    video_id: str | None = None
+    extractor: str | None = None
+    uploader: str | None = None
+    duration: float | None = None
+    streamable: bool = False
+    # Tamanho esperado (da FormatOption) para a admissão por espaço em disco
+    filesize_mb: float | None = None
+    # Protocolo do formato escolhido (perfil de download); None no lote
+    protocol: str | None = None
+    # Item de um lote: progresso e resultado vão para a mensagem do lote
+    batch_id: str | None = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def info(self) -> dict:
+        return {
+            "id": self.video_id,
+            "title": self.title,
+            "extractor_key": self.extractor,
+            "uploader": self.uploader,
+            "duration": self.duration,
+        }
+
+def dedup_key(content_key: tuple[str, str, str] | None, url: str, format_id: str) -> str:
+    if content_key is not None:
+        return "id|" + "|".join(content_key)
+    # Sem id do extractor: usa a URL normalizada (sem fragmento, host minúsculo)
+    parts = urlsplit(url.strip())
+    norm = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+    return f"url|{norm}|{format_id}"
 
+# Quantos jobs do começo da fila de cada usuário são considerados por vez
+SITE_SCAN = 8
+SITE_POLL_INTERVAL = 0.5
+# Peso do tempo de execução observado na estimativa de início (EWMA)
+ETA_ALPHA = 0.2
+# Jobs sem tamanho conhecido contam como pelo menos isso na estimativa
+MIN_JOB_MB = 1.0
+
+# Fila por tamanho (shortest-job-first com envelhecimento): cada job tem a
+# prioridade  tamanho_mb - aging_mb_per_minute x minutos_na_fila  e o menor
+# valor sai primeiro. Como todos envelhecem no mesmo ritmo, a ordem entre
+# dois jobs não muda com o tempo: a chave fixa  tamanho + aging x entrada  é
+# calculada uma vez no put e cada usuário mantém sua fila ordenada por ela.
+# Um job grande espera no máximo ~tamanho/aging minutos atrás de jobs novos.
+# Jobs sem tamanho (itens de lote) contam como unknown_mb.
+#
+# get() entrega o job de menor chave entre os usuários que ainda têm vaga
+# (PER_USER_CONCURRENCY): quem manda muitos jobs pequenos não ocupa mais
+# workers do que isso. A concorrência global é o número de workers
+# consumindo a fila (GLOBAL_CONCURRENCY). Além disso cada site tem seu
+# próprio limite adaptativo (SiteLimiter): o job de um site no limite ou em
+# backoff fica na fila e a vez passa para o próximo job que possa começar.
+#
+# Com store compartilhado (BOT_ROLE=frontend/worker) a fila é dividida: o
+# front-end (frontend_only=True) só grava o job no store; cada worker tem seu
+# QueueService local, alimentado por run_feeder com os jobs que reivindicou.
 class QueueService:
-    def __init__(self, global_concurrency: int, per_user_concurrency: int):
-        self.queue: asyncio.Queue[DownloadJob] = asyncio.Queue()
-        self.global_sem = asyncio.Semaphore(global_concurrency)
-        self.user_sems = defaultdict(lambda: asyncio.Semaphore(per_user_concurrency))
+    def __init__(
+        self,
+        global_concurrency: int,
+        per_user_concurrency: int,
+        store: JobStore | None = None,
+        frontend_only: bool = False,
+        limiter: SiteLimiter | None = None,
+        max_retries: int = 2,
+        aging_mb_per_minute: float = 10.0,
+        unknown_mb: float = 50.0,
+    ):
+        if store is None:
+            from bot.services.job_store import MemoryJobStore
+            store = MemoryJobStore()
+        self.store = store
+        self.limiter = limiter if limiter is not None else get_limiter()
+        self.max_retries = max_retries
+        # job_id -> vezes que voltou para a fila por throttle do site
+        self.retries: dict[str, int] = {}
+        self.frontend_only = frontend_only
+        self.global_concurrency = max(1, global_concurrency)
+        self.per_user_concurrency = max(1, per_user_concurrency)
+        self.aging = max(0.0, aging_mb_per_minute) / 60
+        self.unknown_mb = unknown_mb
+        # Filas por usuário, ordenadas pela chave de prioridade
+        self.user_queues: dict[int, list[DownloadJob]] = defaultdict(list)
+        # job_id -> chave de prioridade (mantida numa volta à fila por throttle)
+        self.keys: dict[str, float] = {}
+        self.running: dict[int, int] = defaultdict(int)
+        # dedup_key -> [job líder, *jobs anexados] enquanto o líder não entregou
+        self.inflight: dict[str, list[DownloadJob]] = {}
+        self.enqueued_at: dict[str, float] = {}
+        # job_id -> job entregue a um worker e ainda não finalizado
+        self.active_jobs: dict[str, DownloadJob] = {}
+        self.started_at: dict[str, float] = {}
+        # Segundos de execução por MB observados (None até o primeiro job)
+        self.seconds_per_mb: float | None = None
+        self._cond = asyncio.Condition()
+        # Acorda o feeder quando uma vaga local abre (modo compartilhado)
+        self._slot_freed = asyncio.Event()
+        self._site_blocked = False
+
+    async def put(self, job: DownloadJob, persist: bool = True) -> bool:
+        # Retorna False se o job foi anexado a um download idêntico já em andamento
+        if persist:
+            self.store.add(job)
+        elif self.holds(job.job_id):
+            # Reivindicado de novo (lease vencido em outro processo ou aqui):
+            # este processo já cuida dele, não entra duas vezes
+            return False
+        if self.frontend_only:
+            # Algum worker reivindica do store; o dedup fica com o cache de file_id
+            return True
+        if job.dedup_key:
+            group = self.inflight.get(job.dedup_key)
+            if group is not None:
+                group.append(job)
+                return False
+            self.inflight[job.dedup_key] = [job]
+
+        async with self._cond:
+            now = time.monotonic()
+            self.enqueued_at[job.job_id] = now
+            self.keys.setdefault(job.job_id, self.size_mb(job) + self.aging * now)
+            self._insert(job)
+            metrics.QUEUE_LENGTH.inc()
+            self._cond.notify_all()
+        return True
+
+    def size_mb(self, job: DownloadJob) -> float:
+        return job.filesize_mb if job.filesize_mb is not None else self.unknown_mb
+
+    def _insert(self, job: DownloadJob) -> None:
+        bisect.insort(self.user_queues[job.user_id], job, key=lambda j: self.keys[j.job_id])
+
+    def followers(self, job: DownloadJob) -> list[DownloadJob]:
+        group = self.inflight.get(job.dedup_key) if job.dedup_key else None
+        if not group or group[0] is not job:
+            return []
+        return group[1:]
+
+    def detach(self, job: DownloadJob) -> list[DownloadJob]:
+        # Fecha o grupo do líder: novos pedidos iguais passam a abrir outro job
+        # (e normalmente caem no cache de file_id). Retorna os anexados.
+        group = self.inflight.get(job.dedup_key) if job.dedup_key else None
+        if not group or group[0] is not job:
+            return []
+        del self.inflight[job.dedup_key]
+        return group[1:]
+
+    def site(self, job: DownloadJob) -> str:
+        return self.limiter.site(job.url, job.extractor)
+
+    def _startable(self, q: list[DownloadJob]) -> DownloadJob | None:
+        # Primeiro job do usuário cujo site tem vaga (olha só o começo da fila)
+        for i, job in enumerate(q):
+            if i >= SITE_SCAN:
+                break
+            if self.limiter.can_start(self.site(job)):
+                return job
+        return None
 
-    async def put(self, job: DownloadJob) -> None:
-        await self.queue.put(job)
+    def _pop_next(self) -> DownloadJob | None:
+        self._site_blocked = False
+        best: DownloadJob | None = None
+        for user_id, q in self.user_queues.items():
+            if self.running[user_id] >= self.per_user_concurrency:
+                continue
+            job = self._startable(q)
+            if job is None:
+                # Todos os sites dele no limite/backoff: tenta de novo depois
+                self._site_blocked = True
+                continue
+            if best is None or self.keys[job.job_id] < self.keys[best.job_id]:
+                best = job
+        if best is None:
+            return None
+        q = self.user_queues[best.user_id]
+        q.remove(best)
+        if not q:
+            del self.user_queues[best.user_id]
+        self.running[best.user_id] += 1
+        self.limiter.started(self.site(best))
+        return best
 
     async def get(self) -> DownloadJob:
-        return await self.queue.get()
+        async with self._cond:
+            while True:
+                job = self._pop_next()
+                if job is not None:
+                    self.store.set_state(job.job_id, "running")
+                    self.active_jobs[job.job_id] = job
+                    self.started_at[job.job_id] = time.monotonic()
+                    waited = time.monotonic() - self.enqueued_at.pop(job.job_id, time.monotonic())
+                    metrics.STAGE_SECONDS.observe(waited, stage="queue_wait", extractor=(job.extractor or "").lower())
+                    metrics.QUEUE_LENGTH.dec()
+                    metrics.ACTIVE_WORKERS.inc()
+                    return job
+                if not self._site_blocked:
+                    await self._cond.wait()
+                    continue
+                # Só o limite de site segura a fila: backoff/token bucket
+                # liberam com o tempo, sem ninguém notificar
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=SITE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def task_done(self, job: DownloadJob) -> None:
+        async with self._cond:
+            self.active_jobs.pop(job.job_id, None)
+            started = self.started_at.pop(job.job_id, None)
+            if started is not None and job.job_id not in self.enqueued_at:
+                # Voltou para a fila (throttle) não conta na estimativa
+                self._observe(job, time.monotonic() - started)
+            self.running[job.user_id] -= 1
+            if self.running[job.user_id] <= 0:
+                del self.running[job.user_id]
+            self.limiter.finished(self.site(job))
+            metrics.ACTIVE_WORKERS.dec()
+            self._slot_freed.set()
+            self._cond.notify_all()
+
+    def _observe(self, job: DownloadJob, seconds: float) -> None:
+        spm = seconds / max(MIN_JOB_MB, self.size_mb(job))
+        prev = self.seconds_per_mb
+        self.seconds_per_mb = spm if prev is None else (1 - ETA_ALPHA) * prev + ETA_ALPHA * spm
+
+    def positions(self) -> list[tuple[DownloadJob, int, float | None]]:
+        # (job, posição a partir de 1, segundos estimados até começar) de tudo
+        # que está na fila, na ordem de prioridade. Estimativa: trabalho à
+        # frente (jobs na fila + o que falta dos em execução) x segundos/MB
+        # observados, dividido pelos workers. Ignora limites por usuário e por
+        # site, então é uma previsão otimista.
+        queued = sorted((j for q in self.user_queues.values() for j in q), key=lambda j: self.keys[j.job_id])
+        spm = self.seconds_per_mb
+        if spm is None:
+            return [(j, i + 1, None) for i, j in enumerate(queued)]
+        now = time.monotonic()
+        ahead = 0.0
+        for j in self.active_jobs.values():
+            expected = max(MIN_JOB_MB, self.size_mb(j)) * spm
+            ahead += max(0.0, expected - (now - self.started_at.get(j.job_id, now)))
+        out = []
+        for i, j in enumerate(queued):
+            out.append((j, i + 1, ahead / self.global_concurrency))
+            ahead += max(MIN_JOB_MB, self.size_mb(j)) * spm
+        return out
+
+    def set_state(self, job: DownloadJob, state: str, detail: str | None = None) -> None:
+        # detail: texto do resultado, gravado para o front-end (itens de lote)
+        if state in ("done", "failed", "cancelled"):
+            self.retries.pop(job.job_id, None)
+            self.keys.pop(job.job_id, None)
+        self.store.set_state(job.job_id, state, detail)
+
+    async def requeue(self, job: DownloadJob) -> bool:
+        # Job que levou throttle volta para a fila com a chave de antes (na
+        # frente dos que chegaram depois); começa de novo quando o backoff do
+        # site acabar. False se esgotou as tentativas.
+        n = self.retries.get(job.job_id, 0)
+        if n >= self.max_retries:
+            return False
+        self.retries[job.job_id] = n + 1
+        if not self.store.shared:
+            self.store.set_state(job.job_id, "queued")
+        # Com store compartilhado o job continua "running" e com o lease deste
+        # worker (held_ids renova): "queued" no store deixaria outro worker
+        # reivindicar o mesmo job e baixá-lo de novo
+        async with self._cond:
+            self.enqueued_at[job.job_id] = time.monotonic()
+            self.keys.setdefault(job.job_id, self.size_mb(job) + self.aging * time.monotonic())
+            self._insert(job)
+            metrics.QUEUE_LENGTH.inc()
+            self._cond.notify_all()
+        return True
+
+    async def restore(self) -> list[DownloadJob]:
+        # Recoloca na fila o que estava pendente/em andamento antes do restart
+        jobs = self.store.load_unfinished()
+        for job in jobs:
+            self.store.set_state(job.job_id, "queued")
+            await self.put(job, persist=False)
+        return jobs
+
+    def jobs_of(self, user_id: int) -> list[DownloadJob]:
+        # Tudo que o usuário tem pendente: na fila, em execução ou anexado
+        jobs = {j.job_id: j for j in self.user_queues.get(user_id, ())}
+        for j in self.active_jobs.values():
+            if j.user_id == user_id:
+                jobs[j.job_id] = j
+        for group in self.inflight.values():
+            for j in group:
+                if j.user_id == user_id:
+                    jobs[j.job_id] = j
+        return list(jobs.values())
+
+    async def cancel_user(self, user_id: int) -> list[DownloadJob]:
+        # Jobs pendentes do usuário; com store compartilhado inclui os que estão
+        # em outros processos e grava o pedido de cancelamento para eles
+        jobs = {j.job_id: j for j in self.jobs_of(user_id)}
+        if self.store.shared:
+            for j in await self.store.unfinished_of(user_id):
+                jobs.setdefault(j.job_id, j)
+            await self.store.request_cancel(list(jobs))
+        return list(jobs.values())
+
+    def held_jobs(self) -> list[DownloadJob]:
+        # Jobs deste processo ainda não finalizados: na fila, em execução ou
+        # anexados a um download em andamento (estes também precisam de lease
+        # renovado e de receber cancelamentos)
+        jobs = [j for q in self.user_queues.values() for j in q]
+        jobs.extend(self.active_jobs.values())
+        jobs.extend(j for group in self.inflight.values() for j in group[1:])
+        return jobs
+
+    def held_ids(self) -> list[str]:
+        return [j.job_id for j in self.held_jobs()]
+
+    def holds(self, job_id: str) -> bool:
+        return job_id in self.held_ids()
+
+    async def run_feeder(
+        self,
+        owner: str,
+        on_cancel: Callable[[set[str]], None],
+        lease_seconds: float = 60,
+        interval: float = 1.0,
+    ) -> None:
+        # Worker em modo compartilhado: renova os leases do que tem, repassa
+        # cancelamentos pedidos em outro processo e reivindica jobs até encher
+        # as vagas locais (fila local vazia + workers ocupados = global)
+        while True:
+            try:
+                held = self.held_ids()
+                await self.store.renew(owner, held, lease_seconds)
+                cancelled = await self.store.cancelled(held)
+                if cancelled:
+                    on_cancel(cancelled)
+                free = self.global_concurrency - self.qsize() - self.active()
+                if free > 0:
+                    claimed = await self.store.claim(owner, free, lease_seconds)
+                    # Lease que venceu mesmo assim (ex.: store lento): já está aqui
+                    held = set(self.held_ids())
+                    claimed = [j for j in claimed if j.job_id not in held]
+                    cancelled = await self.store.cancelled([j.job_id for j in claimed])
+                    if cancelled:
+                        on_cancel(cancelled)
+                    for job in claimed:
+                        await self.put(job, persist=False)
+                    if len(claimed) == free:
+                        # Ainda pode haver mais na fila: volta logo
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Falha ao sincronizar com a fila compartilhada")
+            try:
+                await asyncio.wait_for(self._slot_freed.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._slot_freed.clear()
 
-    def task_done(self) -> None:
-        self.queue.task_done()
+    def qsize(self) -> int:
+        return sum(len(q) for q in self.user_queues.values())
 
-    def user_sem(self, user_id: int) -> asyncio.Semaphore:
-        return self.user_sems[user_id]
+    def active(self) -> int:
+        return sum(self.running.values())
@@ -0,0 +1,202 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict
+
+from bot.services.job_store import FINISHED, UNFINISHED
+from bot.services.queue_service import DownloadJob
+
+# Fila compartilhada em Redis (ou compatível: KeyDB, Valkey, Dragonfly) para
+# vários nós. Chaves, todas sob PREFIX:
+#   job:{id}    hash  state, payload, user, owner, cancel, detail
+#   queue       zset  job_ids "queued" (score = criação)
+#   leases      zset  job_ids reivindicados (score = fim do lease)
+#   user:{uid}  set   job_ids não finalizados do usuário
+# claim e set_state são scripts Lua: atômicos entre workers.
+
+PREFIX = "ytbot:"
+
+CLAIM = """
+local prefix, now, limit, owner, until_ = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4], ARGV[5]
+-- Lease vencido: o worker sumiu, o job volta para o início da fila
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+  redis.call('ZREM', KEYS[2], id)
+  redis.call('ZADD', KEYS[1], 0, id)
+end
+local out = {}
+for _, id in ipairs(redis.call('ZRANGE', KEYS[1], 0, limit - 1)) do
+  redis.call('ZREM', KEYS[1], id)
+  local key = prefix .. 'job:' .. id
+  local payload = redis.call('HGET', key, 'payload')
+  if payload then
+    redis.call('ZADD', KEYS[2], until_, id)
+    redis.call('HSET', key, 'state', 'running', 'owner', owner)
+    table.insert(out, payload)
+  end
+end
+return out
+"""
+
+SET_STATE = """
+local prefix, id, state, finished, keep, detail = ARGV[1], ARGV[2], ARGV[3], ARGV[4], tonumber(ARGV[5]), ARGV[6]
+local key = prefix .. 'job:' .. id
+if redis.call('EXISTS', key) == 0 then return 0 end
+redis.call('HSET', key, 'state', state)
+if detail ~= '' then redis.call('HSET', key, 'detail', detail) end
+if finished == '1' then
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('ZREM', KEYS[2], id)
+  local uid = redis.call('HGET', key, 'user')
+  if uid then redis.call('SREM', prefix .. 'user:' .. uid, id) end
+  redis.call('EXPIRE', key, keep)
+end
+return 1
+"""
+
+class RedisJobStore:
+    shared = True
+
+    def __init__(self, url: str, flush_interval: float = 0.2, keep_days: int = 7):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("JOB_STORE=redis exige o pacote redis (pip install -r requirements-redis.txt)") from e
+        self.redis = redis.from_url(url)
+        self.flush_interval = flush_interval
+        self.keep_seconds = keep_days * 86400
+        self._ops: list[tuple] = []
+        self._wake = asyncio.Event()
+        self._claim = self.redis.register_script(CLAIM)
+        self._set_state = self.redis.register_script(SET_STATE)
+        self._queue_key = PREFIX + "queue"
+        self._leases_key = PREFIX + "leases"
+
+    # As operações síncronas do JobStore só enfileiram; run_flusher grava
+
+    def add(self, job: DownloadJob) -> None:
+        self._ops.append(("add", job))
+        self._wake.set()
+
+    def set_state(self, job_id: str, state: str, detail: str | None = None) -> None:
+        self._ops.append(("state", job_id, state, detail))
+
+    def load_unfinished(self) -> list[DownloadJob]:
+        # Em modo compartilhado nada é restaurado localmente: os leases vencidos
+        # voltam para a fila e outro worker (ou este, após o restart) reivindica
+        return []
+
+    async def _flush(self) -> None:
+        ops, self._ops = self._ops, []
+        if not ops:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for op in ops:
+            if op[0] == "add":
+                job = op[1]
+                now = time.time()
+                pipe.hset(PREFIX + "job:" + job.job_id, mapping={
+                    "state": "queued",
+                    "payload": json.dumps(asdict(job), ensure_ascii=False),
+                    "user": job.user_id,
+                    "cancel": 0,
+                })
+                pipe.zadd(self._queue_key, {job.job_id: now})
+                pipe.sadd(f"{PREFIX}user:{job.user_id}", job.job_id)
+            else:
+                _, job_id, state, detail = op
+                await self._set_state(
+                    keys=[self._queue_key, self._leases_key],
+                    args=[PREFIX, job_id, state, "1" if state in FINISHED else "0", self.keep_seconds, detail or ""],
+                    client=pipe,
+                )
+        await pipe.execute()
+
+    async def run_flusher(self) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self._flush()
+                except Exception:
+                    logging.exception("Falha ao gravar estado da fila no Redis")
+        except asyncio.CancelledError:
+            # Shutdown: grava o que ficou antes de sair
+            await self._flush()
+            raise
+
+    def close(self) -> None:
+        pass
+
+    # ---- modo compartilhado ----
+
+    @staticmethod
+    def _jobs(payloads) -> list[DownloadJob]:
+        jobs = []
+        for payload in payloads:
+            if payload is None:
+                continue
+            try:
+                jobs.append(DownloadJob(**json.loads(payload)))
+            except Exception as e:
+                logging.warning("Job no Redis ignorado (payload inválido): %s", e)
+        return jobs
+
+    async def claim(self, owner: str, limit: int, lease_seconds: float) -> list[DownloadJob]:
+        now = time.time()
+        payloads = await self._claim(
+            keys=[self._queue_key, self._leases_key],
+            args=[PREFIX, now, limit, owner, now + lease_seconds],
+        )
+        return self._jobs(payloads)
+
+    async def renew(self, owner: str, job_ids: list[str], lease_seconds: float) -> None:
+        if job_ids:
+            # XX: só renova o que ainda está com lease (não ressuscita finalizados)
+            until = time.time() + lease_seconds
+            await self.redis.zadd(self._leases_key, {j: until for j in job_ids}, xx=True)
+
+    async def request_cancel(self, job_ids: list[str]) -> None:
+        if job_ids:
+            pipe = self.redis.pipeline(transaction=False)
+            for j in job_ids:
+                pipe.hset(PREFIX + "job:" + j, "cancel", 1)
+            await pipe.execute()
+
+    async def cancelled(self, job_ids: list[str]) -> set[str]:
+        if not job_ids:
+            return set()
+        pipe = self.redis.pipeline(transaction=False)
+        for j in job_ids:
+            pipe.hget(PREFIX + "job:" + j, "cancel")
+        flags = await pipe.execute()
+        return {j for j, flag in zip(job_ids, flags) if flag in (b"1", "1")}
+
+    async def unfinished_of(self, user_id: int) -> list[DownloadJob]:
+        ids = await self.redis.smembers(f"{PREFIX}user:{user_id}")
+        if not ids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for j in ids:
+            key = PREFIX + "job:" + (j.decode() if isinstance(j, bytes) else j)
+            pipe.hmget(key, "state", "payload")
+        rows = await pipe.execute()
+        return self._jobs(p for state, p in rows if state is not None and state.decode() in UNFINISHED)
+
+    async def results(self, job_ids: list[str]) -> dict[str, tuple[str, str | None]]:
+        if not job_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for j in job_ids:
+            pipe.hmget(PREFIX + "job:" + j, "state", "detail")
+        rows = await pipe.execute()
+        out = {}
+        for j, (state, detail) in zip(job_ids, rows):
+            if state is not None and state.decode() in FINISHED:
+                out[j] = (state.decode(), detail.decode() if detail is not None else None)
+        return out
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+from bot.services import metrics
+
+# Limite de concorrência por site (extractor do yt-dlp, ou host para o
+# Generic), ajustado sozinho em AIMD a partir do que extract_info/download
+# observam:
+# - sucesso: +1/limite (cresce ~1 vaga por "janela" de jobs bem-sucedidos);
+# - throttle (429/403/"not a bot"): limite pela metade e backoff exponencial
+#   com jitter, durante o qual o site não inicia jobs novos;
+# - erro transitório de rede/5xx: limite x0.8, sem backoff.
+# Erros do próprio vídeo (privado, removido, URL inválida) não contam.
+# Cada site também tem um token bucket (limite x RATE_PER_SLOT inícios/s)
+# para não disparar vários jobs no mesmo instante quando as vagas abrem.
+
+OK = "ok"
+THROTTLED = "throttled"
+ERROR = "error"
+
+RATE_PER_SLOT = 2.0
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+# Falhas de jobs que estavam rodando juntos são um sinal só
+DECREASE_GUARD = 5.0
+ERROR_FACTOR = 0.8
+
+THROTTLE_MARKERS = (
+    "http error 429", "too many requests", "http error 403", "rate-limit", "rate limit", "not a bot",
+)
+TRANSIENT_MARKERS = (
+    "timed out", "timeout", "connection reset", "connection refused", "connection aborted",
+    "temporary failure", "remote end closed", "incompleteread", "incomplete read",
+    "http error 500", "http error 502", "http error 503", "http error 504",
+)
+
+def classify(exc: BaseException) -> str | None:
+    text = f"{type(exc).__name__}: {exc}".lower()
+    if any(m in text for m in THROTTLE_MARKERS):
+        return THROTTLED
+    if any(m in text for m in TRANSIENT_MARKERS):
+        return ERROR
+    return None
+
+class _Site:
+    __slots__ = ("cap", "limit", "running", "tokens", "refilled", "backoff_until", "strikes", "decreased_at")
+
+    def __init__(self, cap: int, start: int):
+        self.cap = max(1, cap)
+        self.limit = float(min(max(1, start), self.cap))
+        self.running = 0
+        self.tokens = 1.0
+        self.refilled = time.monotonic()
+        self.backoff_until = 0.0
+        self.strikes = 0
+        self.decreased_at = 0.0
+
+    def refill(self, now: float) -> None:
+        burst = max(1.0, self.limit)
+        self.tokens = min(burst, self.tokens + (now - self.refilled) * self.limit * RATE_PER_SLOT)
+        self.refilled = now
+
+class SiteLimiter:
+    def __init__(self, start: int = 2, cap: int = 4, caps: dict[str, int] | None = None):
+        self.start = start
+        self.cap = cap
+        self.caps = {k.lower(): v for k, v in (caps or {}).items()}
+        self.sites: dict[str, _Site] = {}
+        # host -> extractor visto numa extração bem-sucedida (falhas de
+        # extração só têm a URL)
+        self.aliases: dict[str, str] = {}
+
+    def site(self, url: str, extractor: str | None = None) -> str:
+        host = (urlsplit(url).hostname or "").lower()
+        for prefix in ("www.", "m."):
+            if host.startswith(prefix):
+                host = host[len(prefix):]
+        ex = (extractor or "").lower()
+        if ex and ex != "generic":
+            if host:
+                self.aliases[host] = ex
+            return ex
+        return self.aliases.get(host, host or "?")
+
+    def _get(self, site: str) -> _Site:
+        s = self.sites.get(site)
+        if s is None:
+            cap = self.caps.get(site, self.cap)
+            s = self.sites[site] = _Site(cap, self.start)
+        return s
+
+    def can_start(self, site: str) -> bool:
+        s = self._get(site)
+        now = time.monotonic()
+        if now < s.backoff_until or s.running >= int(s.limit):
+            return False
+        s.refill(now)
+        return s.tokens >= 1
+
+    def started(self, site: str) -> None:
+        s = self._get(site)
+        s.running += 1
+        s.tokens -= 1
+
+    def finished(self, site: str) -> None:
+        s = self._get(site)
+        s.running = max(0, s.running - 1)
+
+    def backoff_remaining(self, site: str) -> float:
+        return max(0.0, self._get(site).backoff_until - time.monotonic())
+
+    def record(self, site: str, outcome: str | None) -> None:
+        if outcome is None:
+            return
+        s = self._get(site)
+        now = time.monotonic()
+        if outcome == OK:
+            s.limit = min(float(s.cap), s.limit + 1 / s.limit)
+            s.strikes = 0
+        elif now - s.decreased_at >= DECREASE_GUARD:
+            s.decreased_at = now
+            if outcome == THROTTLED:
+                s.limit = max(1.0, s.limit / 2)
+                s.strikes += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (s.strikes - 1)) * random.uniform(0.5, 1.5)
+                s.backoff_until = now + delay
+                logging.warning("Site %s limitando: %d vaga(s), pausa de %.0fs", site, int(s.limit), delay)
+            else:
+                s.limit = max(1.0, s.limit * ERROR_FACTOR)
+        metrics.SITE_OUTCOMES.inc(site=site, outcome=outcome)
+        metrics.SITE_LIMIT.set(int(s.limit), site=site)
+
+_limiter: SiteLimiter | None = None
+
+def configure(start: int, cap: int, caps: dict[str, int] | None = None) -> None:
+    global _limiter
+    _limiter = SiteLimiter(start, cap, caps)
+
+def get_limiter() -> SiteLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = SiteLimiter()
+    return _limiter
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from bot.services import io_executor
+
+# Divide arquivos acima do limite de upload em partes menores usando o ffmpeg
+# do container. Mídia é cortada por tempo com "-c copy" (o segmenter corta no
+# keyframe seguinte, então a parte pode passar um pouco do alvo: se passar,
+# refaz com segmentos menores). Arquivos sem duração são divididos por bytes.
+
+MB = 1024 * 1024
+
+class SplitError(Exception):
+    pass
+
+async def _run(*args: str) -> tuple[int, bytes, bytes]:
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    return proc.returncode, out, err
+
+async def probe_duration(path: Path) -> float | None:
+    try:
+        code, out, _ = await _run(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", str(path)
+        )
+    except FileNotFoundError:
+        return None
+    if code != 0:
+        return None
+    try:
+        return float(json.loads(out)["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _clear_segments(out_dir: Path, suffix: str) -> None:
+    for old in out_dir.glob(f"seg*{suffix}"):
+        old.unlink()
+
+def _list_segments(out_dir: Path, suffix: str) -> list[Path]:
+    return sorted(out_dir.glob(f"seg*{suffix}"))
+
+async def _segment(path: Path, out_dir: Path, segment_time: float) -> list[Path]:
+    # Nomes fixos (títulos podem ter caracteres especiais para glob)
+    await io_executor.run(_clear_segments, out_dir, path.suffix)
+    code, _, err = await _run(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(path),
+        "-map", "0", "-c", "copy",
+        "-f", "segment",
+        "-segment_time", f"{segment_time:.3f}",
+        "-reset_timestamps", "1",
+        str(out_dir / f"seg%03d{path.suffix}"),
+    )
+    if code != 0:
+        raise SplitError(f"ffmpeg falhou: {err.decode(errors='ignore')[-300:]}")
+    return await io_executor.run(_list_segments, out_dir, path.suffix)
+
+def _rename_parts(path: Path, parts: list[Path]) -> list[Path]:
+    out = []
+    for i, p in enumerate(parts, 1):
+        dest = p.with_name(f"{path.stem[:80]}.part{i:02d}{path.suffix}")
+        p.replace(dest)
+        out.append(dest)
+    return out
+
+def _split_bytes(path: Path, out_dir: Path, part_bytes: int) -> list[Path]:
+    parts = []
+    with path.open("rb") as src:
+        while True:
+            first = src.read(min(MB, part_bytes))
+            if not first:
+                break
+            part = out_dir / f"{path.name}.{len(parts) + 1:03d}"
+            with part.open("wb") as dst:
+                dst.write(first)
+                left = part_bytes - len(first)
+                while left > 0 and (chunk := src.read(min(MB, left))):
+                    dst.write(chunk)
+                    left -= len(chunk)
+            parts.append(part)
+    return parts
+
+async def split_media(path: Path, max_mb: float, out_dir: Path, attempts: int = 4) -> list[Path]:
+    size = (await io_executor.run(path.stat)).st_size
+    limit = int(max_mb * MB)
+    if size <= limit:
+        return [path]
+
+    await io_executor.run(out_dir.mkdir, parents=True, exist_ok=True)
+    duration = await probe_duration(path)
+    if not duration:
+        # Sem duração (não é mídia ou sem ffprobe): divide por bytes (junta com cat)
+        return await io_executor.run(_split_bytes, path, out_dir, int(limit * 0.98))
+
+    # Alvo com folga: bitrate não é constante e o corte cai no keyframe
+    segment_time = duration * (limit / size) * 0.9
+    for _ in range(attempts):
+        parts = await _segment(path, out_dir, segment_time)
+        biggest = await io_executor.run(lambda: max((p.stat().st_size for p in parts), default=0))
+        if parts and biggest <= limit:
+            return await io_executor.run(_rename_parts, path, parts)
+        logging.info(
+            "Parte de %.1fMB acima do limite (%.1fMB) com segmentos de %.0fs; reduzindo",
+            biggest / MB, max_mb, segment_time,
+        )
+        segment_time *= 0.7 * (limit / biggest) if biggest else 0.7
+
+    raise SplitError("não foi possível dividir o arquivo abaixo do limite (keyframes muito espaçados?)")
@@ -1,32 +1,39 @@
 from __future__ import annotations
-import json
-import os
+import asyncio
+import logging
+import time
 from pathlib import Path
 from datetime import datetime, timezone
 
-from bot.utils.text import slugify
+from bot.services import io_executor
+from bot.services.history_store import HistoryStore
+
+# O histórico fica em SQLite no volume de dados. Nada dele roda no event loop:
+# save_link_record só enfileira e run_flusher grava em lote (uma transação)
+# no executor de I/O; as consultas do /links gravam o pendente antes, para o
+# usuário ver o que acabou de baixar, e rodam no mesmo executor.
 
 class StorageService:
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, flush_interval: float = 1.0, batch_size: int = 100):
         self.data_dir = Path(data_dir)
+        self.history = HistoryStore(self.data_dir / "history.sqlite3")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: list[tuple[int, dict, float]] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
 
     def user_dir(self, user_id: int) -> Path:
         return self.data_dir / "users" / str(user_id)
 
-    def temp_dir(self, user_id: int) -> Path:
-        d = self.user_dir(user_id) / "temp"
-        d.mkdir(parents=True, exist_ok=True)
-        return d
-
-    def links_dir(self, user_id: int) -> Path:
-        d = self.user_dir(user_id) / "links"
-        d.mkdir(parents=True, exist_ok=True)
-        return d
+    def job_dir(self, user_id: int, job_id: str) -> Path:
+        # Um diretório por job: jobs do mesmo usuário não se enxergam e a
+        # limpeza apaga só o que é do job. Criado pelo download.
+        return self.user_dir(user_id) / "temp" / job_id
 
-    def save_link_record(self, user_id: int, info: dict, original_url: str, selected: dict) -> Path:
+    def save_link_record(self, user_id: int, info: dict, original_url: str, selected: dict) -> None:
         title = info.get("title") or "item"
         vid = info.get("id") or "noid"
-        base = slugify(title)
         ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
         payload = {
@@ -38,15 +45,52 @@ class StorageService:
             "duration": info.get("duration"),
             "selected": selected,
         }
+        self._pending.append((user_id, payload, time.time()))
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        # O lock segura leituras até o lote em voo estar no banco
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if rows:
+                try:
+                    await io_executor.run(self.history.add_many, rows)
+                except Exception:
+                    self._pending[:0] = rows
+                    raise
+
+    async def run_flusher(self) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self.flush()
+                except Exception:
+                    logging.exception("Falha ao gravar histórico (%d registro(s) pendentes)", len(self._pending))
+        finally:
+            # Encerrando: grava o que sobrou direto, sem depender do loop
+            if self._pending:
+                self.history.add_many(self._pending)
+                self._pending = []
+
+    async def list_link_records(
+        self, user_id: int, limit: int = 20, offset: int = 0, query: str | None = None
+    ) -> list[dict]:
+        await self.flush()
+        return await io_executor.run(self.history.list, user_id, limit, offset, query)
 
-        path = self.links_dir(user_id) / f"{base}_{vid}_{ts}.json"
-        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-        return path
+    async def count_link_records(self, user_id: int, query: str | None = None) -> int:
+        await self.flush()
+        return await io_executor.run(self.history.count, user_id, query)
 
-    def list_link_records(self, user_id: int) -> list[Path]:
-        d = self.links_dir(user_id)
-        files = sorted(d.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-        return files
+    async def get_link_record(self, user_id: int, record_id: int) -> dict | None:
+        await self.flush()
+        return await io_executor.run(self.history.get, user_id, record_id)
 
-    def read_json(self, path: Path) -> dict:
-        return json.loads(path.read_text(encoding="utf-8"))
+    def migrate_link_records(self) -> int:
+        return self.history.migrate_json_records(self.data_dir / "users")
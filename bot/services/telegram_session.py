@@ -0,0 +1,36 @@
+from __future__ import annotations
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+
+# Sessão HTTP do bot com pool, keep-alive e timeouts ajustáveis.
+# Com BOT_API_URL aponta para um telegram-bot-api próprio (ou um stub local
+# em testes); com BOT_API_LOCAL=1 o servidor roda em modo --local e os
+# uploads passam só o caminho do arquivo (file://...), sem copiar os bytes
+# por HTTP. Nesse modo DATA_DIR precisa estar montado no mesmo caminho nos
+# dois containers.
+
+class TunedAiohttpSession(AiohttpSession):
+    def __init__(
+        self,
+        api: TelegramAPIServer,
+        pool_size: int,
+        timeout: float,
+        keepalive: float,
+        upload_timeout: float,
+    ):
+        super().__init__(api=api, limit=pool_size, timeout=timeout)
+        self._connector_init["keepalive_timeout"] = keepalive
+        # Lido pelo telegram_uploader: uploads grandes passam do timeout padrão
+        self.upload_timeout = upload_timeout
+
+def build_session(settings) -> TunedAiohttpSession:
+    api = PRODUCTION
+    if settings.bot_api_url:
+        api = TelegramAPIServer.from_base(settings.bot_api_url, is_local=settings.bot_api_local)
+    return TunedAiohttpSession(
+        api,
+        pool_size=settings.bot_api_pool_size,
+        timeout=settings.bot_api_timeout_seconds,
+        keepalive=settings.bot_api_keepalive_seconds,
+        upload_timeout=settings.upload_timeout_seconds,
+    )
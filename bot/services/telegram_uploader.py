@@ -1,27 +1,156 @@
 from __future__ import annotations
+import asyncio
+import logging
+import time
 from pathlib import Path
 
 from aiogram import Bot
-from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import FSInputFile, InputFile
+
+from bot.services import io_executor, metrics
+from bot.services.file_cache import CachedFile
 
 VIDEO_EXT = {".mp4", ".mkv", ".webm", ".mov"}
 AUDIO_EXT = {".mp3", ".m4a", ".opus", ".ogg", ".flac", ".wav"}
 
-async def send_file(bot: Bot, chat_id: int, file_path: Path, caption: str | None, force_document: bool) -> str:
+def media_kind(file_path: Path, force_document: bool) -> str:
     ext = file_path.suffix.lower()
-    f = FSInputFile(str(file_path))
-
     if force_document:
-        msg = await bot.send_document(chat_id=chat_id, document=f, caption=caption)
-        return msg.document.file_id
-
+        return "document"
     if ext in VIDEO_EXT:
-        msg = await bot.send_video(chat_id=chat_id, video=f, caption=caption, supports_streaming=True)
-        return msg.video.file_id
-
+        return "video"
     if ext in AUDIO_EXT:
-        msg = await bot.send_audio(chat_id=chat_id, audio=f, caption=caption)
-        return msg.audio.file_id
+        return "audio"
+    return "document"
+
+def _local_media(bot: Bot, file_path: Path) -> InputFile | str:
+    # Bot API server em modo --local lê o arquivo do disco: basta o caminho
+    if bot.session.api.is_local:
+        return file_path.resolve().as_uri()
+    return FSInputFile(str(file_path))
+
+def _total_size(paths: list[Path]) -> int:
+    # Bytes enviados (para a métrica); arquivo que sumiu conta 0
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+def _upload_timeout(bot: Bot) -> float | None:
+    # Definido pela TunedAiohttpSession; None mantém o timeout da sessão
+    return getattr(bot.session, "upload_timeout", None)
 
-    msg = await bot.send_document(chat_id=chat_id, document=f, caption=caption)
+async def _send(
+    bot: Bot,
+    chat_id: int,
+    kind: str,
+    media: InputFile | str,
+    caption: str | None,
+    request_timeout: float | None = None,
+) -> str:
+    # media pode ser um InputFile (upload), um file_id (reenvio) ou um
+    # file:// (Bot API local)
+    if kind == "video":
+        msg = await bot.send_video(
+            chat_id=chat_id, video=media, caption=caption, supports_streaming=True,
+            request_timeout=request_timeout,
+        )
+        return msg.video.file_id
+    if kind == "audio":
+        msg = await bot.send_audio(chat_id=chat_id, audio=media, caption=caption, request_timeout=request_timeout)
+        return msg.audio.file_id
+    msg = await bot.send_document(chat_id=chat_id, document=media, caption=caption, request_timeout=request_timeout)
     return msg.document.file_id
+
+async def send_file(
+    bot: Bot,
+    chat_id: int,
+    file_path: Path,
+    caption: str | None,
+    force_document: bool,
+    input_file: InputFile | None = None,
+    extractor: str = "",
+) -> CachedFile:
+    # input_file permite enviar de outra fonte (ex.: arquivo ainda crescendo
+    # no modo pipeline); file_path continua definindo nome e tipo de mídia.
+    kind = media_kind(file_path, force_document)
+    f = input_file or _local_media(bot, file_path)
+    t0 = time.perf_counter()
+    file_id = await _send(bot, chat_id, kind, f, caption, _upload_timeout(bot))
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload", extractor=extractor)
+    if metrics.REGISTRY.enabled:
+        size = await io_executor.run(_total_size, [file_path])
+        if size:
+            metrics.BYTES.inc(size, direction="up", extractor=extractor)
+    return CachedFile(file_id, kind, file_path.name)
+
+def _part_caption(caption: str | None, idx: int, total: int) -> str:
+    suffix = f"(parte {idx}/{total})"
+    return f"{caption} {suffix}" if caption else suffix
+
+async def _send_part_with_retry(
+    bot: Bot,
+    chat_id: int,
+    kind: str,
+    part: Path,
+    caption: str,
+    retries: int,
+) -> str:
+    attempt = 0
+    while True:
+        try:
+            return await _send(bot, chat_id, kind, _local_media(bot, part), caption, _upload_timeout(bot))
+        except TelegramRetryAfter as e:
+            # Flood control não é falha do upload: espera sem gastar tentativa
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest:
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt >= retries:
+                # Propaga o erro real da última tentativa
+                raise
+            logging.info("Falha no upload de %s (tentativa %d/%d): %s", part.name, attempt, retries, e)
+            await asyncio.sleep(2 ** attempt)
+
+async def send_parts(
+    bot: Bot,
+    chat_id: int,
+    parts: list[Path],
+    caption: str | None,
+    force_document: bool,
+    concurrency: int = 3,
+    retries: int = 3,
+    extractor: str = "",
+) -> CachedFile:
+    # Sobe as partes em paralelo (limitado), cada uma com retry próprio.
+    # As mensagens podem chegar fora de ordem; a legenda numerada resolve.
+    sem = asyncio.Semaphore(concurrency)
+    total = len(parts)
+
+    async def one(idx: int, part: Path) -> str:
+        async with sem:
+            kind = media_kind(part, force_document)
+            return await _send_part_with_retry(
+                bot, chat_id, kind, part, _part_caption(caption, idx, total), retries
+            )
+
+    t0 = time.perf_counter()
+    file_ids = await asyncio.gather(*(one(i, p) for i, p in enumerate(parts, 1)))
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload", extractor=extractor)
+    if metrics.REGISTRY.enabled:
+        metrics.BYTES.inc(await io_executor.run(_total_size, parts), direction="up", extractor=extractor)
+    return CachedFile(
+        file_id=file_ids[0],
+        kind=media_kind(parts[0], force_document),
+        filename=parts[0].name,
+        parts=tuple(file_ids),
+    )
+
+async def send_cached(bot: Bot, chat_id: int, cached: CachedFile, caption: str | None) -> None:
+    # Reenvio por file_id: sem disco e sem upload. Lança TelegramBadRequest
+    # se o Telegram não reconhecer mais o file_id.
+    if cached.parts:
+        total = len(cached.parts)
+        for idx, file_id in enumerate(cached.parts, 1):
+            await _send(bot, chat_id, cached.kind, file_id, _part_caption(caption, idx, total))
+        return
+    await _send(bot, chat_id, cached.kind, cached.file_id, caption)
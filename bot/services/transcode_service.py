@@ -0,0 +1,236 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable
+
+from bot.services import io_executor, metrics
+from bot.services.split_service import MB
+
+# Encaixa no limite de upload um arquivo que passou dele, com o ffmpeg do
+# container, em etapas do mais barato para o mais caro:
+#   1. remux (-c copy para mp4/m4a com faststart): só tira overhead de container;
+#   2. reencode calculado para cair logo abaixo do limite: só o áudio quando
+#      não há vídeo; senão vídeo (x264) + áudio (AAC) com bitrate = limite /
+#      duração, reduzindo a resolução quando o bitrate fica baixo.
+# Os ffmpeg rodam num pool limitado (fila própria, FIFO) com prioridade baixa
+# (nice) e threads repartidas entre as vagas: encodes pesados não tiram CPU
+# dos downloads. cancel_check (o mesmo do /cancel) mata o processo.
+
+# Folga sobre o limite: o bitrate médio do encoder oscila um pouco
+TARGET_RATIO = 0.94
+# Abaixo disso o vídeo fica ruim demais: melhor dividir em partes
+MIN_VIDEO_KBPS = 150
+MIN_AUDIO_KBPS = 32
+MAX_AUDIO_KBPS = 128
+# (kbps de vídeo abaixo do qual, altura máxima)
+SCALE_STEPS = ((400, 360), (800, 480), (1500, 720))
+ENCODE_ATTEMPTS = 2
+CANCEL_POLL_INTERVAL = 0.5
+NICE = 10
+
+class TranscodeError(Exception):
+    pass
+
+class TranscodeCancelled(Exception):
+    pass
+
+class TranscodePool:
+    def __init__(self, size: int = 0):
+        cpus = os.cpu_count() or 1
+        # Padrão: metade das CPUs em encodes simultâneos, 2 threads cada
+        self.size = size if size > 0 else max(1, cpus // 2)
+        self.threads = max(1, cpus // self.size)
+        self._slots = asyncio.Semaphore(self.size)
+        self.waiting = 0
+
+    def busy(self) -> bool:
+        return self._slots.locked()
+
+    async def _acquire(self, cancel_check: Callable[[], bool]) -> None:
+        self.waiting += 1
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), timeout=CANCEL_POLL_INTERVAL)
+                    return
+                except asyncio.TimeoutError:
+                    if cancel_check():
+                        raise TranscodeCancelled() from None
+        finally:
+            self.waiting -= 1
+
+    async def run(
+        self,
+        args: list[str],
+        duration: float | None,
+        cancel_check: Callable[[], bool],
+        on_progress: Callable[[float], None],
+    ) -> None:
+        # Um ffmpeg numa vaga do pool; progresso (0..1) vem de -progress pipe:1
+        await self._acquire(cancel_check)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+                "-progress", "pipe:1", "-nostats",
+                # -threads vale para a saída: vai logo antes do arquivo de destino
+                *args[:-1], "-threads", str(self.threads), args[-1],
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                preexec_fn=lambda: os.nice(NICE),
+            )
+
+            async def read_progress() -> None:
+                async for line in proc.stdout:
+                    key, _, value = line.decode(errors="ignore").strip().partition("=")
+                    if key == "out_time_us" and duration and value.isdigit():
+                        on_progress(min(1.0, int(value) / 1e6 / duration))
+
+            reader = asyncio.create_task(read_progress())
+            stderr = asyncio.create_task(proc.stderr.read())
+            waiter = asyncio.create_task(proc.wait())
+            try:
+                while not waiter.done():
+                    await asyncio.wait({waiter}, timeout=CANCEL_POLL_INTERVAL)
+                    if not waiter.done() and cancel_check():
+                        raise TranscodeCancelled()
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                await asyncio.gather(reader, stderr, waiter, return_exceptions=True)
+            if proc.returncode != 0:
+                err = stderr.result().decode(errors="ignore")[-300:]
+                raise TranscodeError(f"ffmpeg falhou: {err}")
+        finally:
+            self._slots.release()
+
+_pool: TranscodePool | None = None
+
+def configure(size: int) -> None:
+    global _pool
+    _pool = TranscodePool(size)
+
+def _get_pool() -> TranscodePool:
+    global _pool
+    if _pool is None:
+        _pool = TranscodePool()
+    return _pool
+
+async def _probe(path: Path) -> dict:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration:stream=codec_type,codec_name,height",
+            "-of", "json", str(path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        return {}
+    out, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return {}
+    try:
+        return json.loads(out)
+    except ValueError:
+        return {}
+
+def _bitrates(limit: int, duration: float, has_video: bool, factor: float) -> tuple[int, int]:
+    # (kbps de vídeo, kbps de áudio) para o arquivo inteiro caber em limit
+    total = limit * 8 / 1000 / duration * TARGET_RATIO * factor
+    if not has_video:
+        return 0, int(min(MAX_AUDIO_KBPS * 2, total))
+    audio = int(min(MAX_AUDIO_KBPS, max(MIN_AUDIO_KBPS, total * 0.1)))
+    return int(total - audio), audio
+
+def _encode_args(src: Path, dst: Path, video_kbps: int, audio_kbps: int, height: int | None) -> list[str]:
+    if not video_kbps:
+        return ["-i", str(src), "-vn", "-c:a", "aac", "-b:a", f"{audio_kbps}k", str(dst)]
+    args = ["-i", str(src), "-map", "0:v:0", "-map", "0:a:0?"]
+    for max_kbps, max_height in SCALE_STEPS:
+        if video_kbps < max_kbps and (height is None or height > max_height):
+            args += ["-vf", f"scale=-2:'min(ih,{max_height})'"]
+            break
+    return args + [
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-b:v", f"{video_kbps}k", "-maxrate", f"{int(video_kbps * 1.3)}k", "-bufsize", f"{video_kbps * 2}k",
+        "-c:a", "aac", "-b:a", f"{audio_kbps}k",
+        "-movflags", "+faststart",
+        str(dst),
+    ]
+
+async def shrink(
+    path: Path,
+    max_mb: float,
+    out_dir: Path,
+    cancel_check: Callable[[], bool],
+    on_status: Callable[[str], None],
+) -> Path | None:
+    # Retorna um arquivo dentro do limite, ou None se não dá sem estragar a
+    # mídia (sem duração, bitrate necessário baixo demais): o chamador divide
+    # ou falha como antes
+    limit = int(max_mb * MB)
+    if (await io_executor.run(path.stat)).st_size <= limit:
+        return path
+    pool = _get_pool()
+    info = await _probe(path)
+    try:
+        duration = float(info["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if duration <= 0:
+        return None
+    streams = info.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video" and s.get("codec_name") not in ("mjpeg", "png")), None)
+    await io_executor.run(out_dir.mkdir, parents=True, exist_ok=True)
+    ext = ".mp4" if video else ".m4a"
+    dst = out_dir / f"{path.stem[:80]}{ext}"
+
+    def progress(label: str) -> Callable[[float], None]:
+        return lambda f: on_status(f"{label}... {f * 100:.0f}%")
+
+    def wait_status() -> None:
+        if pool.busy():
+            ahead = f" ({pool.waiting} na frente)" if pool.waiting else ""
+            on_status(f"Na fila para comprimir{ahead}...")
+
+    # 1. Remux: barato, às vezes basta
+    wait_status()
+    try:
+        await pool.run(
+            ["-i", str(path), "-map", "0:v?", "-map", "0:a?", "-c", "copy", "-movflags", "+faststart", str(dst)],
+            duration, cancel_check, progress("Remuxando"),
+        )
+        if (await io_executor.run(dst.stat)).st_size <= limit:
+            metrics.TRANSCODES.inc(result="remux")
+            return dst
+    except TranscodeError as e:
+        logging.info("Remux de %s falhou, tentando reencode: %s", path.name, e)
+
+    # 2. Reencode no bitrate que cabe; se o encoder passar do alvo, refaz
+    # com o bitrate reduzido na proporção do excesso
+    height = video.get("height") if video else None
+    factor = 1.0
+    for _ in range(ENCODE_ATTEMPTS):
+        video_kbps, audio_kbps = _bitrates(limit, duration, video is not None, factor)
+        if video is not None and video_kbps < MIN_VIDEO_KBPS:
+            metrics.TRANSCODES.inc(result="too_long")
+            return None
+        if video is None and audio_kbps < MIN_AUDIO_KBPS:
+            metrics.TRANSCODES.inc(result="too_long")
+            return None
+        wait_status()
+        await pool.run(
+            _encode_args(path, dst, video_kbps, audio_kbps, height),
+            duration, cancel_check, progress("Comprimindo para caber no limite"),
+        )
+        size = (await io_executor.run(dst.stat)).st_size
+        if size <= limit:
+            metrics.TRANSCODES.inc(result="encode")
+            return dst
+        logging.info("Reencode ficou com %.1fMB (limite %.1fMB); refazendo", size / MB, max_mb)
+        factor *= 0.95 * limit / size
+    metrics.TRANSCODES.inc(result="failed")
+    return None
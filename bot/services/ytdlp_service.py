@@ -1,20 +1,38 @@
 from __future__ import annotations
-import asyncio
-import os
+import logging
+import random
+import threading
+import time
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable
 
 import yt_dlp
 
+from bot.services import metrics
+from bot.services.executor import ThreadBackend, create_executor
+from bot.services import download_profiles, proxy_pool, site_limiter
+
+# Proxies diferentes tentados numa extração antes de desistir
+EXTRACT_PROXY_ATTEMPTS = 3
+# Com limite de banda, downloads HTTP vão em pedaços deste tamanho: o
+# ratelimit do yt-dlp é uma média desde o início da requisição, então um
+# limite que cai no meio de uma requisição longa vira uma pausa longa
+SHAPED_CHUNK_BYTES = 10 * 1024 * 1024
+
 class DownloadCancelled(Exception):
     pass
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FormatOption:
     format_id: str
     label: str
     filesize_mb: float | None
+    # Arquivo único via HTTP, sem merge nem fixup: pode ser enviado em pipeline
+    streamable: bool = False
+    # Protocolo do yt-dlp ("https", "m3u8_native", "https+https" com merge):
+    # escolhe o perfil de download
+    protocol: str | None = None
 
 def _filesize_mb(fmt: dict) -> float | None:
     size = fmt.get("filesize") or fmt.get("filesize_approx")
@@ -22,9 +40,101 @@ def _filesize_mb(fmt: dict) -> float | None:
         return None
     return float(size) / (1024 * 1024)
 
+def _estimate_mb(fmt: dict, duration: float | None) -> tuple[float | None, bool]:
+    # (tamanho em MB, é estimativa?). Sem filesize, usa bitrate (kbps) x duração.
+    mb = _filesize_mb(fmt)
+    if mb is not None:
+        return mb, False
+    if not duration:
+        return None, False
+    kbps = fmt.get("tbr")
+    if not kbps:
+        parts = [fmt.get("vbr") or 0, fmt.get("abr") or 0]
+        kbps = sum(parts) or None
+    if not kbps:
+        return None, False
+    return float(kbps) * 1000 / 8 * float(duration) / (1024 * 1024), True
+
+def _has(codec: str | None) -> bool:
+    return bool(codec) and codec != "none"
+
+def _size_txt(mb: float | None, estimated: bool) -> str:
+    if mb is None:
+        return "?"
+    return f"~{mb:.1f}MB" if estimated else f"{mb:.1f}MB"
+
+def _quality(f: dict) -> tuple:
+    return (f.get("height") or 0, f.get("tbr") or f.get("vbr") or 0)
+
+def _best_fit(formats: list[dict], duration: float | None, max_upload_mb: int) -> list[FormatOption]:
+    # Sintetiza "o melhor que cabe": par vídeo+áudio (ou progressivo) e áudio,
+    # usando o tamanho real ou estimado para respeitar o limite de upload.
+    budget = max_upload_mb * 0.97  # folga para o container do merge
+    sized = []
+    for f in formats:
+        if not f.get("format_id"):
+            continue
+        mb, est = _estimate_mb(f, duration)
+        if mb is not None:
+            sized.append((f, mb, est))
+
+    videos = [x for x in sized if _has(x[0].get("vcodec")) and not _has(x[0].get("acodec"))]
+    audios = [x for x in sized if _has(x[0].get("acodec")) and not _has(x[0].get("vcodec"))]
+    muxed = [x for x in sized if _has(x[0].get("vcodec")) and _has(x[0].get("acodec"))]
+
+    out = []
+
+    best_audio = max(
+        (a for a in audios if a[1] <= budget),
+        key=lambda a: (a[0].get("abr") or a[0].get("tbr") or 0, -a[1]),
+        default=None,
+    )
+
+    candidates = []  # (qualidade, format_id, mb, estimado, ext, protocolo)
+    for v, vmb, vest in videos:
+        # Melhor áudio que ainda cabe junto com este vídeo
+        fit_audio = max(
+            (a for a in audios if vmb + a[1] <= budget),
+            key=lambda a: (a[0].get("abr") or a[0].get("tbr") or 0, -a[1]),
+            default=None,
+        )
+        if fit_audio is None:
+            continue
+        a, amb, aest = fit_audio
+        ext = "mp4" if v.get("ext") == "mp4" and a.get("ext") == "m4a" else "mkv"
+        protocol = f"{v.get('protocol') or '?'}+{a.get('protocol') or '?'}"
+        candidates.append((_quality(v), f"{v['format_id']}+{a['format_id']}", vmb + amb, vest or aest, ext, protocol))
+    for m, mmb, mest in muxed:
+        if mmb <= budget:
+            candidates.append((_quality(m), m["format_id"], mmb, mest, m.get("ext") or "?", m.get("protocol")))
+
+    if candidates:
+        q, fid, mb, est, ext, protocol = max(candidates, key=lambda c: (c[0], -c[2]))
+        qual = f"{q[0]}p" if q[0] else "vídeo"
+        out.append(FormatOption(
+            format_id=fid,
+            label=f"⭐ Melhor que cabe: {qual} {ext} — {_size_txt(mb, est)}",
+            filesize_mb=mb,
+            protocol=protocol,
+        ))
+
+    if best_audio is not None:
+        a, amb, aest = best_audio
+        abr = a.get("abr") or a.get("tbr")
+        qual = f"{int(abr)}kbps" if abr else "áudio"
+        out.append(FormatOption(
+            format_id=a["format_id"],
+            label=f"⭐ Melhor áudio que cabe: {qual} {a.get('ext') or '?'} — {_size_txt(amb, aest)}",
+            filesize_mb=amb,
+            protocol=a.get("protocol"),
+        ))
+    return out
+
 def build_options(info: dict, max_upload_mb: int) -> list[FormatOption]:
+    duration = info.get("duration")
+    formats = info.get("formats", [])
     out = []
-    for f in info.get("formats", []):
+    for f in formats:
         fid = f.get("format_id")
         if not fid:
             continue
@@ -35,8 +145,8 @@ def build_options(info: dict, max_upload_mb: int) -> list[FormatOption]:
         height = f.get("height")
         abr = f.get("abr")
 
-        mb = _filesize_mb(f)
-        size_txt = f"{mb:.1f}MB" if mb is not None else "?"
+        mb, estimated = _estimate_mb(f, duration)
+        size_txt = _size_txt(mb, estimated)
         ok = (mb is not None and mb <= max_upload_mb)
         flag = "OK" if ok else "GRANDE"
 
@@ -49,7 +159,14 @@ def build_options(info: dict, max_upload_mb: int) -> list[FormatOption]:
         else:
             label = f"📦 {ext} — {size_txt} [{flag}]"
 
-        out.append(FormatOption(format_id=fid, label=label, filesize_mb=mb))
+        streamable = (
+            f.get("protocol") in ("http", "https")
+            and not str(f.get("container") or "").endswith("_dash")
+        )
+
+        out.append(FormatOption(
+            format_id=fid, label=label, filesize_mb=mb, streamable=streamable, protocol=f.get("protocol"),
+        ))
 
     def _score(o: FormatOption) -> tuple:
         # Prefer menores (cabem), depois maiores
@@ -58,19 +175,129 @@ def build_options(info: dict, max_upload_mb: int) -> list[FormatOption]:
         return (fits, size)
 
     out.sort(key=_score)
-    return out[:30]
 
-def _extract_info_sync(url: str, proxy: str | None, cookies_file: str | None) -> dict:
-    opts = {"quiet": True, "noprogress": True}
-    if proxy:
-        opts["proxy"] = proxy
-    if cookies_file:
-        opts["cookiefile"] = cookies_file
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        return ydl.extract_info(url, download=False)
+    # O melhor que cabe vai primeiro no teclado
+    best = _best_fit(formats, duration, max_upload_mb)
+    best_ids = {o.format_id for o in best}
+    return (best + [o for o in out if o.format_id not in best_ids])[:30]
+
+# Executor do yt-dlp (threads ou processos); main.py chama configure()
+_executor = None
+# YoutubeDL de extração reaproveitado por worker (thread ou processo): não é
+# thread-safe, então cada worker tem os seus, um por (proxy, cookies)
+_local = threading.local()
+
+def configure(kind: str, size: int) -> None:
+    global _executor
+    _executor = create_executor(kind, size, warmup=warmup)
+
+def shutdown() -> None:
+    if _executor is not None:
+        _executor.shutdown()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadBackend(4)
+    return _executor
 
-async def extract_info(url: str, proxy: str | None, cookies_file: str | None) -> dict:
-    return await asyncio.to_thread(_extract_info_sync, url, proxy, cookies_file)
+def warmup() -> None:
+    # Roda uma vez em cada processo do pool: carrega as classes de extractor
+    # antes do primeiro link, em vez de pagar isso na primeira extração
+    list(yt_dlp.extractor.gen_extractor_classes())
+
+def _extractor_ydl(proxy: str | None, cookies_file: str | None, playlist_end: int | None) -> yt_dlp.YoutubeDL:
+    cache = getattr(_local, "ydls", None)
+    if cache is None:
+        cache = _local.ydls = {}
+    key = (proxy, cookies_file, playlist_end)
+    ydl = cache.get(key)
+    if ydl is None:
+        # Playlists vêm "flat": só url/id/título de cada item, sem extrair
+        # os vídeos; cada item é extraído quando o worker for baixá-lo
+        opts = {"quiet": True, "noprogress": True, "extract_flat": "in_playlist"}
+        if playlist_end:
+            opts["playlistend"] = playlist_end
+        if proxy:
+            opts["proxy"] = proxy
+        if cookies_file:
+            opts["cookiefile"] = cookies_file
+        ydl = cache[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+# Política de formato do modo lote: um seletor do yt-dlp aplicado a todos os
+# itens. O formato de cada item é resolvido pelo próprio yt-dlp na hora do
+# download (sem extração extra); "<?" aceita formatos sem tamanho conhecido,
+# e o que passar do limite cai no split.
+POLICIES = {
+    "video": "⭐ Melhor vídeo que cabe",
+    "audio": "🎵 Melhor áudio que cabe",
+}
+
+def policy_format(policy: str, max_upload_mb: int) -> str:
+    def fits(mb: float) -> str:
+        return f"[filesize<?{int(mb)}M][filesize_approx<?{int(mb)}M]"
+
+    if policy == "audio":
+        return f"ba{fits(max_upload_mb)}/wa"
+    if policy == "video":
+        # Orçamento aproximado do par vídeo+áudio: 85% / 12% do limite
+        v, a = max_upload_mb * 0.85, max(1, max_upload_mb * 0.12)
+        return f"bv*{fits(v)}+ba{fits(a)}/b{fits(max_upload_mb)}/wv*+wa/w"
+    raise ValueError(f"política desconhecida: {policy!r}")
+
+def playlist_entries(info: dict) -> list[dict] | None:
+    # Itens de uma playlist extraída em modo flat; None se não for playlist
+    if info.get("_type") != "playlist":
+        return None
+    out = []
+    for e in info.get("entries") or []:
+        url = e.get("url") or e.get("webpage_url")
+        if url:
+            out.append(e | {"url": url})
+    return out
+
+def _extract_info_sync(url: str, proxy: str | None, cookies_file: str | None, playlist_end: int | None) -> dict:
+    ydl = _extractor_ydl(proxy, cookies_file, playlist_end)
+    # sanitize_info: só tipos serializáveis (atravessa o pool de processos)
+    return ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+async def extract_info(
+    url: str,
+    cookies_file: str | None,
+    playlist_end: int | None = None,
+) -> dict:
+    t0 = time.perf_counter()
+    limiter = site_limiter.get_limiter()
+    pool = proxy_pool.get_pool()
+    # Falha de rede/throttle num proxy: tenta de novo por outro
+    tried: list[str | None] = []
+    while True:
+        proxy = pool.pick(exclude=tried)
+        try:
+            with pool.using(proxy):
+                info = await _get_executor().run(_extract_info_sync, url, proxy, cookies_file, playlist_end)
+            break
+        except Exception as e:
+            failed = proxy_pool.is_proxy_failure(e)
+            if failed:
+                pool.report(proxy, ok=False)
+            tried.append(proxy)
+            if failed and proxy is not None and len(tried) < EXTRACT_PROXY_ATTEMPTS and pool.has_other(tried):
+                logging.info("Extração falhou pelo proxy (%s); tentando outro", e)
+                continue
+            metrics.EXTRACT_ERRORS.inc(error=type(e).__name__)
+            limiter.record(limiter.site(url), site_limiter.classify(e))
+            raise
+    pool.report(proxy, ok=True)
+    extractor = str(info.get("extractor_key") or info.get("extractor") or "").lower()
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="extract", extractor=extractor)
+    limiter.record(limiter.site(url, extractor), site_limiter.OK)
+    return info
+
+def _retry_sleep(n: int) -> float:
+    # Retentativas internas do yt-dlp (HTTP/fragmento): exponencial com jitter
+    return min(30.0, 2.0 ** n) * random.uniform(0.5, 1.5)
 
 def _download_sync(
     url: str,
@@ -78,47 +305,98 @@ def _download_sync(
     out_dir: Path,
     proxy: str | None,
     cookies_file: str | None,
+    tuning: dict,
     cancel_check: Callable[[], bool],
     progress_cb: Callable[[dict], None],
+    rate_limit: Callable[[], float | None],
 ) -> Path:
     out_dir.mkdir(parents=True, exist_ok=True)
+    # Downloads segmentados copiam os params uma vez e cada thread de
+    # fragmento aplica o ratelimit sozinha: divide entre elas
+    fragments = max(1, tuning.get("concurrent_fragment_downloads") or 1)
+    ydl = None
+
+    def current_rate() -> float | None:
+        rate = rate_limit()
+        return rate / fragments if rate else None
 
     def hook(d: dict):
         if cancel_check():
             raise DownloadCancelled("cancelled")
+        # Downloads HTTP leem ydl.params a cada bloco: a parte da banda
+        # acompanha quem entra e sai
+        if ydl is not None:
+            ydl.params["ratelimit"] = current_rate()
         progress_cb(d)
 
     opts = {
         "quiet": True,
+        # Progresso vai pelo hook; sem a barra do yt-dlp no stdout
+        "noprogress": True,
         "format": format_id,
         "outtmpl": str(out_dir / "%(title).80s_%(id)s.%(ext)s"),
         "progress_hooks": [hook],
         "noplaylist": True,
         "retries": 3,
+        "fragment_retries": 5,
+        "retry_sleep_functions": {"http": _retry_sleep, "fragment": _retry_sleep},
+        # Retoma .part deixado por um job interrompido (restart/crash)
+        "continuedl": True,
+        **tuning,
     }
+    rate = current_rate()
+    if rate:
+        opts["ratelimit"] = rate
     if proxy:
         opts["proxy"] = proxy
     if cookies_file:
         opts["cookiefile"] = cookies_file
 
     with yt_dlp.YoutubeDL(opts) as ydl:
-        ydl.download([url])
+        info = ydl.extract_info(url, download=True)
 
-    # Pega o arquivo mais recente no diretório
-    files = sorted(out_dir.glob("*"), key=lambda p: p.stat().st_mtime, reverse=True)
-    if not files:
+    # Caminho final informado pelo próprio yt-dlp (já após merge/remux)
+    downloads = info.get("requested_downloads") or []
+    filepath = downloads[-1].get("filepath") if downloads else info.get("filepath")
+    if not filepath or not Path(filepath).exists():
         raise RuntimeError("Download finalizou, mas nenhum arquivo foi encontrado.")
-    return files[0]
+    return Path(filepath)
 
 async def download(
     url: str,
     format_id: str,
     out_dir: Path,
-    proxy: str | None,
     cookies_file: str | None,
     cancel_check: Callable[[], bool],
     progress_cb: Callable[[dict], None],
+    extractor: str | None = None,
+    protocol: str | None = None,
+    filesize_mb: float | None = None,
+    rate_fn: Callable[[], float | None] | None = None,
 ) -> Path:
-    return await asyncio.to_thread(
-        _download_sync, url, format_id, out_dir, proxy, cookies_file, cancel_check, progress_cb
-    )
+    limiter = site_limiter.get_limiter()
+    site = limiter.site(url, extractor)
+    profile = download_profiles.choose_profile(protocol, filesize_mb)
+    tuning = profile.opts()
+    if rate_fn is not None:
+        tuning.setdefault("http_chunk_size", SHAPED_CHUNK_BYTES)
+    metrics.DOWNLOAD_PROFILES.inc(profile=profile.name)
+    # Um proxy por job, o melhor no momento (o download todo usa o mesmo)
+    pool = proxy_pool.get_pool()
+    proxy = pool.pick()
+    try:
+        with pool.using(proxy):
+            path = await _get_executor().run_job(
+                _download_sync, (url, format_id, out_dir, proxy, cookies_file, tuning),
+                cancel_check, progress_cb, rate_fn,
+            )
+    except DownloadCancelled:
+        raise
+    except Exception as e:
+        if proxy_pool.is_proxy_failure(e):
+            pool.report(proxy, ok=False)
+        limiter.record(site, site_limiter.classify(e))
+        raise
+    pool.report(proxy, ok=True)
+    limiter.record(site, site_limiter.OK)
+    return path
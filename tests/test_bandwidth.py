@@ -0,0 +1,60 @@
+from __future__ import annotations
+import math
+
+import pytest
+
+from bot.services import download_profiles
+from bot.services.bandwidth import HEADROOM, BandwidthBudget, _water_fill
+from bot.services.download_profiles import MB, choose_profile
+
+def test_water_fill_is_max_min_fair():
+    assert _water_fill(90, {"a": math.inf, "b": math.inf, "c": math.inf}) == {"a": 30, "b": 30, "c": 30}
+    # Quem pede pouco leva tudo o que pediu; a sobra vai para os outros
+    assert _water_fill(90, {"a": 10, "b": math.inf, "c": math.inf}) == {"a": 10, "b": 40, "c": 40}
+    assert _water_fill(90, {"a": 10, "b": 20}) == {"a": 10, "b": 20}
+    assert _water_fill(math.inf, {"a": 5, "b": math.inf}) == {"a": 5, "b": math.inf}
+    assert _water_fill(90, {}) == {}
+
+def test_budget_splits_between_users_then_jobs():
+    budget = BandwidthBudget(total_bps=120, user_bps=100)
+    budget.register("a1", 1)
+    budget.register("a2", 1)
+    budget.register("b1", 2)
+    # Dois usuários: 60 cada; os dois jobs do usuário 1 dividem os 60 dele
+    assert (budget.share("a1"), budget.share("a2"), budget.share("b1")) == (30, 30, 60)
+    budget.release("b1")
+    # Sozinho, o usuário 1 esbarra no teto por usuário
+    assert (budget.share("a1"), budget.share("a2")) == (50, 50)
+    assert budget.share("sumiu") is None
+
+def test_slow_job_gives_spare_bandwidth_to_others():
+    budget = BandwidthBudget(total_bps=100)
+    budget.register("lento", 1)
+    budget.register("rapido", 2)
+    budget.observe("lento", 10)  # bem abaixo dos 50 que recebeu
+    budget.observe("rapido", 50)
+    budget._rebalance()
+    assert budget.share("lento") == pytest.approx(10 * HEADROOM)
+    assert budget.share("rapido") == pytest.approx(100 - 10 * HEADROOM)
+
+def test_unlimited_budget_never_limits():
+    budget = BandwidthBudget()
+    budget.register("a", 1)
+    assert not budget.enabled
+    assert budget.share("a") is None
+
+def test_profile_follows_protocol_and_size(monkeypatch):
+    monkeypatch.setattr(download_profiles, "_profiles", download_profiles.build_profiles(8, 10))
+    monkeypatch.setattr(download_profiles, "_large_mb", 100.0)
+    assert choose_profile(None, 500).name == "default"
+    assert choose_profile("m3u8_native", 5).name == "segmented"
+    # Merge com uma parte segmentada
+    assert choose_profile("https+http_dash_segments", None).name == "segmented"
+    assert choose_profile("https", 100).name == "progressive_large"
+    assert choose_profile("https+https", 99).name == "progressive"
+    assert choose_profile("https", None).name == "progressive"
+    large = choose_profile("https", 500)
+    assert large.opts() == {"concurrent_fragment_downloads": 1, "http_chunk_size": 10 * MB, "buffersize": MB}
+    assert choose_profile("m3u8", 5).opts() == {"concurrent_fragment_downloads": 8}
+    # chunk 0 desliga o http_chunk_size
+    assert "http_chunk_size" not in download_profiles.build_profiles(8, 0)["progressive_large"].opts()
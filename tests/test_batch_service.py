@@ -0,0 +1,103 @@
+from __future__ import annotations
+import asyncio
+import threading
+import types
+
+from bot.handlers import download
+from bot.services.batch_service import Batch
+from bot.services.job_store import MemoryJobStore
+from bot.services.progress_service import ProgressService
+from bot.services.queue_service import DownloadJob
+
+def _batch(job_ids, batch_id: str = "b1") -> Batch:
+    batch = Batch(batch_id, 10, 20, "Playlist", len(job_ids), ProgressService(None, 1.0, 10))
+    for job_id in job_ids:
+        batch.add_item(job_id, f"Vídeo {job_id}")
+    return batch
+
+def test_render_aggregates_running_items():
+    batch = _batch("abc")
+    batch.item_progress("a", 0.5)
+    batch.item_progress("b", 1.5)  # fora de 0..1: limitado
+    assert batch.render() == "Lote: Playlist\n0/3 enviados | baixando 2 (75%)"
+
+def test_record_finishes_batch_and_lists_failures():
+    batch = _batch("abc")
+    batch.item_progress("a", 0.3)
+    assert batch.record("a", "Vídeo A", "done", "") is False
+    assert batch.record("b", "Vídeo B", "failed", "privado") is False
+    assert batch.record("c", None, "cancelled", "") is True
+    assert "baixando" not in batch.render()
+    assert batch.summary() == (
+        "Lote concluído: Playlist\n"
+        "1 enviado(s), 1 falha(s), 1 cancelado(s) de 3.\n"
+        "\n"
+        "- Vídeo B: privado"
+    )
+
+def test_record_counts_each_item_once():
+    # O resultado pode chegar pelo worker local e pelo store
+    batch = _batch("ab")
+    assert batch.record("a", None, "done", "") is False
+    assert batch.record("a", None, "done", "") is False
+    assert batch.record("zz", None, "done", "") is False
+    assert batch.results["done"] == 1
+
+def test_progress_from_threads_while_loop_renders():
+    # item_progress vem das threads do executor; render/record rodam no loop
+    ids = [f"x{i}" for i in range(500)]
+    batch = _batch(ids)
+    errors: list[BaseException] = []
+
+    def hook(prefix: str) -> None:
+        try:
+            for i in range(500):
+                batch.item_progress(f"{prefix}{i}", i / 500)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hook, args=(p,)) for p in "xyz"]
+    for t in threads:
+        t.start()
+    for job_id in ids:
+        batch.render()
+        batch.record(job_id, None, "done", "")
+    for t in threads:
+        t.join()
+    assert errors == []
+
+def test_front_end_closes_batch_from_store_results(monkeypatch):
+    # Fila compartilhada: os itens terminaram em outro processo
+    edits: list[str] = []
+
+    async def edit_message_text(chat_id, message_id, text):
+        edits.append(text)
+
+    bot = types.SimpleNamespace(edit_message_text=edit_message_text)
+    store = MemoryJobStore()
+    jobs = [
+        DownloadJob(user_id=1, chat_id=10, message_id=20, url=f"https://a.example/{i}", format_id="18",
+                    request_id="b1", title=f"Vídeo {i}", batch_id="b1")
+        for i in range(2)
+    ]
+    batch = Batch("b1", 10, 20, "Playlist", len(jobs), ProgressService(None, 1.0, 10))
+    for job in jobs:
+        batch.add_item(job.job_id, job.title)
+        store.add(job)
+    monkeypatch.setitem(download.BATCHES, "b1", batch)
+    store.set_state(jobs[0].job_id, "done", "Enviado.")
+    store.set_state(jobs[1].job_id, "failed", "vídeo privado")
+
+    async def scenario():
+        task = asyncio.create_task(download.batch_sync_loop(bot, store, interval=0.01))
+        for _ in range(100):
+            if "b1" not in download.BATCHES:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert "b1" not in download.BATCHES
+    assert edits == [
+        "Lote concluído: Playlist\n1 enviado(s), 1 falha(s), 0 cancelado(s) de 2.\n\n- Vídeo 1: vídeo privado"
+    ]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import asyncio
+
+from bot.services.file_cache import cache_key
+from bot.services.queue_service import DownloadJob, QueueService, dedup_key
+from bot.services.site_limiter import SiteLimiter
+
+def _job(user_id: int, key: str | None) -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url="https://a.example/v", format_id="18",
+        request_id="r", dedup_key=key,
+    )
+
+def _queue() -> QueueService:
+    return QueueService(4, 4, limiter=SiteLimiter(start=100, cap=100))
+
+def test_dedup_key_uses_extractor_id_when_known():
+    info = {"extractor_key": "Youtube", "id": "abc"}
+    key = dedup_key(cache_key(info, "18"), "https://youtu.be/abc", "18")
+    assert key == "id|youtube|abc|18"
+    # Mesmo vídeo por outra URL: mesma chave
+    assert key == dedup_key(cache_key(info, "18"), "https://www.youtube.com/watch?v=abc", "18")
+
+def test_dedup_key_normalizes_url_without_id():
+    a = dedup_key(None, "HTTPS://Example.com/video/#t=10", "best")
+    b = dedup_key(None, "  https://example.com/video  ", "best")
+    assert a == b == "url|https://example.com/video|best"
+    # Query string e formato fazem parte da chave
+    assert dedup_key(None, "https://example.com/video?x=1", "best") != a
+    assert dedup_key(None, "https://example.com/video", "18") != a
+
+def test_dedup_attach_and_detach():
+    async def scenario():
+        queue = _queue()
+        leader, follower = _job(1, "k"), _job(2, "k")
+        assert await queue.put(leader) is True
+        assert await queue.put(follower) is False
+        assert queue.qsize() == 1
+        assert queue.followers(leader) == [follower]
+        assert queue.followers(follower) == []
+        assert [j.job_id for j in queue.jobs_of(2)] == [follower.job_id]
+
+        assert queue.detach(leader) == [follower]
+        assert queue.followers(leader) == []
+        # Grupo fechado: o próximo pedido igual abre outro download
+        assert await queue.put(_job(3, "k")) is True
+
+    asyncio.run(scenario())
+
+def test_jobs_without_key_are_never_coalesced():
+    async def scenario():
+        queue = _queue()
+        assert await queue.put(_job(1, None)) is True
+        assert await queue.put(_job(2, None)) is True
+        return queue.qsize()
+
+    assert asyncio.run(scenario()) == 2
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+
+from bot.services.disk_service import DiskService
+
+MB = 1024 * 1024
+
+def _disk(tmp_path, quota_mb: int = 10, orphan_max_age: float = 3600) -> DiskService:
+    return DiskService(str(tmp_path), ttl_seconds=60, quota_mb=quota_mb, min_free_mb=0,
+                       sweep_interval=0.05, orphan_max_age=orphan_max_age)
+
+def _job_dir(tmp_path, job_id: str, nbytes: int = 0, age: float = 0):
+    d = tmp_path / "users" / "1" / "temp" / job_id
+    d.mkdir(parents=True)
+    if nbytes:
+        (d / "video.mp4.part").write_bytes(b"\0" * nbytes)
+    if age:
+        old = time.time() - age
+        os.utime(d, (old, old))
+    return d
+
+def test_admission_respects_quota_and_reservations(tmp_path):
+    async def scenario():
+        disk = _disk(tmp_path, quota_mb=10)
+        assert not disk.can_ever_fit(11 * MB)
+        assert await disk.admit("a", tmp_path / "a", 6 * MB, timeout=0)
+        # 6 reservados + 6 passaria da cota
+        assert not await disk.admit("b", tmp_path / "b", 6 * MB, timeout=0)
+        assert await disk.admit("c", tmp_path / "c", 4 * MB, timeout=0)
+        return disk
+
+    disk = asyncio.run(scenario())
+    assert disk.reserved_bytes() == 10 * MB
+
+def test_waiting_job_is_admitted_after_release(tmp_path):
+    async def scenario():
+        disk = _disk(tmp_path, quota_mb=10)
+        assert await disk.admit("a", tmp_path / "a", 8 * MB, timeout=0)
+        waiting = asyncio.create_task(disk.admit("b", tmp_path / "b", 8 * MB, timeout=2))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        await disk.release("a")
+        return await waiting
+
+    assert asyncio.run(scenario())
+
+def test_release_measures_instead_of_adding_reservation(tmp_path):
+    async def scenario():
+        disk = _disk(tmp_path, quota_mb=10)
+        work = _job_dir(tmp_path, "a")
+        assert await disk.admit("a", work, 8 * MB, timeout=0)
+        (work / "video.mp4").write_bytes(b"\0" * (3 * MB))
+        # Varredura durante o download já mede parte do job
+        await disk.sweep()
+        await disk.release("a")
+        return disk
+
+    disk = asyncio.run(scenario())
+    assert disk.used_bytes == 3 * MB
+    assert disk.reserved_bytes() == 0
+
+def test_sweep_removes_expired_and_orphans_but_keeps_busy(tmp_path):
+    async def scenario():
+        disk = _disk(tmp_path, orphan_max_age=60)
+        expired = _job_dir(tmp_path, "expired", MB)
+        orphan = _job_dir(tmp_path, "orphan", MB, age=120)
+        queued = _job_dir(tmp_path, "queued", MB, age=120)
+        running = _job_dir(tmp_path, "running", 2 * MB, age=120)
+        fresh = _job_dir(tmp_path, "fresh", MB)
+
+        async def unfinished():
+            return {queued}
+
+        disk.track_unfinished(unfinished)
+        assert await disk.admit("running", running, MB, timeout=0)
+        disk.mark_done(expired, delay=0)
+        await disk.sweep()
+        return disk, expired, orphan, queued, running, fresh
+
+    disk, expired, orphan, queued, running, fresh = asyncio.run(scenario())
+    assert not expired.exists()
+    assert not orphan.exists()
+    assert queued.exists() and running.exists() and fresh.exists()
+    assert disk.used_bytes == 4 * MB
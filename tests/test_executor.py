@@ -0,0 +1,38 @@
+from __future__ import annotations
+import asyncio
+
+from bot.services import executor
+from bot.services.executor import ThreadBackend, throttle_progress
+
+def test_throttle_passes_status_changes_and_limits_repeats(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(executor.time, "monotonic", lambda: now[0])
+    seen: list[tuple[float, str]] = []
+    cb = throttle_progress(lambda d: seen.append((now[0], d["status"])))
+
+    for t, status in ((0.0, "downloading"), (0.1, "downloading"), (0.2, "finished"),
+                      (0.3, "downloading"), (0.5, "downloading"), (0.9, "downloading")):
+        now[0] = t
+        cb({"status": status})
+    assert seen == [(0.0, "downloading"), (0.2, "finished"), (0.3, "downloading"), (0.9, "downloading")]
+
+def _job(n: int, cancel_check, progress_cb, rate_limit) -> tuple[int, float | None]:
+    for i in range(n):
+        progress_cb({"status": "downloading", "downloaded_bytes": i})
+    progress_cb({"status": "finished"})
+    return n, rate_limit()
+
+def test_thread_backend_runs_job_with_throttled_progress():
+    async def scenario():
+        ex = ThreadBackend(1)
+        seen: list[dict] = []
+        try:
+            result = await ex.run_job(_job, (1000,), lambda: False, seen.append, lambda: 1234.0)
+        finally:
+            ex.shutdown()
+        return result, seen
+
+    result, seen = asyncio.run(scenario())
+    assert result == (1000, 1234.0)
+    # Mil hooks viram o primeiro "downloading" e o "finished"
+    assert [d["status"] for d in seen] == ["downloading", "finished"]
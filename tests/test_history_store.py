@@ -0,0 +1,62 @@
+from __future__ import annotations
+import asyncio
+import json
+
+import pytest
+
+from bot.services.history_store import HistoryStore
+from bot.services.storage_service import StorageService
+
+def _payload(title: str, url: str = "https://a.example/v") -> dict:
+    return {"timestamp": "20260101T000000Z", "original_url": url, "id": "abc", "title": title,
+            "uploader": None, "duration": 60, "selected": {"format_id": "18"}}
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(tmp_path / "history.sqlite3")
+    yield store
+    store.close()
+
+def test_list_is_newest_first_and_per_user(store):
+    store.add_many([(1, _payload("Primeiro"), 10.0), (1, _payload("Segundo"), 20.0), (2, _payload("Outro"), 30.0)])
+    rid = store.add(1, _payload("Terceiro"), 20.0)
+
+    # Mesmo created_at: o id desempata
+    assert [r["title"] for r in store.list(1, 10)] == ["Terceiro", "Segundo", "Primeiro"]
+    assert [r["title"] for r in store.list(1, 1, offset=1)] == ["Segundo"]
+    assert store.count(1) == 3 and store.count(3) == 0
+    record = store.get(1, rid)
+    assert record["selected"] == {"format_id": "18"}
+    assert record["record_id"] == rid
+    # Registro de outro usuário não aparece
+    assert store.get(2, rid) is None
+
+def test_search_matches_title_literally(store):
+    for title in ("Aula 100% prática", "Aula_1", "Aula 1", "Música"):
+        store.add(1, _payload(title))
+    assert store.count(1, "aula") == 3
+    assert [r["title"] for r in store.list(1, 10, query="100%")] == ["Aula 100% prática"]
+    # "_" e "%" não são curinga
+    assert [r["title"] for r in store.list(1, 10, query="a_1")] == ["Aula_1"]
+
+def test_json_records_are_migrated_once(tmp_path, store):
+    links = tmp_path / "users" / "7" / "links"
+    links.mkdir(parents=True)
+    (links / "a.json").write_text(json.dumps(_payload("Antigo")), encoding="utf-8")
+    (links / "b.json").write_text("{quebrado", encoding="utf-8")
+
+    assert store.migrate_json_records(tmp_path / "users") == 1
+    assert store.migrate_json_records(tmp_path / "users") == 0
+    assert [r["title"] for r in store.list(7, 10)] == ["Antigo"]
+
+def test_pending_records_are_visible_before_the_flusher_runs(tmp_path):
+    async def scenario():
+        storage = StorageService(str(tmp_path), flush_interval=3600)
+        storage.save_link_record(1, {"title": "Novo", "id": "x"}, "https://a.example/x", {"format_id": "18"})
+        assert storage.history.count(1) == 0
+        records = await storage.list_link_records(1)
+        storage.history.close()
+        return records
+
+    records = asyncio.run(scenario())
+    assert [(r["title"], r["original_url"]) for r in records] == [("Novo", "https://a.example/x")]
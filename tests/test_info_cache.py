@@ -0,0 +1,121 @@
+from __future__ import annotations
+import asyncio
+import json
+import types
+
+import pytest
+
+from bot.services import info_cache
+from bot.services.info_cache import InfoCache, canonical_url, trim_info
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [1000.0]
+    monkeypatch.setattr(info_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def _fetcher(calls: list[str]):
+    async def fetch(url: str) -> dict:
+        calls.append(url)
+        await asyncio.sleep(0)
+        return {"id": url.rsplit("/", 1)[-1], "title": f"v{len(calls)}", "http_headers": {"x": "y"}}
+
+    return fetch
+
+def test_canonical_url_drops_tracking_and_mobile_host():
+    assert canonical_url("https://youtu.be/abc?si=xyz") == "https://youtube.com/watch?v=abc"
+    assert canonical_url("http://m.youtube.com/watch?v=abc&utm_source=x&feature=share") == (
+        "https://youtube.com/watch?v=abc"
+    )
+    assert canonical_url("https://www.Example.com/v/?b=2&a=1#t") == "https://example.com/v?a=1&b=2"
+
+def test_trim_info_keeps_only_used_fields():
+    info = {
+        "_type": "playlist", "id": "p", "title": "Lista", "thumbnails": [{"url": "x"}],
+        "formats": [{"format_id": "18", "url": "https://assinada", "height": 360}],
+        "entries": [{"url": "https://a/1", "id": "1", "thumbnails": []}, None],
+    }
+    assert trim_info(info) == {
+        "id": "p", "title": "Lista", "_type": "playlist",
+        "formats": [{"format_id": "18", "height": 360}],
+        "entries": [{"url": "https://a/1", "id": "1"}],
+    }
+
+def test_concurrent_misses_share_one_extraction(clock):
+    calls: list[str] = []
+    cache = InfoCache(_fetcher(calls), ttl_seconds=100, max_mb=1)
+
+    async def scenario():
+        first = await asyncio.gather(cache.get("https://a.example/1"), cache.get("https://www.a.example/1?si=z"))
+        return first, await cache.get("https://a.example/1")
+
+    (a, b), again = asyncio.run(scenario())
+    assert calls == ["https://a.example/1"]
+    assert a is b is again
+    assert "http_headers" not in a
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_stale_entry_is_served_while_revalidating(clock):
+    calls: list[str] = []
+    cache = InfoCache(_fetcher(calls), ttl_seconds=100, max_mb=1)
+
+    async def scenario():
+        await cache.get("https://a.example/1")
+        clock[0] += 79
+        assert (await cache.get("https://a.example/1"))["title"] == "v1"
+        assert len(calls) == 1
+        # Depois de 80% do TTL: serve o antigo e revalida em background
+        clock[0] += 2
+        stale = await cache.get("https://a.example/1")
+        await asyncio.sleep(0.01)
+        return stale, await cache.get("https://a.example/1")
+
+    stale, fresh = asyncio.run(scenario())
+    assert stale["title"] == "v1"
+    assert fresh["title"] == "v2"
+    assert len(calls) == 2
+
+def test_expired_entry_is_fetched_again(clock):
+    calls: list[str] = []
+    cache = InfoCache(_fetcher(calls), ttl_seconds=100, max_mb=1)
+
+    async def scenario():
+        await cache.get("https://a.example/1")
+        clock[0] += 100
+        return await cache.get("https://a.example/1")
+
+    assert asyncio.run(scenario())["title"] == "v2"
+    assert cache.misses == 2
+
+def test_lru_evicts_least_recently_used_by_size(clock):
+    cache = InfoCache(_fetcher([]), ttl_seconds=100, max_mb=1)
+    info = {"id": "x", "formats": []}
+    size = len(json.dumps(info))
+    cache.max_bytes = 2 * size
+
+    async def scenario():
+        cache._store("a", info, clock[0])
+        cache._store("b", info, clock[0])
+        # "a" usado por último: "b" é quem sai
+        cache.entries.move_to_end("a")
+        cache._store("c", info, clock[0])
+
+    asyncio.run(scenario())
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.total_bytes == 2 * size
+    # Entrada maior que o cache inteiro nem entra
+    cache._store("grande", {"id": "x" * 3 * size}, clock[0])
+    assert "grande" not in cache.entries
+
+def test_save_and_load_skip_expired(clock, tmp_path):
+    path = tmp_path / "info.json.gz"
+    cache = InfoCache(_fetcher([]), ttl_seconds=100, max_mb=1, persist_path=path)
+    cache._store("velho", {"id": "1"}, clock[0] - 90)
+    cache._store("novo", {"id": "2"}, clock[0])
+    cache.save()
+
+    clock[0] += 20
+    restored = InfoCache(_fetcher([]), ttl_seconds=100, max_mb=1, persist_path=path)
+    restored.load()
+    assert list(restored.entries) == ["novo"]
+    assert restored.entries["novo"].expires_at == pytest.approx(1100.0)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import types
+
+import pytest
+
+from bot.services import pending_store
+from bot.services.pending_store import PendingBatch, PendingStore
+from bot.services.ytdlp_service import FormatOption
+
+INFO = {"id": "abc", "title": "Vídeo", "extractor_key": "Youtube", "channel": "Canal", "duration": 60,
+        "formats": [{"format_id": "18", "url": "https://assinada"}]}
+OPTIONS = [FormatOption("18", "360p mp4", 10.0)]
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [1000.0]
+    monkeypatch.setattr(pending_store, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def test_request_keeps_only_what_download_needs(clock):
+    store = PendingStore(ttl_seconds=60, max_entries=10, max_mb=1)
+    req = store.add("https://youtu.be/abc", INFO, OPTIONS)
+    assert store.get(req.request_id) is req
+    assert req.info() == {
+        "id": "abc", "title": "Vídeo", "extractor_key": "Youtube", "uploader": "Canal", "duration": 60,
+    }
+    assert req.options == OPTIONS
+    assert store.total_bytes == req.size > 0
+
+def test_requests_expire_after_ttl(clock):
+    store = PendingStore(ttl_seconds=60, max_entries=10, max_mb=1)
+    old = store.add("https://a.example/1", INFO, OPTIONS)
+    clock[0] += 30
+    new = store.add_batch("Playlist", [{"url": "https://a.example/2"}])
+    assert isinstance(new, PendingBatch)
+
+    clock[0] += 30
+    assert store.get(old.request_id) is None
+    assert store.get(new.request_id) is new
+    assert store.total_bytes == new.size
+    clock[0] += 30
+    assert store.get(new.request_id) is None
+    assert len(store) == 0 and store.total_bytes == 0
+
+def test_entry_and_byte_caps_drop_oldest(clock):
+    store = PendingStore(ttl_seconds=60, max_entries=2, max_mb=1)
+    reqs = []
+    for i in range(3):
+        reqs.append(store.add(f"https://a.example/{i}", INFO, OPTIONS))
+        clock[0] += 1
+    assert [store.get(r.request_id) for r in reqs] == [None, reqs[1], reqs[2]]
+
+    store = PendingStore(ttl_seconds=60, max_entries=100, max_mb=1)
+    store.max_bytes = 2 * reqs[0].size
+    a = store.add("https://a.example/0", INFO, OPTIONS)
+    clock[0] += 1
+    b = store.add("https://a.example/1", INFO, OPTIONS)
+    clock[0] += 1
+    c = store.add("https://a.example/2", INFO, OPTIONS)
+    assert (store.get(a.request_id), store.get(b.request_id), store.get(c.request_id)) == (None, b, c)
+    assert store.total_bytes <= store.max_bytes
+
+def test_discarded_entries_are_compacted_from_heap(clock):
+    store = PendingStore(ttl_seconds=60, max_entries=1000, max_mb=10)
+    keep = store.add("https://a.example/keep", INFO, OPTIONS)
+    for i in range(200):
+        store.discard(store.add(f"https://a.example/{i}", INFO, OPTIONS).request_id)
+    assert len(store) == 1
+    assert store.total_bytes == keep.size
+    # Sem compactação o heap guardaria as 200 entradas descartadas
+    assert len(store._heap) <= 2 * len(store) + 64 + 1
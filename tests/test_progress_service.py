@@ -0,0 +1,79 @@
+from __future__ import annotations
+import asyncio
+import types
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot.services.progress_service import ProgressService
+
+def _msg(chat_id: int, message_id: int = 1):
+    return types.SimpleNamespace(chat_id=chat_id, message_id=message_id)
+
+def _service(budget: float = 10, **kwargs) -> ProgressService:
+    service = ProgressService(None, interval=1.0, edits_per_second=10, **kwargs)
+    service._budget = budget
+    return service
+
+def _keys(due) -> list[tuple[int, int]]:
+    return [key for key, _, _ in due]
+
+def test_only_changed_text_after_interval_is_due():
+    service = _service()
+    a, b = _msg(1), _msg(2)
+    service.track(lambda: [a], "10%")
+    service.track(lambda: [b], "20%")
+    service.sent[(1, 1)] = ("10%", 0.0)  # texto igual: nada a fazer
+    service.sent[(2, 1)] = ("5%", 100.0)
+    assert _keys(service._due(100.5)) == []
+    assert _keys(service._due(101.0)) == [(2, 1)]
+
+def test_chat_retry_after_and_dead_messages_are_skipped():
+    service = _service()
+    tracker = service.track(lambda: [_msg(1), _msg(2), _msg(3)], "50%")
+    service.chat_ready[1] = 20.0
+    tracker.dead.add((2, 1))
+    assert _keys(service._due(10.0)) == [(3, 1)]
+
+def test_budget_and_one_edit_per_chat_oldest_first():
+    service = _service(budget=2)
+    service.track(lambda: [_msg(1, 1), _msg(1, 2), _msg(2), _msg(3)], "x")
+    service.sent.update({(1, 1): ("a", 5.0), (1, 2): ("a", 1.0), (2, 1): ("a", 3.0), (3, 1): ("a", 4.0)})
+    # Chat 1 uma vez só (a mensagem mais atrasada), depois o chat 2; sem orçamento para o 3
+    assert _keys(service._due(10.0)) == [(1, 2), (2, 1)]
+
+def test_interval_grows_with_number_of_messages():
+    service = _service(budget=100)
+    service.track(lambda: [_msg(i) for i in range(30)], "x")
+    # 30 mensagens a 10 edições/s: cada uma a cada 3 s
+    assert service.current_interval(30) == 3.0
+    service.sent.update({(i, 1): ("a", 10.0) for i in range(30)})
+    assert _keys(service._due(12.9)) == []
+    assert len(service._due(13.0)) == 30
+
+def test_flush_honours_retry_after_and_drops_uneditable_messages():
+    calls: list[int] = []
+
+    async def edit_message_text(chat_id, message_id, text):
+        calls.append(chat_id)
+        if chat_id == 1:
+            raise TelegramRetryAfter(None, "flood", 30)
+        if chat_id == 2:
+            raise TelegramBadRequest(None, "message to edit not found")
+
+    async def scenario():
+        service = ProgressService(types.SimpleNamespace(edit_message_text=edit_message_text), 0.0, 10)
+        service._budget = 10
+        tracker = service.track(lambda: [_msg(1), _msg(2), _msg(3)], "50%")
+        await service.flush()
+        tracker.update("60%")
+        # Simula o intervalo do chat 3 já vencido
+        service.chat_ready.pop(3, None)
+        service.sent[(3, 1)] = (service.sent[(3, 1)][0], 0.0)
+        await service.flush()
+        return service, tracker
+
+    service, tracker = asyncio.run(scenario())
+    assert sorted(calls) == [1, 2, 3, 3]
+    assert tracker.dead == {(2, 1)}
+    assert service.sent[(3, 1)][0] == "60%"
+    assert (1, 1) not in service.sent
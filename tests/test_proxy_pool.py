@@ -0,0 +1,74 @@
+from __future__ import annotations
+import types
+
+import pytest
+
+from bot.services import proxy_pool
+from bot.services.proxy_pool import COOLDOWN_BASE, MAX_STRIKES, ProxyPool, is_proxy_failure, load_proxies
+
+A, B = "http://user:senha@a:8080", "socks5://b:1080"
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [100.0]
+    monkeypatch.setattr(proxy_pool, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_empty_pool_means_direct_connection():
+    pool = ProxyPool([])
+    assert pool.pick() is None
+    pool.report(None, False)
+    with pool.using(None):
+        pass
+
+def test_pick_prefers_fast_idle_healthy_proxy(clock):
+    pool = ProxyPool([A, B, A])
+    assert len(pool) == 2
+    pool.report(A, True, latency=0.2)
+    pool.report(B, True, latency=0.5)
+    assert pool.pick() == A
+    # Jobs em uso multiplicam a nota: com 2 jobs, A (0.2 x 3) perde para B
+    with pool.using(A), pool.using(A):
+        assert pool.pick() == B
+    assert pool.proxies[A].in_use == 0
+    assert pool.pick(exclude=[A]) == B
+    assert pool.pick(exclude=[A, B]) is None
+    # Falha pesa na nota (1 + 4 x taxa de falha): uma ainda não basta, duas sim
+    pool.report(A, False)
+    assert pool.pick() == A
+    pool.report(A, False)
+    assert pool.pick() == B
+
+def test_consecutive_failures_put_proxy_in_cooldown(clock):
+    pool = ProxyPool([A, B])
+    pool.report(B, True, latency=5.0)
+    for _ in range(MAX_STRIKES):
+        pool.report(A, False)
+    stats = pool.proxies[A]
+    assert stats.down_until == clock[0] + COOLDOWN_BASE
+    assert pool.pick() == B
+    # Todos fora: usa o que volta primeiro
+    for _ in range(MAX_STRIKES):
+        pool.report(B, False)
+    assert pool.pick() == A
+
+    # Volta, falha de novo: cooldown dobra
+    clock[0] = stats.down_until
+    for _ in range(MAX_STRIKES):
+        pool.report(A, False)
+    assert stats.down_until == clock[0] + 2 * COOLDOWN_BASE
+    # Um sucesso zera tudo
+    pool.report(A, True)
+    assert (stats.strikes, stats.down_until, stats.cooldowns) == (0, 0.0, 0)
+
+def test_only_network_and_throttle_errors_count_against_proxy():
+    assert is_proxy_failure(Exception("Unable to connect to proxy"))
+    assert is_proxy_failure(Exception("HTTP Error 429: Too Many Requests"))
+    assert is_proxy_failure(TimeoutError("read timed out"))
+    assert not is_proxy_failure(Exception("Video unavailable. This video is private"))
+
+def test_load_proxies_merges_sources_without_duplicates(tmp_path):
+    f = tmp_path / "proxies.txt"
+    f.write_text(f"# lista\n{B}\n\n{A}  # repetido\nhttp://c:3128\n", encoding="utf-8")
+    assert load_proxies(A, f" {B}, ,", str(f)) == [A, B, "http://c:3128"]
+    assert load_proxies(None, "", None) == []
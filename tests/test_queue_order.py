@@ -0,0 +1,76 @@
+from __future__ import annotations
+import asyncio
+import types
+
+import pytest
+
+from bot.services import queue_service
+from bot.services.queue_service import DownloadJob, QueueService
+from bot.services.site_limiter import SiteLimiter
+
+def _job(user_id: int, size: float | None = None) -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url="https://a.example/v", format_id="18",
+        request_id="r", filesize_mb=size,
+    )
+
+def _queue(global_concurrency: int = 4, **kwargs) -> QueueService:
+    return QueueService(global_concurrency, 4, limiter=SiteLimiter(start=100, cap=100), **kwargs)
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [0.0]
+    monkeypatch.setattr(queue_service, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_smallest_job_first_unknown_size_last():
+    async def scenario():
+        queue = _queue(unknown_mb=50)
+        big, small, unknown = _job(1, size=40), _job(2, size=2), _job(3)
+        for job in (big, unknown, small):
+            await queue.put(job)
+        return [(await queue.get()).job_id for _ in range(3)], [small.job_id, big.job_id, unknown.job_id]
+
+    got, expected = asyncio.run(scenario())
+    assert got == expected
+
+def test_aging_lets_old_big_job_pass(clock):
+    async def scenario():
+        queue = _queue(aging_mb_per_minute=10)
+        big = _job(1, size=40)
+        await queue.put(big)
+        # 10 min depois o grande já "perdeu" 100 MB de prioridade
+        clock[0] = 600.0
+        await queue.put(_job(2, size=2))
+        return (await queue.get()).job_id, big.job_id
+
+    got, expected = asyncio.run(scenario())
+    assert got == expected
+
+def test_positions_estimate_wait_from_observed_speed(clock):
+    async def scenario():
+        queue = _queue(2, aging_mb_per_minute=0)
+        first = _job(1, size=10)
+        await queue.put(first)
+        await queue.get()
+        # Sem nenhum job concluído ainda não há estimativa
+        waiting = _job(2, size=3)
+        await queue.put(waiting)
+        assert [(j.job_id, pos, eta) for j, pos, eta in queue.positions()] == [(waiting.job_id, 1, None)]
+
+        clock[0] = 20.0
+        await queue.task_done(first)  # 20 s / 10 MB = 2 s/MB
+        assert queue.seconds_per_mb == pytest.approx(2.0)
+        assert (await queue.get()).job_id == waiting.job_id
+
+        clock[0] = 24.0
+        big, tiny = _job(4, size=5), _job(5, size=0.5)
+        await queue.put(big)
+        await queue.put(tiny)
+        return queue.positions(), (big, tiny)
+
+    positions, (big, tiny) = asyncio.run(scenario())
+    # Em execução: 6 s previstos, 4 s decorridos -> 2 s à frente, em 2 workers.
+    # O job minúsculo conta como MIN_JOB_MB (2 s) para quem vem depois.
+    assert [(j.job_id, pos) for j, pos, _ in positions] == [(tiny.job_id, 1), (big.job_id, 2)]
+    assert [eta for _, _, eta in positions] == [pytest.approx(1.0), pytest.approx(2.0)]
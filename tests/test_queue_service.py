@@ -0,0 +1,54 @@
+from __future__ import annotations
+import asyncio
+
+from bot.services.job_store import MemoryJobStore, SqliteJobStore
+from bot.services.queue_service import DownloadJob, QueueService
+from bot.services.site_limiter import SiteLimiter
+
+def _job(user_id: int) -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url="https://a.example/v", format_id="18", request_id="r",
+    )
+
+def _queue(store=None) -> QueueService:
+    # Limite de site alto: os testes da fila não dependem dele
+    return QueueService(4, 4, store, limiter=SiteLimiter(start=100, cap=100))
+
+def _states(store: SqliteJobStore) -> dict[str, str]:
+    return dict(store._select("SELECT job_id, state FROM jobs", ()))
+
+def test_restore_requeues_queued_and_running_jobs(tmp_path):
+    async def scenario():
+        store = SqliteJobStore(tmp_path / "jobs.sqlite3")
+        queue = _queue(store)
+        queued, running, done = _job(1), _job(2), _job(3)
+        for job in (queued, running, done):
+            await queue.put(job)
+        assert (await queue.get()).job_id == queued.job_id
+        assert (await queue.get()).job_id == running.job_id
+        queue.set_state(queued, "queued")
+        queue.set_state(done, "done")
+        store.close()
+
+        # "Restart": novo store no mesmo arquivo
+        store = SqliteJobStore(tmp_path / "jobs.sqlite3")
+        queue = _queue(store)
+        restored = await queue.restore()
+        store.flush()
+        return store, queue, restored, (queued, running, done)
+
+    store, queue, restored, (queued, running, done) = asyncio.run(scenario())
+    assert {j.job_id for j in restored} == {queued.job_id, running.job_id}
+    assert queue.qsize() == 2
+    states = _states(store)
+    assert states[queued.job_id] == states[running.job_id] == "queued"
+    assert states[done.job_id] == "done"
+    store.close()
+
+def test_memory_store_tracks_unfinished():
+    store = MemoryJobStore()
+    a, b = _job(1), _job(1)
+    store.add(a)
+    store.add(b)
+    store.set_state(b.job_id, "failed")
+    assert store.load_unfinished() == [a]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # scripts Lua no fakeredis
+
+from bot.services.queue_service import DownloadJob
+from bot.services.redis_job_store import PREFIX, RedisJobStore
+
+def _job(user_id: int) -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url="https://a.example/v", format_id="18", request_id="r",
+    )
+
+@pytest.fixture
+def store(monkeypatch) -> RedisJobStore:
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        "redis.asyncio.from_url", lambda url, **kw: fakeredis.aioredis.FakeRedis(server=server)
+    )
+    return RedisJobStore("redis://fake")
+
+def _ids(members) -> set[str]:
+    return {m.decode() if isinstance(m, bytes) else m for m in members}
+
+def test_claim_moves_jobs_from_queue_to_leases(store):
+    async def scenario():
+        a, b = _job(1), _job(2)
+        store.add(a)
+        store.add(b)
+        await store._flush()
+        claimed = await store.claim("w1", 1, 60)
+        queue = _ids(await store.redis.zrange(store._queue_key, 0, -1))
+        leases = _ids(await store.redis.zrange(store._leases_key, 0, -1))
+        state = await store.redis.hget(PREFIX + "job:" + a.job_id, "state")
+        return claimed, queue, leases, state, (a, b)
+
+    claimed, queue, leases, state, (a, b) = asyncio.run(scenario())
+    assert [j.job_id for j in claimed] == [a.job_id]
+    assert queue == {b.job_id}
+    assert leases == {a.job_id}
+    assert state == b"running"
+
+def test_expired_lease_goes_back_to_queue(store):
+    async def scenario():
+        job = _job(1)
+        store.add(job)
+        await store._flush()
+        # Lease já vencido: o worker "morreu" logo depois de reivindicar
+        assert len(await store.claim("w1", 1, -1)) == 1
+        again = await store.claim("w2", 1, 60)
+        owner = await store.redis.hget(PREFIX + "job:" + job.job_id, "owner")
+        return job, again, owner
+
+    job, again, owner = asyncio.run(scenario())
+    assert [j.job_id for j in again] == [job.job_id]
+    assert owner == b"w2"
+
+def test_renew_only_extends_existing_leases(store):
+    async def scenario():
+        job, finished = _job(1), _job(1)
+        store.add(job)
+        await store._flush()
+        await store.claim("w1", 1, 1)
+        await store.renew("w1", [job.job_id, finished.job_id], 60)
+        score = await store.redis.zscore(store._leases_key, job.job_id)
+        leases = _ids(await store.redis.zrange(store._leases_key, 0, -1))
+        # Lease renovado: outro worker não reivindica
+        return score, leases, await store.claim("w2", 1, 60), (job, finished)
+
+    score, leases, stolen, (job, finished) = asyncio.run(scenario())
+    assert leases == {job.job_id}
+    assert finished.job_id not in leases
+    assert score is not None
+    assert stolen == []
+
+def test_finished_job_leaves_every_index(store):
+    async def scenario():
+        running, queued = _job(7), _job(7)
+        store.add(running)
+        store.add(queued)
+        await store._flush()
+        await store.claim("w1", 1, 60)
+        store.set_state(running.job_id, "done")
+        store.set_state(queued.job_id, "cancelled")
+        await store._flush()
+        key = PREFIX + "job:" + running.job_id
+        return (
+            _ids(await store.redis.zrange(store._queue_key, 0, -1)),
+            _ids(await store.redis.zrange(store._leases_key, 0, -1)),
+            _ids(await store.redis.smembers(f"{PREFIX}user:7")),
+            await store.redis.hget(key, "state"),
+            await store.redis.ttl(key),
+            await store.unfinished_of(7),
+        )
+
+    queue, leases, user_jobs, state, ttl, unfinished = asyncio.run(scenario())
+    assert queue == leases == user_jobs == set()
+    assert state == b"done"
+    assert ttl > 0
+    assert unfinished == []
+
+def test_cancel_request_is_visible_to_other_workers(store):
+    async def scenario():
+        a, b = _job(1), _job(1)
+        store.add(a)
+        store.add(b)
+        await store._flush()
+        await store.request_cancel([a.job_id])
+        return await store.cancelled([a.job_id, b.job_id]), await store.unfinished_of(1), (a, b)
+
+    cancelled, unfinished, (a, b) = asyncio.run(scenario())
+    assert cancelled == {a.job_id}
+    assert {j.job_id for j in unfinished} == {a.job_id, b.job_id}
+
+def test_batch_item_result_is_readable_by_front_end(store):
+    async def scenario():
+        done, failed, running = _job(1), _job(1), _job(1)
+        for job in (done, failed, running):
+            store.add(job)
+        await store._flush()
+        store.set_state(done.job_id, "done", "Enviado.")
+        store.set_state(failed.job_id, "failed", "vídeo privado")
+        await store._flush()
+        return await store.results([done.job_id, failed.job_id, running.job_id, "sumiu"]), (done, failed)
+
+    results, (done, failed) = asyncio.run(scenario())
+    assert results == {done.job_id: ("done", "Enviado."), failed.job_id: ("failed", "vídeo privado")}
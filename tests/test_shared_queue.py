@@ -0,0 +1,84 @@
+from __future__ import annotations
+import asyncio
+
+from bot.services.job_store import SqliteJobStore
+from bot.services.queue_service import DownloadJob, QueueService
+from bot.services.site_limiter import SiteLimiter
+
+def _job(user_id: int, key: str | None = None) -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url="https://a.example/v", format_id="18",
+        request_id="r", dedup_key=key,
+    )
+
+def _queue(store=None) -> QueueService:
+    return QueueService(4, 4, store, limiter=SiteLimiter(start=100, cap=100))
+
+def test_expired_lease_does_not_duplicate_followers(tmp_path):
+    async def scenario():
+        store = SqliteJobStore(tmp_path / "jobs.sqlite3")
+        front = QueueService(1, 1, store, frontend_only=True)
+        leader, follower = _job(1, "k"), _job(2, "k")
+        await front.put(leader)
+        await front.put(follower)
+        store.flush()
+
+        worker = _queue(store)
+        for job in await store.claim("w1", 2, 0.2):
+            await worker.put(job, persist=False)
+        # Jobs reivindicados vêm do payload: objetos novos, mesmos ids
+        running = await worker.get()
+        assert running.job_id == leader.job_id
+        assert [j.job_id for j in worker.followers(running)] == [follower.job_id]
+        # O anexado também é do worker: lease renovado e cancelamento visível
+        assert follower.job_id in worker.held_ids()
+
+        await asyncio.sleep(0.3)
+        for job in await store.claim("w1", 2, 0.2):
+            assert await worker.put(job, persist=False) is False
+        assert [j.job_id for j in worker.followers(running)] == [follower.job_id]
+
+        await store.renew("w1", worker.held_ids(), 60)
+        await asyncio.sleep(0.3)
+        assert await store.claim("w2", 2, 60) == []
+
+        await store.request_cancel([follower.job_id])
+        assert await store.cancelled(worker.held_ids()) == {follower.job_id}
+        store.close()
+
+    asyncio.run(scenario())
+
+def test_claim_is_exclusive_between_workers(tmp_path):
+    async def scenario():
+        store = SqliteJobStore(tmp_path / "jobs.sqlite3")
+        jobs = [_job(i) for i in range(3)]
+        for job in jobs:
+            store.add(job)
+        store.flush()
+        first = await store.claim("w1", 2, 60)
+        second = await store.claim("w2", 2, 60)
+        store.close()
+        return first, second, jobs
+
+    first, second, jobs = asyncio.run(scenario())
+    assert [j.job_id for j in first] == [j.job_id for j in jobs[:2]]
+    assert [j.job_id for j in second] == [jobs[2].job_id]
+
+def test_batch_item_results_cross_stores(tmp_path):
+    # Worker grava o resultado; o front-end (outro processo) lê do mesmo arquivo
+    async def scenario():
+        path = tmp_path / "jobs.sqlite3"
+        worker, front = SqliteJobStore(path), SqliteJobStore(path)
+        done, failed, queued = _job(1), _job(1), _job(1)
+        for job in (done, failed, queued):
+            worker.add(job)
+        worker.set_state(done.job_id, "done", "Enviado.")
+        worker.set_state(failed.job_id, "failed", "vídeo privado")
+        worker.flush()
+        results = await front.results([done.job_id, failed.job_id, queued.job_id])
+        worker.close()
+        front.close()
+        return results, (done, failed)
+
+    results, (done, failed) = asyncio.run(scenario())
+    assert results == {done.job_id: ("done", "Enviado."), failed.job_id: ("failed", "vídeo privado")}
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from bot.services.job_store import SqliteJobStore
+from bot.services.queue_service import DownloadJob, QueueService
+from bot.services.site_limiter import ERROR, OK, THROTTLED, SiteLimiter, classify
+
+def _job(user_id: int, site: str = "a") -> DownloadJob:
+    return DownloadJob(
+        user_id=user_id, chat_id=user_id, message_id=1, url=f"https://{site}.example/v", format_id="18",
+        request_id="r",
+    )
+
+def test_classify_separates_throttle_from_transient_errors():
+    assert classify(Exception("ERROR: HTTP Error 429: Too Many Requests")) == THROTTLED
+    assert classify(Exception("Sign in to confirm you're not a bot")) == THROTTLED
+    assert classify(TimeoutError("The read operation timed out")) == ERROR
+    assert classify(Exception("HTTP Error 503: Service Unavailable")) == ERROR
+    # Erro do próprio vídeo não mexe no limite do site
+    assert classify(Exception("Private video")) is None
+
+def test_site_uses_extractor_and_remembers_host():
+    limiter = SiteLimiter()
+    assert limiter.site("https://www.youtube.com/watch?v=x", "Youtube") == "youtube"
+    # Falha de extração só tem a URL: cai no extractor já visto para o host
+    assert limiter.site("https://m.youtube.com/watch?v=y") == "youtube"
+    assert limiter.site("https://Example.com/v.mp4", "generic") == "example.com"
+    assert limiter.site("nada") == "?"
+
+def test_site_limiter_aimd_and_backoff():
+    limiter = SiteLimiter(start=2, cap=4)
+    limiter.record("s", OK)
+    assert limiter.sites["s"].limit == pytest.approx(2.5)
+
+    limiter.record("s", THROTTLED)
+    assert limiter.sites["s"].limit == pytest.approx(1.25)
+    assert limiter.backoff_remaining("s") > 0
+    assert not limiter.can_start("s")
+
+    # Falhas em sequência contam uma vez só (DECREASE_GUARD)
+    limiter.record("s", ERROR)
+    assert limiter.sites["s"].limit == pytest.approx(1.25)
+
+def test_site_limiter_caps_running_jobs():
+    limiter = SiteLimiter(start=1, cap=4, caps={"S": 1})
+    assert limiter.can_start("s")
+    limiter.started("s")
+    assert not limiter.can_start("s")
+    limiter.finished("s")
+    limiter.sites["s"].tokens = 1
+    assert limiter.can_start("s")
+    # Teto por site: sucesso não passa de 1
+    limiter.record("s", OK)
+    assert limiter.sites["s"].limit == 1
+
+def test_queue_skips_site_in_backoff():
+    async def scenario():
+        limiter = SiteLimiter(start=4, cap=4)
+        queue = QueueService(4, 4, limiter=limiter)
+        blocked, free = _job(1, "lento"), _job(2, "livre")
+        await queue.put(blocked)
+        await queue.put(free)
+        limiter.record(queue.site(blocked), THROTTLED)
+        return (await asyncio.wait_for(queue.get(), 1)).job_id, free.job_id
+
+    got, expected = asyncio.run(scenario())
+    assert got == expected
+
+def test_requeue_gives_up_after_max_retries():
+    async def scenario():
+        queue = QueueService(1, 1, limiter=SiteLimiter(start=100, cap=100), max_retries=1)
+        await queue.put(_job(1))
+        job = await queue.get()
+        await queue.task_done(job)
+        assert await queue.requeue(job)
+        assert (await queue.get()).job_id == job.job_id
+        await queue.task_done(job)
+        return await queue.requeue(job)
+
+    assert asyncio.run(scenario()) is False
+
+def test_requeued_job_is_not_claimed_by_another_worker(tmp_path):
+    async def scenario():
+        path = tmp_path / "jobs.sqlite3"
+        store1, store2 = SqliteJobStore(path), SqliteJobStore(path)
+        store1.add(_job(1))
+        store1.flush()
+
+        worker = QueueService(4, 4, store1, limiter=SiteLimiter(start=100, cap=100))
+        for job in await store1.claim("w1", 1, 60):
+            await worker.put(job, persist=False)
+        job = await worker.get()
+        # Throttle: volta para a fila local deste worker
+        worker.set_state(job, "running")
+        await worker.task_done(job)
+        assert await worker.requeue(job)
+        store1.flush()
+
+        stolen = await store2.claim("w2", 1, 60)
+        store1.close()
+        store2.close()
+        return job, stolen, worker.held_ids()
+
+    job, stolen, held = asyncio.run(scenario())
+    assert stolen == []
+    assert held == [job.job_id]
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import asyncio
+import types
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+
+from bot.services import split_service, telegram_uploader
+from bot.services.split_service import MB, SplitError, split_media
+
+# ---- split ----
+
+def test_small_file_is_not_split(tmp_path):
+    src = tmp_path / "v.mp4"
+    src.write_bytes(b"\0" * MB)
+    assert asyncio.run(split_media(src, 2, tmp_path / "parts")) == [src]
+
+def test_file_without_duration_is_split_by_bytes(tmp_path, monkeypatch):
+    async def no_duration(_path):
+        return None
+
+    monkeypatch.setattr(split_service, "probe_duration", no_duration)
+    data = bytes(range(256)) * (5 * MB // 256)
+    src = tmp_path / "v.bin"
+    src.write_bytes(data)
+
+    parts = asyncio.run(split_media(src, 2, tmp_path / "parts"))
+    assert len(parts) == 3
+    assert all(p.stat().st_size <= 2 * MB for p in parts)
+    # Juntando as partes (cat) volta o arquivo original
+    assert b"".join(p.read_bytes() for p in parts) == data
+
+def _fake_ffmpeg(monkeypatch, sizes_by_attempt: list[list[int]], calls: list[float]):
+    async def duration(_path):
+        return 100.0
+
+    async def segment(path, out_dir, segment_time):
+        calls.append(segment_time)
+        sizes = sizes_by_attempt[len(calls) - 1]
+        parts = []
+        for i, size in enumerate(sizes):
+            p = out_dir / f"seg{i:03d}{path.suffix}"
+            p.write_bytes(b"\0" * size)
+            parts.append(p)
+        return parts
+
+    monkeypatch.setattr(split_service, "probe_duration", duration)
+    monkeypatch.setattr(split_service, "_segment", segment)
+
+def test_media_split_shrinks_segments_until_parts_fit(tmp_path, monkeypatch):
+    calls: list[float] = []
+    # 1ª tentativa: keyframe deixa uma parte com 3 MB (limite 2 MB)
+    _fake_ffmpeg(monkeypatch, [[3 * MB, MB], [MB, MB, MB]], calls)
+    src = tmp_path / "Meu vídeo.mp4"
+    src.write_bytes(b"\0" * (4 * MB))
+
+    parts = asyncio.run(split_media(src, 2, tmp_path / "parts"))
+    # Alvo inicial: duração x (limite / tamanho) x 0.9
+    assert calls[0] == pytest.approx(100 * 0.5 * 0.9)
+    assert calls[1] == pytest.approx(calls[0] * 0.7 * (2 / 3))
+    assert [p.name for p in parts] == [f"Meu vídeo.part0{i}.mp4" for i in (1, 2, 3)]
+
+def test_media_split_gives_up_after_attempts(tmp_path, monkeypatch):
+    _fake_ffmpeg(monkeypatch, [[3 * MB]] * 4, [])
+    src = tmp_path / "v.mp4"
+    src.write_bytes(b"\0" * (4 * MB))
+    with pytest.raises(SplitError):
+        asyncio.run(split_media(src, 2, tmp_path / "parts"))
+
+# ---- upload das partes ----
+
+def _bot():
+    return types.SimpleNamespace(session=types.SimpleNamespace(api=types.SimpleNamespace(is_local=True)))
+
+def _patch_send(monkeypatch, outcomes: list):
+    sleeps: list[float] = []
+
+    async def send(*_args):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(telegram_uploader, "_send", send)
+    monkeypatch.setattr(telegram_uploader.asyncio, "sleep", sleep)
+    return sleeps
+
+def test_retry_after_does_not_use_up_attempts(tmp_path, monkeypatch):
+    flood = [TelegramRetryAfter(None, "flood", 3) for _ in range(4)]
+    sleeps = _patch_send(monkeypatch, [*flood, "file-id"])
+    file_id = asyncio.run(
+        telegram_uploader._send_part_with_retry(_bot(), 1, "video", tmp_path / "p.mp4", "c", retries=1)
+    )
+    assert file_id == "file-id"
+    assert sleeps == [3, 3, 3, 3]
+
+def test_last_real_error_is_raised(tmp_path, monkeypatch):
+    first, last = TelegramNetworkError(None, "reset"), TelegramNetworkError(None, "timeout")
+    _patch_send(monkeypatch, [first, TelegramRetryAfter(None, "flood", 1), last])
+    with pytest.raises(TelegramNetworkError) as info:
+        asyncio.run(
+            telegram_uploader._send_part_with_retry(_bot(), 1, "video", tmp_path / "p.mp4", "c", retries=2)
+        )
+    assert info.value is last
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from bot.services import transcode_service
+from bot.services.split_service import MB
+from bot.services.transcode_service import MAX_AUDIO_KBPS, _bitrates, _encode_args, shrink
+
+def test_bitrates_fill_limit_with_margin():
+    video, audio = _bitrates(10 * MB, 100, True, 1.0)
+    # 10 MB em 100 s = ~839 kbps, x0.94 de folga; áudio fica com ~10%
+    assert audio == 78
+    assert video + audio == pytest.approx(10 * MB * 8 / 1000 / 100 * 0.94, abs=1)
+    # Arquivo longo: áudio no mínimo; curto: no máximo
+    assert _bitrates(10 * MB, 3600, True, 1.0)[1] == 32
+    assert _bitrates(100 * MB, 60, True, 1.0)[1] == MAX_AUDIO_KBPS
+    # Só áudio: todo o orçamento vai para ele, até 2x o teto
+    assert _bitrates(10 * MB, 3600, False, 1.0) == (0, 21)
+    assert _bitrates(10 * MB, 60, False, 1.0) == (0, 2 * MAX_AUDIO_KBPS)
+    assert _bitrates(10 * MB, 100, True, 0.5) == (355, 39)
+
+def _scale(args: list[str]) -> str | None:
+    return args[args.index("-vf") + 1] if "-vf" in args else None
+
+def test_encode_args_scale_down_only_when_bitrate_is_low(tmp_path):
+    src, dst = tmp_path / "a.webm", tmp_path / "a.mp4"
+    assert _scale(_encode_args(src, dst, 300, 64, 1080)) == "scale=-2:'min(ih,360)'"
+    assert _scale(_encode_args(src, dst, 1000, 64, 1080)) == "scale=-2:'min(ih,720)'"
+    # Já é menor que a altura do degrau: não mexe
+    assert _scale(_encode_args(src, dst, 300, 64, 240)) is None
+    assert _scale(_encode_args(src, dst, 2000, 64, None)) is None
+    assert _encode_args(src, dst, 0, 96, None) == ["-i", str(src), "-vn", "-c:a", "aac", "-b:a", "96k", str(dst)]
+
+class _FakePool:
+    def __init__(self, sizes: list[int]):
+        self.sizes = sizes
+        self.calls: list[list[str]] = []
+        self.waiting = 0
+
+    def busy(self) -> bool:
+        return False
+
+    async def run(self, args, duration, cancel_check, progress):
+        self.calls.append(args)
+        progress(1.0)
+        with open(args[-1], "wb") as fh:
+            fh.truncate(self.sizes.pop(0))
+
+def _patch(monkeypatch, probe: dict, sizes: list[int]) -> _FakePool:
+    pool = _FakePool(sizes)
+
+    async def fake_probe(_path):
+        return probe
+
+    monkeypatch.setattr(transcode_service, "_probe", fake_probe)
+    monkeypatch.setattr(transcode_service, "_get_pool", lambda: pool)
+    return pool
+
+VIDEO = {"format": {"duration": "100"}, "streams": [{"codec_type": "video", "codec_name": "vp9", "height": 1080},
+                                                   {"codec_type": "audio", "codec_name": "opus"}]}
+
+def _src(tmp_path, size: int):
+    src = tmp_path / "v.webm"
+    with open(src, "wb") as fh:
+        fh.truncate(size)
+    return src
+
+def _shrink(src, out_dir):
+    return asyncio.run(shrink(src, 10, out_dir, lambda: False, lambda s: None))
+
+def test_shrink_retries_encode_with_reduced_bitrate(tmp_path, monkeypatch):
+    pool = _patch(monkeypatch, VIDEO, [12 * MB, 11 * MB, 9 * MB])
+    out = _shrink(_src(tmp_path, 15 * MB), tmp_path / "out")
+    assert out == tmp_path / "out" / "v.mp4"
+    assert "copy" in pool.calls[0]
+    first, second = (int(c[c.index("-b:v") + 1][:-1]) for c in pool.calls[1:])
+    assert first == _bitrates(10 * MB, 100, True, 1.0)[0]
+    # 2ª tentativa: bitrate reduzido na proporção do excesso (11 MB para 10 MB)
+    assert second == _bitrates(10 * MB, 100, True, 0.95 * 10 / 11)[0]
+
+def test_shrink_stops_when_remux_is_enough(tmp_path, monkeypatch):
+    pool = _patch(monkeypatch, VIDEO, [9 * MB])
+    assert _shrink(_src(tmp_path, 11 * MB), tmp_path / "out") == tmp_path / "out" / "v.mp4"
+    assert len(pool.calls) == 1
+
+def test_shrink_gives_up_without_duration_or_when_too_long(tmp_path, monkeypatch):
+    small = _src(tmp_path, 5 * MB)
+    assert _shrink(small, tmp_path / "out") == small
+    _patch(monkeypatch, {}, [])
+    assert _shrink(_src(tmp_path, 15 * MB), tmp_path / "out") is None
+    # 3 h de vídeo em 10 MB: bitrate abaixo de MIN_VIDEO_KBPS, melhor dividir
+    long_video = {**VIDEO, "format": {"duration": "10800"}}
+    pool = _patch(monkeypatch, long_video, [12 * MB])
+    assert _shrink(_src(tmp_path, 15 * MB), tmp_path / "out") is None
+    assert len(pool.calls) == 1
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import pytest
+
+from bot.services.ytdlp_service import _best_fit, _estimate_mb, build_options
+
+MB = 1024 * 1024
+
+def _video(fid: str, height: int, mb: float | None = None, **kw) -> dict:
+    return {"format_id": fid, "ext": "mp4", "vcodec": "avc1", "acodec": "none", "height": height,
+            "protocol": "https", "container": "mp4_dash", "filesize": mb and mb * MB, **kw}
+
+def _audio(fid: str, abr: int, mb: float, ext: str = "m4a") -> dict:
+    return {"format_id": fid, "ext": ext, "vcodec": "none", "acodec": "mp4a", "abr": abr,
+            "protocol": "https", "filesize": mb * MB}
+
+FORMATS = [
+    _video("137", 1080, 80),
+    _video("136", 720, 30),
+    _video("135", 480, 15),
+    _audio("140", 128, 5),
+    _audio("251", 160, 6, ext="webm"),
+    {"format_id": "18", "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a", "height": 360,
+     "protocol": "https", "filesize": 10 * MB},
+]
+
+def test_estimate_uses_filesize_then_bitrate():
+    assert _estimate_mb({"filesize": 2 * MB, "tbr": 9999}, 60) == (2.0, False)
+    assert _estimate_mb({"filesize_approx": MB}, None) == (1.0, False)
+    # 1000 kbps x 80 s = 10 MB decimais
+    mb, estimated = _estimate_mb({"tbr": 1000}, 80)
+    assert estimated and mb == pytest.approx(10_000_000 / MB)
+    assert _estimate_mb({"vbr": 800, "abr": 200}, 80)[0] == pytest.approx(mb)
+    assert _estimate_mb({"tbr": 1000}, None) == (None, False)
+    assert _estimate_mb({}, 80) == (None, False)
+
+def test_best_fit_pairs_best_video_with_audio_that_fits():
+    video, audio = _best_fit(FORMATS, 100, max_upload_mb=40)
+    # 1080p não cabe; 720p cabe com o melhor áudio (160 kbps) em 36 MB
+    assert video.format_id == "136+251"
+    assert video.filesize_mb == pytest.approx(36)
+    assert video.protocol == "https+https"
+    assert video.label == "⭐ Melhor que cabe: 720p mkv — 36.0MB"
+    assert audio.format_id == "251"
+
+def test_best_fit_drops_audio_to_fit_budget():
+    # Orçamento 35.9 MB (97% de 37): só o áudio menor cabe junto com o 720p
+    video, _ = _best_fit(FORMATS, 100, max_upload_mb=37)
+    assert video.format_id == "136+140"
+    assert video.label.endswith("720p mp4 — 35.0MB")
+
+def test_best_fit_estimates_from_bitrate_and_prefers_muxed_when_only_it_fits():
+    formats = [_video("v", 1080, None, tbr=8000), *FORMATS[3:]]
+    video, _ = _best_fit(formats, 600, max_upload_mb=20)
+    assert video.format_id == "18"
+    video, _ = _best_fit(formats, 60, max_upload_mb=100)
+    # 8000 kbps x 60 s ~ 57 MB estimados: o rótulo avisa com "~"
+    assert video.format_id == "v+251"
+    assert "~" in video.label
+
+def test_build_options_puts_best_fit_first_then_smallest_that_fit():
+    options = build_options({"duration": 100, "formats": FORMATS}, 40)
+    assert [o.format_id for o in options] == ["136+251", "251", "140", "18", "135", "136", "137"]
+    by_id = {o.format_id: o for o in options}
+    assert by_id["137"].label == "🎥 1080p mp4 — 80.0MB [GRANDE]"
+    assert by_id["140"].label == "🎵 128kbps m4a — 5.0MB [OK]"
+    # Só arquivo único HTTP fora de DASH vai em pipeline
+    assert by_id["18"].streamable and not by_id["135"].streamable
+
+def test_build_options_without_sizes():
+    options = build_options({"formats": [{"format_id": "x", "ext": "mp4"}]}, 50)
+    assert [(o.format_id, o.label, o.filesize_mb) for o in options] == [("x", "📦 mp4 — ? [GRANDE]", None)]